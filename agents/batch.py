@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import numpy as np
+
+from agents.rate_limit import AdaptiveLimiter, current_llm_limiter
+from agents.state import make_initial_state
+from agents.workflow import build_query_graph
+
+
+async def _answer_one(graph, index: int, question: str, timeout_s: float) -> dict:
+    """Drives one question through the async graph, timing every node."""
+    start = time.perf_counter()
+    last = start
+    node_ms = {}
+    final_state = {}
+    initial_state = make_initial_state(question)
+
+    async def drive():
+        nonlocal last
+        async for step in graph.astream(initial_state):
+            for node_name, update in step.items():
+                now = time.perf_counter()
+                # Time since the previous step finished (parallel branches share a step)
+                node_ms[node_name] = round((now - last) * 1000, 1)
+                last = now
+                if update:
+                    final_state.update(update)
+
+    error = None
+    try:
+        if timeout_s:
+            await asyncio.wait_for(drive(), timeout_s)
+        else:
+            await drive()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"[Batch] Question {index} failed: {error}")
+
+    return {"index": index, **answer_record(initial_state, final_state, error, start, node_ms)}
+
+
+def answer_record(initial_state: dict, final_state: dict, error, start: float, node_ms: dict) -> dict:
+    """The answer to one question as returned by answer_many and the HTTP service."""
+    return {
+        "trace_id": initial_state["trace_id"],  # per-node spans: agents.tracing.get_tracer().spans_for(...)
+        "question": initial_state["user_question"],
+        "workspace_name": final_state.get("workspace_name", ""),
+        "sql_query": final_state.get("sql_query", ""),
+        "db_result": final_state.get("db_result", ""),
+        "final_answer": final_state.get("final_answer", ""),
+        "cache_status": final_state.get("cache_status", ""),
+        "error": error,
+        "elapsed_s": round(time.perf_counter() - start, 3),
+        "node_ms": node_ms,
+    }
+
+
+async def aanswer_many(questions, concurrency: int = 8, mode: str = None, llm_concurrency: int = None,
+                       max_retries: int = 4, timeout_s: float = None, graph=None) -> list:
+    """Answers many questions concurrently; results come back in input order.
+
+    At most `concurrency` questions are in flight. LLM calls additionally share an
+    AdaptiveLimiter (`llm_concurrency`, default `concurrency`) that halves its limit on
+    429s and retries transient failures with backoff. DuckDB work runs on the DB thread pool.
+    """
+    graph = graph or build_query_graph(mode, use_async=True)
+    limiter = AdaptiveLimiter(llm_concurrency or concurrency, max_retries=max_retries)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(index, question):
+        async with semaphore:
+            return await _answer_one(graph, index, question, timeout_s)
+
+    token = current_llm_limiter.set(limiter)
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i, q) for i, q in enumerate(questions)))
+        elapsed = time.perf_counter() - start
+    finally:
+        current_llm_limiter.reset(token)
+
+    print(f"[Batch] {len(results)} questions in {elapsed:.2f}s "
+          f"({len(results) / elapsed if elapsed else 0:.1f} q/s), LLM limiter: {limiter.stats}")
+    return results
+
+
+def answer_many(questions, concurrency: int = 8, **kwargs) -> list:
+    """Synchronous entry point for aanswer_many (e.g. nightly report or evaluation scripts)."""
+    return asyncio.run(aanswer_many(questions, concurrency=concurrency, **kwargs))
+
+
+def summarize(results: list) -> dict:
+    """Latency percentiles and error count of an answer_many run."""
+    latencies = [r["elapsed_s"] for r in results]
+    if not latencies:
+        return {"questions": 0}
+    return {
+        "questions": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+        "p50_s": float(np.percentile(latencies, 50)),
+        "p95_s": float(np.percentile(latencies, 95)),
+        "max_s": max(latencies),
+    }
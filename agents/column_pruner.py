@@ -0,0 +1,226 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from agents.knowledge_base import format_schema
+from agents.retriever import schema_tokens
+
+COLUMN_USAGE_FILE = os.getenv("COLUMN_USAGE_FILE", "column_usage.json")
+# Token budget for the whole pruned_schema handed to query_gen (~4 chars per token)
+COLUMN_PRUNER_TOKEN_BUDGET = int(os.getenv("COLUMN_PRUNER_TOKEN_BUDGET", "1200"))
+# Tables this narrow keep every column that is not marked low-value
+COLUMN_PRUNER_NARROW_TABLE = int(os.getenv("COLUMN_PRUNER_NARROW_TABLE", "12"))
+# Upper bound of columns kept per wide table before the token budget is applied
+COLUMN_PRUNER_MAX_COLUMNS = int(os.getenv("COLUMN_PRUNER_MAX_COLUMNS", "25"))
+
+# Score weights: question match on the name, on the description, past usage, rule mentions
+W_NAME, W_DESCRIPTION, W_USAGE, W_RULE = 1.0, 0.3, 0.5, 0.4
+USAGE_SAVE_EVERY = 20
+
+_IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_RULE_COLUMN_RE = re.compile(r"`([A-Za-z_][A-Za-z0-9_]*)`")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) - good enough for budgeting prompts."""
+    return (len(text) + 3) // 4
+
+
+class ColumnUsage:
+    """Per-column usage counts mined from SQL that executed successfully."""
+
+    def __init__(self, path=COLUMN_USAGE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.counts = {}
+        self._unsaved = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.counts = {t: Counter(c) for t, c in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                print(f"[Column Pruner] Ignoring unreadable usage file {path}: {e}")
+
+    def record(self, sql: str, kb):
+        """Counts every known column referenced by `sql` against the tables it reads."""
+        identifiers = {t.lower() for t in _IDENT_RE.findall(sql)}
+        with self._lock:
+            for table in identifiers & kb.tables.keys():
+                used = identifiers & kb.table(table)["column_index"].keys()
+                if used:
+                    self.counts.setdefault(table, Counter()).update(used)
+            self._unsaved += 1
+            if self._unsaved >= USAGE_SAVE_EVERY:
+                self.save()
+
+    def snapshot(self, tables) -> dict:
+        """Copy of the counts of `tables`, taken under the lock (record() runs on other threads)."""
+        with self._lock:
+            return {table: dict(self.counts.get(table, {})) for table in tables}
+
+    def bootstrap(self, kb):
+        """Seeds the counts from the knowledge base sample queries when nothing was mined yet."""
+        if not self.counts:
+            for table in kb.tables:
+                if kb.table(table)["sample_query"]:
+                    self.record(kb.table(table)["sample_query"], kb)
+
+    def save(self):
+        self._unsaved = 0
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.counts, f)
+        os.replace(tmp_path, self.path)
+
+
+class ColumnPruner:
+    """Scores each column of the selected tables against the question and trims to a token budget.
+
+    Primary/join keys and columns named in the question are always kept; everything else is
+    ranked by question match (name and description), usage in past SQL and mentions in
+    the table rules, and low-value columns are dropped unless asked for.
+    """
+
+    def __init__(self, kb, usage: ColumnUsage, token_budget=COLUMN_PRUNER_TOKEN_BUDGET):
+        self.kb = kb
+        self.usage = usage
+        self.token_budget = token_budget
+        # Local index: per table, column -> (name tokens, description tokens, mentioned in rules)
+        self.index = {}
+        for table, details in kb.tables.items():
+            rule_columns = set(_RULE_COLUMN_RE.findall(details["rules"]))
+            self.index[table] = {
+                c["name"]: (set(schema_tokens(c["name"])), set(schema_tokens(c.get("description", ""))), c["name"] in rule_columns)
+                for c in details["columns"]
+            }
+
+    def _score(self, table, column, question_tokens, counts, max_usage) -> float:
+        name_tokens, description_tokens, in_rules = self.index[table][column["name"]]
+        score = W_NAME * len(name_tokens & question_tokens) / max(len(name_tokens), 1)
+        score += W_DESCRIPTION * len(description_tokens & question_tokens) / max(len(description_tokens), 1)
+        if max_usage:
+            score += W_USAGE * counts.get(column["name"], 0) / max_usage
+        if in_rules:
+            score += W_RULE
+        return score
+
+    def _required(self, table, relevant_tables, question_lower) -> set:
+        """Keys, join columns shared with another selected table and columns named verbatim."""
+        required = set()
+        other_columns = set()
+        for other in relevant_tables:
+            if other != table and self.kb.table(other):
+                other_columns |= self.kb.table(other)["column_index"].keys()
+        for column in self.kb.table(table)["columns"]:
+            name = column["name"]
+            if column.get("key") == "primary" or name in other_columns and name.endswith("_id"):
+                required.add(name)
+            elif column.get("key") == "join" and any(o != table for o in relevant_tables):
+                required.add(name)
+            elif re.search(rf"\b({re.escape(name.lower())}|{re.escape(name.replace('_', ' ').lower())})\b", question_lower):
+                required.add(name)
+        return required
+
+    def prune(self, question: str, relevant_tables: list, workspace_name: str) -> tuple:
+        """Returns (pruned_schema, stats)."""
+        start = time.perf_counter()
+        question_tokens = set(schema_tokens(question))
+        question_lower = question.lower()
+        tables = [t for t in relevant_tables if self.kb.table(t)]
+        usage = self.usage.snapshot(tables)
+
+        # Ranked, per-table selections before the global budget is applied
+        selections = {}
+        scores = {}
+        required = {}
+        for table in tables:
+            details = self.kb.table(table)
+            counts = usage[table]
+            max_usage = max(counts.values(), default=0)
+            required[table] = self._required(table, tables, question_lower)
+            ranked = []
+            for column in details["columns"]:
+                score = self._score(table, column, question_tokens, counts, max_usage)
+                scores[(table, column["name"])] = score
+                ranked.append((score, column))
+            ranked.sort(key=lambda item: -item[0])
+
+            narrow = len(details["columns"]) <= COLUMN_PRUNER_NARROW_TABLE
+            keep = set(required[table])
+            for score, column in ranked:
+                if len(keep) >= COLUMN_PRUNER_MAX_COLUMNS and not narrow:
+                    break
+                if column.get("low_value") and column["name"] not in required[table] and score < W_NAME:
+                    continue
+                if narrow or score > 0:
+                    keep.add(column["name"])
+            selections[table] = keep
+
+        def render():
+            schema = f"WORKSPACE: {workspace_name}\n"
+            for table in tables:
+                details = self.kb.table(table)
+                kept = [c for c in details["columns"] if c["name"] in selections[table]]
+                dropped = set(details["column_index"]) - selections[table]
+                # Drop rule sentences that only talk about pruned columns
+                rules = " ".join(
+                    sentence for sentence in re.split(r"(?<=\.)\s+", details["rules"])
+                    if not set(_RULE_COLUMN_RE.findall(sentence)) & dropped
+                )
+                schema += f"\nTABLE: {table}\nSCHEMA: {format_schema(kept)}\nRULES: {rules}"
+            return schema
+
+        pruned_schema = render()
+        # Enforce the token budget by dropping the lowest-scoring optional columns first
+        optional = sorted(
+            ((scores[(t, c)], t, c) for t in tables for c in selections[t] if c not in required[t]),
+            key=lambda item: item[0],
+        )
+        while estimate_tokens(pruned_schema) > self.token_budget and optional:
+            _, table, column = optional.pop(0)
+            selections[table].discard(column)
+            pruned_schema = render()
+
+        columns_total = sum(len(self.kb.table(t)["columns"]) for t in tables)
+        full_chars = len(f"WORKSPACE: {workspace_name}\n") + sum(len(self.kb.table(t)["block"]) for t in tables)
+        stats = {
+            "columns_total": columns_total,
+            "columns_kept": sum(len(selections[t]) for t in tables),
+            "schema_chars_full": full_chars,
+            "schema_chars_pruned": len(pruned_schema),
+            "schema_tokens_pruned": estimate_tokens(pruned_schema),
+            "prune_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+        return pruned_schema, stats
+
+
+_usage = None
+_pruner = None
+_pruner_lock = threading.Lock()
+
+
+def get_column_usage() -> ColumnUsage:
+    """Returns the process-wide column usage statistics."""
+    global _usage
+    if _usage is None:
+        with _pruner_lock:
+            if _usage is None:
+                _usage = ColumnUsage()
+    return _usage
+
+
+def get_column_pruner(kb) -> ColumnPruner:
+    """Returns a pruner indexed for the given knowledge base version."""
+    global _pruner
+    if _pruner is None or _pruner.kb is not kb:
+        usage = get_column_usage()
+        usage.bootstrap(kb)
+        with _pruner_lock:
+            if _pruner is None or _pruner.kb is not kb:
+                _pruner = ColumnPruner(kb, usage)
+    return _pruner
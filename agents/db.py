@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import duckdb
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+DATABASE_FILE = "uber_trips.db"
+
+# DuckDB tuning for the shared connection (override through the environment)
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "4"))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "1GB")
+# Worker threads used by async callers for blocking DuckDB work
+DUCKDB_EXECUTOR_WORKERS = int(os.getenv("DUCKDB_EXECUTOR_WORKERS", str(DUCKDB_THREADS)))
+# A read-only connection still locks the file against writers in other processes, so it is
+# closed after this many seconds without queries (0 keeps it open for the life of the process)
+DUCKDB_IDLE_RELEASE_SECONDS = float(os.getenv("DUCKDB_IDLE_RELEASE_SECONDS", "5"))
+# How long writers (create_db.py, python -m agents.rollups) wait for that lock to be released
+DUCKDB_WRITER_WAIT_SECONDS = float(os.getenv("DUCKDB_WRITER_WAIT_SECONDS", "30"))
+
+
+class ConnectionManager:
+    """Keeps one long-lived DuckDB connection open and hands out per-thread cursors.
+
+    Opening the database file for every question throws away DuckDB's buffer pool and
+    catalog, so instead the file is opened once (read-only by default, which lets several
+    Streamlit sessions share it) and each thread gets its own cursor on that connection.
+    Queries run inside session(); once no session has been open for `idle_release` seconds
+    the connection is closed, so writers in other processes can lock the file.
+    """
+
+    def __init__(self, database=DATABASE_FILE, read_only=True, threads=DUCKDB_THREADS, memory_limit=DUCKDB_MEMORY_LIMIT,
+                 idle_release=DUCKDB_IDLE_RELEASE_SECONDS):
+        self.database = database
+        self.read_only = read_only
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.idle_release = idle_release
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._con = None
+        self._signature = None
+        # Bumped on every reconnect so threads drop cursors of the old connection
+        self._generation = 0
+        self._sessions = 0
+        self._release_timer = None
+
+    def _file_signature(self):
+        """Identifies the database file on disk, so a rewritten file can be detected."""
+        try:
+            st = os.stat(self.database)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        """Returns the shared connection, opening it on first use."""
+        if self._con is None:
+            with self._lock:
+                if self._con is None:
+                    config = {"threads": self.threads, "memory_limit": self.memory_limit}
+                    self._con = duckdb.connect(database=self.database, read_only=self.read_only, config=config)
+                    self._signature = self._file_signature()
+                    self._generation += 1
+                    print(f"[DB] Opened {self.database} (read_only={self.read_only}, threads={self.threads}, memory_limit={self.memory_limit})")
+        return self._con
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Returns this thread's cursor on the shared connection."""
+        con = self.connection()
+        cur = getattr(self._local, "cursor", None)
+        if cur is None or self._local.generation != self._generation:
+            cur = con.cursor()
+            self._local.cursor = cur
+            self._local.generation = self._generation
+        return cur
+
+    @contextmanager
+    def session(self):
+        """Yields this thread's cursor; the connection is not released while the block runs."""
+        with self._lock:
+            self._sessions += 1
+            if self._release_timer is not None:
+                self._release_timer.cancel()
+                self._release_timer = None
+        try:
+            yield self.cursor()
+        finally:
+            with self._lock:
+                self._sessions -= 1
+                if self._sessions == 0 and self.idle_release > 0 and self._con is not None:
+                    self._release_timer = threading.Timer(self.idle_release, self._release_if_idle)
+                    self._release_timer.daemon = True
+                    self._release_timer.start()
+
+    def _release_if_idle(self):
+        with self._lock:
+            if self._sessions > 0 or self._con is None:
+                return
+            self._release_timer = None
+            self._close()
+        print(f"[DB] Closed the idle connection to {self.database} (released the file lock)")
+
+    def generation_token(self) -> str:
+        """Changes whenever the database (or its write-ahead log) is rewritten on disk."""
+        parts = []
+        for path in (self.database, f"{self.database}.wal"):
+            try:
+                st = os.stat(path)
+                parts.append(f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}")
+            except FileNotFoundError:
+                parts.append("-")
+        return "/".join(parts)
+
+    def is_stale(self) -> bool:
+        """True when the file on disk was replaced since the connection was opened."""
+        return self._con is not None and self._file_signature() != self._signature
+
+    def health_check(self) -> bool:
+        """Verifies the connection answers queries, reconnecting once if it does not."""
+        if self.is_stale():
+            print("[DB] Database file changed on disk, reconnecting.")
+            self.reset()
+        try:
+            return self.cursor().execute("SELECT 1").fetchone() == (1,)
+        except Exception as e:
+            print(f"[DB] Health check failed ({e}), reconnecting.")
+            self.reset()
+            try:
+                return self.cursor().execute("SELECT 1").fetchone() == (1,)
+            except Exception:
+                return False
+
+    def _close(self):
+        # Closing the connection closes every thread's cursor on it too
+        if self._con is not None:
+            try:
+                self._con.close()
+            except Exception:
+                pass
+        self._con = None
+        self._signature = None
+
+    def reset(self):
+        """Closes the shared connection; the next cursor() call reopens it."""
+        with self._lock:
+            self._close()
+
+    close = reset
+
+
+def connect_for_writing(database=DATABASE_FILE, wait_s: float = DUCKDB_WRITER_WAIT_SECONDS) -> duckdb.DuckDBPyConnection:
+    """Opens database read-write, waiting up to wait_s while another process still holds the file lock
+    (a running app releases it after DUCKDB_IDLE_RELEASE_SECONDS without queries)."""
+    deadline = time.monotonic() + wait_s
+    while True:
+        try:
+            return duckdb.connect(database=database)
+        except duckdb.IOException as e:
+            if "lock" not in str(e).lower() or time.monotonic() >= deadline:
+                raise
+            time.sleep(0.2)
+
+
+def fetch_record_batches(result, batch_size: int):
+    """Streams a DuckDB result as an Arrow RecordBatchReader across DuckDB versions."""
+    to_arrow_reader = getattr(result, "to_arrow_reader", None)
+    return to_arrow_reader(batch_size) if to_arrow_reader is not None else result.fetch_record_batch(batch_size)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager() -> ConnectionManager:
+    """Returns the process-wide connection manager for DATABASE_FILE."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager()
+    return _manager
+
+
+_executor = None
+
+
+async def run_in_db_thread(fn, *args):
+    """Runs blocking DuckDB work on the shared DB thread pool (each worker keeps its own cursor)."""
+    global _executor
+    if _executor is None:
+        with _manager_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DUCKDB_EXECUTOR_WORKERS, thread_name_prefix="duckdb")
+    # Run in a copy of the caller's context so contextvars (e.g. the current trace span) carry over
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(context.run, fn, *args))
@@ -0,0 +1,165 @@
+import json
+import os
+import pickle
+import re
+import threading
+
+KNOWLEDGE_BASE_FILE = "knowledge_base.json"
+# Pre-indexed snapshot of the JSON file; rebuilt automatically whenever the JSON changes
+KNOWLEDGE_BASE_INDEX_FILE = os.getenv("KNOWLEDGE_BASE_INDEX_FILE", "knowledge_base.idx")
+_INDEX_FORMAT = 2
+
+_COLUMN_RE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?:\(([^)]*)\))?\s*$")
+
+
+def parse_schema(schema: str) -> list:
+    """Parses 'col (TYPE), col2 (TYPE)' into [{'name': 'col', 'type': 'TYPE'}, ...]."""
+    columns = []
+    for part in schema.split(","):
+        match = _COLUMN_RE.match(part)
+        if match:
+            columns.append({"name": match.group(1), "type": (match.group(2) or "").strip()})
+    return columns
+
+
+def format_schema(columns) -> str:
+    """Inverse of parse_schema."""
+    return ", ".join(f"{c['name']} ({c['type']})" if c.get("type") else c["name"] for c in columns)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class KnowledgeBase:
+    """Immutable, indexed view of knowledge_base.json.
+
+    Built once per file version: workspace -> tables, table -> details/columns and the
+    context blocks handed to the agents are all precomputed, so lookups never touch disk.
+    """
+
+    def __init__(self, raw: dict, version: str = ""):
+        self.version = version
+        self.workspaces = {}
+        self.tables = {}
+        self.rollups = {}  # rollup table -> definition (see agents.rollups); never shown to the agents
+        for workspace, ws_details in raw.items():
+            table_names = []
+            for table, details in ws_details.get("tables", {}).items():
+                if "rollup" in details:
+                    self.rollups[table] = details["rollup"]
+                    continue
+                columns = details.get("columns") or parse_schema(details.get("schema", ""))
+                schema = details.get("schema") or format_schema(columns)
+                self.tables[table] = {
+                    "workspace": workspace,
+                    "schema": schema,
+                    "rules": details.get("rules", ""),
+                    "sample_query": details.get("sample_query", ""),
+                    "columns": columns,
+                    "column_index": {c["name"]: c for c in columns},
+                    "block": f"\nTABLE: {table}\nSCHEMA: {schema}\nRULES: {details.get('rules', '')}\n",
+                }
+                table_names.append(table)
+            context = f"WORKSPACE: {workspace}\n" + "".join(self.tables[t]["block"] for t in table_names)
+            self.workspaces[workspace] = {
+                "description": ws_details.get("description", ""),
+                "tables": table_names,
+                "context": context,
+            }
+
+    def has_workspace(self, workspace: str) -> bool:
+        return workspace in self.workspaces
+
+    def workspace_context(self, workspace: str) -> str:
+        """Full schema/rules context of a workspace (what rag_retrieval hands to the pruners)."""
+        return self.workspaces[workspace]["context"]
+
+    def table_names(self, workspace: str = None) -> list:
+        if workspace is None:
+            return list(self.tables)
+        return list(self.workspaces.get(workspace, {}).get("tables", []))
+
+    def table(self, table: str) -> dict:
+        return self.tables.get(table)
+
+    def columns(self, table: str) -> list:
+        details = self.tables.get(table)
+        return details["columns"] if details else []
+
+
+class KnowledgeBaseStore:
+    """Holds the current KnowledgeBase and swaps in a new one when the JSON file changes."""
+
+    def __init__(self, path=KNOWLEDGE_BASE_FILE, index_path=KNOWLEDGE_BASE_INDEX_FILE):
+        self.path = path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._kb = None
+        self._signature = None
+
+    def _load_index(self, signature):
+        """Loads the pickled snapshot if it was built from the current JSON file."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, "rb") as f:
+                header, kb = pickle.load(f)
+        except Exception:
+            return None
+        if header != (_INDEX_FORMAT, self.path, signature):
+            return None
+        return kb
+
+    def _write_index(self, signature, kb):
+        if not self.index_path:
+            return
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(((_INDEX_FORMAT, self.path, signature), kb), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"[Knowledge Base] Could not write index {self.index_path}: {e}")
+
+    def _build(self, signature) -> KnowledgeBase:
+        kb = self._load_index(signature)
+        if kb is not None:
+            return kb
+        with open(self.path, "r") as f:
+            raw = json.load(f)
+        kb = KnowledgeBase(raw, version=f"{signature[0]}-{signature[1]}")
+        self._write_index(signature, kb)
+        print(f"[Knowledge Base] Indexed {len(kb.workspaces)} workspaces / {len(kb.tables)} tables from {self.path}")
+        return kb
+
+    def get(self) -> KnowledgeBase:
+        """Returns the current KnowledgeBase, reloading it if the file changed on disk."""
+        signature = _file_signature(self.path)
+        if signature is None:
+            raise FileNotFoundError(f"Knowledge base file not found: {self.path}")
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    # Readers keep using the old snapshot until the new one is fully built
+                    self._kb = self._build(signature)
+                    self._signature = signature
+        return self._kb
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Returns the process-wide, hot-reloading knowledge base."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = KnowledgeBaseStore()
+    return _store.get()
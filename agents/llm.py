@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+# 'main' does the complex reasoning (query generation/repair), 'pruner' the routing, pruning and synthesis
+LLM_TEMPERATURES = {"main": 0.1, "pruner": 0.0}
+
+_llms = {}
+_http_client = None
+_lock = threading.Lock()
+
+
+def _shared_http_client():
+    """One keep-alive connection pool for every sync Groq call (and the warm-up request)."""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0))
+    return _http_client
+
+
+def get_llm(role: str):
+    """Returns the process-wide chat model for a role ('main' or 'pruner'), creating it on first use.
+
+    langchain_groq is only imported here, so importing the agents does not pay for it.
+    """
+    llm = _llms.get(role)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(role)
+            if llm is None:
+                if role not in LLM_TEMPERATURES:
+                    raise ValueError(f"Unknown LLM role: {role}")
+                from dotenv import load_dotenv
+                from langchain_groq import ChatGroq
+                load_dotenv()
+                llm = ChatGroq(model=LLM_MODEL, temperature=LLM_TEMPERATURES[role], api_key=os.getenv("GROQ_API_KEY"),
+                               http_client=_shared_http_client())
+                _llms[role] = llm
+    return llm
+
+
+def set_llm(role: str, llm):
+    """Replaces the model for a role (e.g. benchmarks.fake_llm.FakeChatModel for offline runs)."""
+    if role not in LLM_TEMPERATURES:
+        raise ValueError(f"Unknown LLM role: {role}")
+    with _lock:
+        _llms[role] = llm
+
+
+def warm_up_llm() -> float:
+    """Creates the clients and opens the HTTPS keep-alive to the Groq endpoint; returns seconds taken."""
+    start = time.perf_counter()
+    for role in LLM_TEMPERATURES:
+        get_llm(role)
+    if _http_client is None:
+        # A model was replaced (offline run): there is no endpoint to connect to
+        return time.perf_counter() - start
+    try:
+        import groq
+        groq.Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=_http_client).models.list()
+    except Exception as e:
+        print(f"[LLM] Warm-up request failed: {e}")
+    return time.perf_counter() - start
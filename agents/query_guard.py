@@ -0,0 +1,309 @@
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+from agents.results import RESULT_MAX_ROWS
+from agents.rollups import _mask
+
+QUERY_GUARD_ENABLED = os.getenv("QUERY_GUARD_ENABLED", "1") != "0"
+# Plans where any operator is estimated above this many rows are rejected (cartesian joins, runaway joins)
+QUERY_MAX_ESTIMATED_ROWS = int(os.getenv("QUERY_MAX_ESTIMATED_ROWS", "100000000"))
+# Queries estimated to return more rows than this get a LIMIT (and the answer says so). By default
+# that is the number of rows the result store keeps; 0 turns the auto-LIMIT off
+QUERY_AUTO_LIMIT = int(os.getenv("QUERY_AUTO_LIMIT", str(RESULT_MAX_ROWS)))
+# A table whose rules require a date filter may be scanned without one only below this many rows
+QUERY_DATE_FILTER_MIN_ROWS = int(os.getenv("QUERY_DATE_FILTER_MIN_ROWS", "1000000"))
+# Plans returning at most this many rows without aggregating (lookups such as 'the last trip')
+# are exempt from the date-filter rule
+QUERY_DATE_FILTER_SMALL_OUTPUT_ROWS = int(os.getenv("QUERY_DATE_FILTER_SMALL_OUTPUT_ROWS", "100"))
+# Hard wall-clock limit for executing and fetching one query (0 disables the watchdog)
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
+# DuckDB's threads/memory_limit are per database, not per query, so queries scanning more than
+# QUERY_HEAVY_ROWS share QUERY_HEAVY_SLOTS slots instead of all running at once
+QUERY_HEAVY_ROWS = int(os.getenv("QUERY_HEAVY_ROWS", "10000000"))
+QUERY_HEAVY_SLOTS = int(os.getenv("QUERY_HEAVY_SLOTS", "1"))
+
+# Prefix of db_result when the guard stopped a query (final_synth shows the reason to the user)
+REJECTED_PREFIX = "QUERY REJECTED"
+
+_CARTESIAN_OPERATORS = {"CROSS_PRODUCT", "BLOCKWISE_NL_JOIN"}
+# Inequality joins: DuckDB estimates them like equi-joins, but they can match every pair of input rows
+_RANGE_JOIN_OPERATORS = {"PIECEWISE_MERGE_JOIN", "IE_JOIN"}
+# Join types whose output is bounded by one of their inputs
+_FILTERING_JOIN_TYPES = {"SEMI", "ANTI", "MARK", "RIGHT_SEMI", "RIGHT_ANTI"}
+_EQUALITY_CONDITION_RE = re.compile(r"[^<>!=]+ (=|IS NOT DISTINCT FROM) [^<>!=]+")
+_LIMIT_OPERATORS = {"LIMIT", "STREAMING_LIMIT", "LIMIT_PERCENT"}
+# e.g. "Always filter by `trip_date` when a time frame is provided."
+_DATE_RULE_RE = re.compile(r"[^.]*filter\s+by\s+`(\w+)`[^.]*time\s+frame[^.]*\.?", re.IGNORECASE)
+_AGGREGATE_OPERATORS = {"HASH_GROUP_BY", "PERFECT_HASH_GROUP_BY", "UNGROUPED_AGGREGATE", "SIMPLE_AGGREGATE", "WINDOW", "STREAMING_WINDOW"}
+_MONTH = r"(jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|sep(t(ember)?)?|oct(ober)?|nov(ember)?|dec(ember)?)"
+_PERIOD = r"(days?|weeks?|months?|quarters?|years?|hours?)"
+# Explicit dates, ranges and relative periods only: 'per day', 'the last driver' or 'may have' are not time frames
+_TIME_FRAME_RE = re.compile(
+    r"\b(\d{4}-\d{1,2}(-\d{1,2})?|\d{1,2}/\d{1,2}/\d{2,4}"  # 2024-03-05, 2024-03, 3/5/2024
+    rf"|{_MONTH}\s+\d{{1,2}}(st|nd|rd|th)?\b|\d{{1,2}}(st|nd|rd|th)?\s+(of\s+)?{_MONTH}"  # March 5, 5th of March
+    rf"|{_MONTH},?\s+(19|20)\d{{2}}"  # March 2024
+    rf"|(in|during|since|before|after|until|through|from|between)\s+(early\s+|late\s+|mid-?)?{_MONTH}(?!\s+(be|have|not)\b)"  # in March
+    r"|(in|during|since|before|after|until|through|from|between|of|for)\s+(the\s+year\s+)?(19|20)\d{2}"  # in 2024
+    r"|(19|20)\d{2}\s*(-|to|and|through)\s*(19|20)\d{2}"  # 2023-2024
+    r"|q[1-4](\s+(19|20)\d{2})?"
+    rf"|(last|past|previous|prior|next|this|current|coming)\s+(\d+\s+|few\s+|couple\s+of\s+)?{_PERIOD}"  # last 7 days, this month
+    r"|(yesterday|today|tonight|ytd|mtd|year[- ]to[- ]date|month[- ]to[- ]date|this\s+weekend|last\s+weekend)"
+    r"|(since|before|after|until)\s+\d"
+    r")\b",
+    re.IGNORECASE,
+)
+# Clause bodies that filter: from WHERE/HAVING/ON up to the next clause keyword
+_FILTER_CLAUSE_RE = re.compile(
+    r"\b(where|having|on)\b(.*?)(?=\b(group\s+by|order\s+by|limit|having|qualify|window|union|intersect|except"
+    r"|join|left|right|inner|full|cross|natural|where|from|select)\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_GROUP_BY_RE = re.compile(
+    r"\bgroup\s+by\b(.*?)(?=\b(having|order\s+by|limit|qualify|window|union|intersect|except)\b|\)|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_LIMIT_RE = re.compile(r"\blimit\b", re.IGNORECASE)
+
+
+def is_failed_result(db_result: str) -> bool:
+    """True when query_exec produced an error or the guard stopped the query."""
+    return db_result.startswith(("SQL ERROR", REJECTED_PREFIX))
+
+
+def mentions_time_frame(question: str) -> bool:
+    """True when the question names a date, a date range or a relative period ('last 7 days', 'in March')."""
+    return bool(_TIME_FRAME_RE.search(question))
+
+
+def limit_note(query_stats: dict) -> str:
+    """Sentence telling final_synth and the user that the guard added a LIMIT ('' when it did not)."""
+    if query_stats.get("guard") != "limit":
+        return ""
+    return f"Note: {query_stats['guard_reason']}; counts and summaries only cover those rows."
+
+
+def has_top_level_limit(sql: str) -> bool:
+    """True when the statement itself (not a subquery) has a LIMIT clause."""
+    masked = _mask(sql)
+    depth, top_level = 0, []
+    for ch in masked:
+        depth += (ch == "(") - (ch == ")")
+        top_level.append(ch if depth == 0 else " ")
+    return bool(_LIMIT_RE.search("".join(top_level)))
+
+
+def with_limit(sql: str, limit: int) -> str:
+    return f"{sql.strip().rstrip(';').rstrip()} LIMIT {limit};"
+
+
+def _is_product_join(node: dict) -> bool:
+    """True for joins whose output is bounded only by the product of their inputs: cross products,
+    range joins and nested-loop joins with a condition other than equality."""
+    name = node.get("name")
+    if node.get("extra_info", {}).get("Join Type") in _FILTERING_JOIN_TYPES:
+        return False
+    if name in _CARTESIAN_OPERATORS or name in _RANGE_JOIN_OPERATORS:
+        return True
+    if name == "NESTED_LOOP_JOIN":
+        conditions = node.get("extra_info", {}).get("Conditions") or []
+        if isinstance(conditions, str):
+            conditions = [conditions]
+        return not conditions or not all(_EQUALITY_CONDITION_RE.fullmatch(c) for c in conditions)
+    return False
+
+
+def _estimate(node: dict) -> int:
+    """Estimated output rows of a plan operator.
+
+    Some operators (cross products, ORDER_BY, ungrouped aggregates) carry no estimate, and
+    operators above them report 0, so those are derived from the children instead. Product
+    joins are always taken as the product of their inputs, whatever DuckDB estimates.
+    """
+    children = node.get("children", [])
+    if children and _is_product_join(node):
+        product = 1
+        for child in children:
+            product *= max(_estimate(child), 1)
+        return product
+    try:
+        estimate = int(node.get("extra_info", {}).get("Estimated Cardinality"))
+    except (TypeError, ValueError):
+        estimate = None
+    if estimate is not None and (estimate > 0 or not children):
+        return estimate
+    if node.get("name") == "UNGROUPED_AGGREGATE":
+        return 1
+    if node.get("name") == "TOP_N" and str(node.get("extra_info", {}).get("Top", "")).isdigit():
+        return int(node["extra_info"]["Top"])
+    children = [_estimate(child) for child in children]
+    if node.get("name") in _LIMIT_OPERATORS:
+        # The plan does not say how many rows a LIMIT keeps; a limited result never needs the auto-LIMIT
+        return min(max(children, default=0), QUERY_AUTO_LIMIT or max(children, default=0))
+    if node.get("extra_info", {}).get("Join Type") in _FILTERING_JOIN_TYPES and children:
+        return min(children)
+    return max(children, default=0)
+
+
+def _operators(node: dict):
+    """Operators of a plan tree, children before their parents."""
+    for child in node.get("children", []):
+        yield from _operators(child)
+    yield node
+
+
+def _table_name(op: dict) -> str:
+    """Unqualified name of the table a scan operator reads ('' for other operators)."""
+    table = op.get("extra_info", {}).get("Table")
+    return table.split(".")[-1].lower() if table else ""
+
+
+def _filters_on(sql: str, column: str) -> bool:
+    """True when column appears in a WHERE/HAVING/ON clause of sql (filters DuckDB could not push into the scan)."""
+    pattern = re.compile(rf"\b{re.escape(column)}\b", re.IGNORECASE)
+    return any(pattern.search(match.group(2)) for match in _FILTER_CLAUSE_RE.finditer(_mask(sql)))
+
+
+def _groups_by(sql: str, column: str) -> bool:
+    """True when column is one of sql's GROUP BY keys (a per-date breakdown, not a time frame)."""
+    pattern = re.compile(rf"\b{re.escape(column)}\b", re.IGNORECASE)
+    return any(pattern.search(match.group(1)) for match in _GROUP_BY_RE.finditer(_mask(sql)))
+
+
+def explain_plan(con, sql: str) -> list:
+    """DuckDB's physical plan of sql as a list of operator trees (nothing is executed)."""
+    rows = con.execute(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}").fetchall()
+    return json.loads(rows[0][1])
+
+
+class QueryRejected(Exception):
+    """Raised when a query is stopped by the guard at execution time (busy or timed out)."""
+
+
+class QueryGuard:
+    """Admission control for generated SQL, based on DuckDB's EXPLAIN estimates.
+
+    check() rejects plans that would blow up (cartesian or runaway joins) or that ignore a
+    table's date-filter rule on a large scan, and adds a LIMIT to queries that would return
+    more rows than the result store keeps. Queries that scan very large tables are marked
+    heavy and take one of a few execution slots.
+    """
+
+    def __init__(self, heavy_slots: int = QUERY_HEAVY_SLOTS):
+        self._heavy = threading.BoundedSemaphore(max(1, heavy_slots))
+
+    def check(self, con, sql: str, question: str, kb) -> dict:
+        """Decision for sql: {'action': 'allow' | 'limit' | 'reject', 'sql', 'reason', 'estimated_rows', 'heavy'}."""
+        decision = {"action": "allow", "sql": sql, "reason": "", "estimated_rows": None, "heavy": False}
+        if not sql.strip().upper().startswith(("SELECT", "WITH")):
+            return decision
+        try:
+            plan = explain_plan(con, sql)
+        except duckdb.Error:
+            # Invalid SQL: query_exec reports DuckDB's error as usual
+            return decision
+        operators = [op for root in plan for op in _operators(root)]
+        decision["estimated_rows"] = max((_estimate(root) for root in plan), default=0)
+
+        for op in operators:
+            rows = _estimate(op)
+            if rows > QUERY_MAX_ESTIMATED_ROWS:
+                tables = sorted({_table_name(o) for o in _operators(op) if _table_name(o)})
+                if op["name"] in _CARTESIAN_OPERATORS:
+                    kind = "a cartesian product"
+                elif _is_product_join(op):
+                    kind = f"an inequality join ({op['name'].lower().replace('_', ' ')})"
+                else:
+                    kind = f"a {op['name'].lower().replace('_', ' ')}"
+                decision.update(action="reject", reason=(
+                    f"the plan contains {kind} of {' x '.join(tables) or 'its inputs'} estimated at ~{rows:,} rows "
+                    f"(limit {QUERY_MAX_ESTIMATED_ROWS:,}); add a join condition or filters"))
+                return decision
+
+        scans = [op for op in operators if _table_name(op)]
+        decision["heavy"] = any(_estimate(op) >= QUERY_HEAVY_ROWS for op in scans)
+        # Lookups returning a handful of rows are cheap to read back, whatever they scan;
+        # aggregates stay subject to the rule ('How many trips in March?' without a filter is wrong)
+        small_lookup = (decision["estimated_rows"] <= QUERY_DATE_FILTER_SMALL_OUTPUT_ROWS
+                        and not any(op.get("name") in _AGGREGATE_OPERATORS for op in operators))
+        if mentions_time_frame(question) and not small_lookup:
+            for op in scans:
+                table = _table_name(op)
+                details = kb.table(table) if kb is not None else None
+                rule = _DATE_RULE_RE.search(details["rules"]) if details else None
+                if rule is None or _estimate(op) < QUERY_DATE_FILTER_MIN_ROWS:
+                    continue
+                column = rule.group(1).lower()
+                filters = str(op.get("extra_info", {}).get("Filters", "")).lower()
+                if column not in filters and not _filters_on(sql, column) and not _groups_by(sql, column):
+                    decision.update(action="reject", reason=(
+                        f"the question asks about a time frame but the query scans ~{_estimate(op):,} rows of "
+                        f"{table} without filtering on {column} (table rule: '{rule.group(0).strip()}')"))
+                    return decision
+
+        if QUERY_AUTO_LIMIT and decision["estimated_rows"] > QUERY_AUTO_LIMIT and not has_top_level_limit(sql):
+            decision.update(action="limit", sql=with_limit(sql, QUERY_AUTO_LIMIT), reason=(
+                f"the query was estimated to return ~{decision['estimated_rows']:,} rows, "
+                f"so it was limited to the first {QUERY_AUTO_LIMIT:,}"))
+        return decision
+
+    @contextmanager
+    def slot(self, heavy: bool, timeout: float = QUERY_TIMEOUT_SECONDS):
+        """Holds a heavy-query slot for the duration of the block (no-op for light queries)."""
+        if not heavy:
+            yield
+            return
+        if not self._heavy.acquire(timeout=timeout if timeout > 0 else None):
+            raise QueryRejected(f"too many expensive queries are running; none finished within {timeout:g}s")
+        try:
+            yield
+        finally:
+            self._heavy.release()
+
+
+class QueryWatchdog:
+    """Interrupts a DuckDB cursor from a timer thread once the query outlives `timeout` seconds."""
+
+    def __init__(self, con, timeout: float = QUERY_TIMEOUT_SECONDS):
+        self.con = con
+        self.timeout = timeout
+        self.fired = False
+        self._timer = None
+
+    def _interrupt(self):
+        self.fired = True
+        self.con.interrupt()
+
+    def __enter__(self):
+        if self.timeout > 0:
+            self._timer = threading.Timer(self.timeout, self._interrupt)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._timer is not None:
+            self._timer.cancel()
+        # The interrupt surfaces as duckdb.InterruptException while executing but as OSError from
+        # the Arrow reader while fetching; after the timer fired, any error is the timeout
+        if self.fired and exc_type is not None and issubclass(exc_type, Exception):
+            raise QueryRejected(f"the query was cancelled after running longer than {self.timeout:g}s") from exc
+        return False
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_query_guard() -> QueryGuard:
+    """Returns the process-wide query guard."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = QueryGuard()
+    return _guard
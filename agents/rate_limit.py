@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import random
+
+# Limiter used by the async agents' LLM calls; set per batch by agents.batch.answer_many
+current_llm_limiter = contextvars.ContextVar("current_llm_limiter", default=None)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    if is_rate_limit_error(error):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)) or type(error).__name__ in (
+        "APIConnectionError", "APITimeoutError", "InternalServerError",
+    )
+
+
+def retry_after_seconds(error: Exception):
+    """Server-suggested wait from a Retry-After header, if the error carries one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Caps concurrent LLM calls and backs off when the provider rate-limits us.
+
+    Every 429 halves the number of calls allowed in flight; successful calls grow it back by
+    one at a time up to `max_concurrency` (AIMD). Retryable failures are retried with
+    exponential backoff and jitter, honouring Retry-After when the server sends one.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1, max_retries: int = 4,
+                 base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = None
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0}
+
+    def _cond(self) -> asyncio.Condition:
+        # Created lazily so it binds to the event loop that actually uses it
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _acquire(self):
+        async with self._cond():
+            while self._in_flight >= self.limit:
+                await self._cond().wait()
+            self._in_flight += 1
+
+    async def _release(self):
+        async with self._cond():
+            self._in_flight -= 1
+            self._cond().notify_all()
+
+    def _on_success(self):
+        self._successes += 1
+        if self.limit < self.max_concurrency and self._successes >= self.limit:
+            self.limit += 1
+            self._successes = 0
+
+    def _on_rate_limit(self):
+        self.stats["rate_limited"] += 1
+        self.limit = max(self.min_concurrency, self.limit // 2)
+        self._successes = 0
+
+    async def run(self, call):
+        """Awaits `call()` (a coroutine factory) under the limit, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire()
+            try:
+                self.stats["calls"] += 1
+                result = await call()
+                self._on_success()
+                return result
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                if is_rate_limit_error(e):
+                    self._on_rate_limit()
+                delay = retry_after_seconds(e) or min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random())
+                self.stats["retries"] += 1
+                print(f"[Rate Limit] {type(e).__name__}, retrying in {delay:.2f}s (limit {self.limit})")
+            finally:
+                await self._release()
+            await asyncio.sleep(delay)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") != "0"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Queries whose result changes between runs even on an unchanged database
+_NON_DETERMINISTIC_RE = re.compile(
+    r"\b(random|uuid|gen_random_uuid|now|current_date|current_time|current_timestamp|today|get_current_time|setseed)\b",
+    re.IGNORECASE,
+)
+# String literals, quoted identifiers, comments, whitespace runs and everything else
+_PUNCTUATION = "(),;=<>"
+_SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+|[^'\"\s]+", re.DOTALL)
+
+
+def canonicalize_sql(query: str) -> str:
+    """Normalizes SQL text so formatting-only differences share a cache entry.
+
+    Comments are dropped, whitespace is collapsed and everything outside string
+    literals and quoted identifiers is lowercased (DuckDB identifiers are case-insensitive).
+    """
+    parts = []
+    pending_space = False
+    for token in _SQL_TOKEN_RE.findall(query):
+        if token.startswith("--") or token.startswith("/*"):
+            continue
+        if token.isspace():
+            pending_space = True
+            continue
+        if token[0] not in ("'", '"'):
+            token = token.lower()
+        # Whitespace between tokens only matters when neither side is punctuation; spaces inside
+        # literals are never touched ('New York , NY' must stay distinct from 'New York, NY')
+        if pending_space and parts and parts[-1][-1] not in _PUNCTUATION and token[0] not in _PUNCTUATION:
+            parts.append(" ")
+        pending_space = False
+        parts.append(token)
+    return "".join(parts).rstrip(";").strip()
+
+
+def sql_fingerprint(query: str) -> str:
+    """Stable hash of the canonical SQL text."""
+    return hashlib.sha256(canonicalize_sql(query).encode("utf-8")).hexdigest()
+
+
+def is_cacheable(query: str) -> bool:
+    """Only deterministic SELECT/WITH queries may be served from the cache."""
+    head = query.lstrip().upper()
+    return (head.startswith("SELECT") or head.startswith("WITH")) and not _NON_DETERMINISTIC_RE.search(query)
+
+
+class ResultCache:
+    """Byte-bounded LRU cache of query results stored as Arrow tables.
+
+    Entries are keyed on the SQL fingerprint plus the database generation token, so a
+    rewritten database file never serves stale rows: entries of older generations are
+    unreachable and are dropped as soon as a newer generation is seen.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["nbytes"]
+
+    def _observe_generation(self, generation):
+        if generation != self._generation:
+            if self._entries:
+                self.stats["invalidations"] += len(self._entries)
+                print(f"[Result Cache] Database generation changed, dropping {len(self._entries)} entries.")
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def get(self, query: str, generation: str):
+        """Returns the cached entry dict ({'table', 'db_result', ...}) or None."""
+        key = sql_fingerprint(query)
+        with self._lock:
+            self._observe_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, query: str, generation: str, table, db_result: str):
+        """Caches an Arrow table (and its rendered text) unless it is too large to be worth it."""
+        nbytes = table.nbytes + len(db_result)
+        if nbytes > self.max_bytes // 4:
+            return
+        key = sql_fingerprint(query)
+        with self._lock:
+            self._observe_generation(generation)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {"table": table, "db_result": db_result, "nbytes": nbytes}
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"{s['hits']} hits / {s['misses']} misses, {len(self._entries)} entries, "
+                f"{self._bytes / (1024 * 1024):.1f} MB")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Returns the process-wide result cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
@@ -0,0 +1,159 @@
+import os
+import threading
+import uuid
+from collections import Counter, OrderedDict
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Rows shown to final_synth (and in the UI preview)
+RESULT_PREVIEW_ROWS = int(os.getenv("RESULT_PREVIEW_ROWS", "20"))
+# Rows/bytes retained for download; the stream keeps going for the column summaries
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "100000"))
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", str(64 * 1024 * 1024)))
+# Hard stop for the scan itself, so a runaway query cannot stream forever
+RESULT_SCAN_MAX_ROWS = int(os.getenv("RESULT_SCAN_MAX_ROWS", "10000000"))
+RESULT_BATCH_SIZE = int(os.getenv("RESULT_BATCH_SIZE", "65536"))
+RESULT_TOP_VALUES = 3
+# Stop tracking top values for a column once it has this many distinct values
+_MAX_TRACKED_DISTINCT = 10000
+
+
+class ColumnSummary:
+    """Running count/min/max/mean/top-values of one result column, updated batch by batch."""
+
+    def __init__(self, name: str, arrow_type):
+        self.name = name
+        self.type = arrow_type
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.numeric = pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type)
+        self.track_values = not pa.types.is_floating(arrow_type)
+        self.values = Counter()
+
+    def update(self, column):
+        self.count += len(column) - column.null_count
+        self.nulls += column.null_count
+        if len(column) == column.null_count:
+            return
+        try:
+            min_max = pc.min_max(column).as_py()
+            if self.min is None or min_max["min"] < self.min:
+                self.min = min_max["min"]
+            if self.max is None or min_max["max"] > self.max:
+                self.max = min_max["max"]
+        except (pa.ArrowNotImplementedError, TypeError):
+            pass
+        if self.numeric:
+            self.total += pc.sum(column).as_py() or 0
+        if self.track_values:
+            try:
+                for item in pc.value_counts(column).to_pylist():
+                    if item["values"] is not None:
+                        self.values[item["values"]] += item["counts"]
+            except pa.ArrowNotImplementedError:
+                self.track_values = False
+            if len(self.values) > _MAX_TRACKED_DISTINCT:
+                self.track_values = False
+                self.values.clear()
+
+    def describe(self) -> str:
+        parts = [f"{self.count:,} non-null"]
+        if self.nulls:
+            parts.append(f"{self.nulls:,} null")
+        if self.min is not None:
+            parts.append(f"min {self.min}, max {self.max}")
+        if self.numeric and self.count:
+            parts.append(f"mean {self.total / self.count:.4g}")
+        if self.track_values and self.values:
+            parts.append(f"{len(self.values):,} distinct")
+            if len(self.values) < self.count:
+                top = ", ".join(f"{v} ({c:,})" for v, c in self.values.most_common(RESULT_TOP_VALUES))
+                parts.append(f"top: {top}")
+        return f"- {self.name} ({self.type}): " + ", ".join(parts)
+
+
+class BoundedResult:
+    """A query result fetched as a stream of Arrow batches with bounded memory."""
+
+    def __init__(self, table, total_rows: int, scan_truncated: bool, summaries: list):
+        self.table = table  # rows retained for download (at most RESULT_MAX_ROWS / RESULT_MAX_BYTES)
+        self.total_rows = total_rows  # rows streamed
+        self.scan_truncated = scan_truncated  # True when RESULT_SCAN_MAX_ROWS stopped the stream
+        self.summaries = summaries
+
+    @property
+    def retained_truncated(self) -> bool:
+        return self.table.num_rows < self.total_rows
+
+    def to_db_result(self, preview_rows: int = RESULT_PREVIEW_ROWS) -> str:
+        """Text handed to final_synth: the full table when small, else a preview plus column stats."""
+        preview = self.table.slice(0, preview_rows).to_pandas().to_markdown(index=False)
+        if self.total_rows <= preview_rows and not self.scan_truncated:
+            return preview
+        more = "+" if self.scan_truncated else ""
+        lines = [
+            preview,
+            f"(Showing the first {min(preview_rows, self.table.num_rows)} of {self.total_rows:,}{more} rows.)",
+            "COLUMN SUMMARY (over all streamed rows):",
+        ]
+        lines.extend(s.describe() for s in self.summaries)
+        return "\n".join(lines)
+
+
+def fetch_bounded(reader: pa.RecordBatchReader, max_rows: int = RESULT_MAX_ROWS, max_bytes: int = RESULT_MAX_BYTES,
+                  scan_max_rows: int = RESULT_SCAN_MAX_ROWS) -> BoundedResult:
+    """Consumes an Arrow batch stream, keeping at most max_rows/max_bytes while summarizing every row."""
+    schema = reader.schema
+    summaries = [ColumnSummary(field.name, field.type) for field in schema]
+    kept, kept_rows, kept_bytes = [], 0, 0
+    total_rows = 0
+    scan_truncated = False
+    for batch in reader:
+        if total_rows + batch.num_rows > scan_max_rows:
+            batch = batch.slice(0, scan_max_rows - total_rows)
+            scan_truncated = True
+        total_rows += batch.num_rows
+        for summary, column in zip(summaries, batch.columns):
+            summary.update(column)
+        if kept_rows < max_rows and kept_bytes < max_bytes:
+            take = batch.slice(0, max_rows - kept_rows)
+            kept.append(take)
+            kept_rows += take.num_rows
+            kept_bytes += take.nbytes
+        if scan_truncated:
+            break
+    table = pa.Table.from_batches(kept, schema=schema)
+    return BoundedResult(table, total_rows, scan_truncated, summaries)
+
+
+class ResultStore:
+    """Keeps the most recent full results so the UI can offer them for download out-of-band."""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tables = OrderedDict()
+
+    def put(self, table) -> str:
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._tables[result_id] = table
+            while len(self._tables) > self.max_entries:
+                self._tables.popitem(last=False)
+        return result_id
+
+    def get(self, result_id: str):
+        with self._lock:
+            return self._tables.get(result_id)
+
+
+_store = ResultStore()
+
+
+def get_result_store() -> ResultStore:
+    """Returns the process-wide store of downloadable results."""
+    return _store
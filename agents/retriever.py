@@ -0,0 +1,198 @@
+import math
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from agents.knowledge_base import get_knowledge_base
+from agents.semantic_cache import OPERATOR_WORDS, STOPWORDS, stem
+
+SCHEMA_INDEX_FILE = os.getenv("SCHEMA_INDEX_FILE", "schema_index.pkl")
+# Optional sentence-transformers model for dense scores on top of BM25 ('' disables)
+SCHEMA_EMBEDDING_MODEL = os.getenv("SCHEMA_EMBEDDING_MODEL", "")
+# Weight of the embedding score when embeddings are enabled (BM25 gets the rest)
+SCHEMA_EMBEDDING_WEIGHT = float(os.getenv("SCHEMA_EMBEDDING_WEIGHT", "0.5"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# How many times each field is repeated in a table's document (cheap BM25F-style weighting)
+FIELD_WEIGHTS = {"table": 3, "columns": 2, "description": 1, "rules": 1, "sample_query": 1}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Operator words matter to the semantic cache but say nothing about which table a question needs
+_SCHEMA_STOPWORDS = STOPWORDS | OPERATOR_WORDS
+
+
+def schema_tokens(text: str) -> list:
+    """Lowercased, stemmed words; identifiers are split on underscores ('fare_usd' -> 'fare', 'usd')."""
+    return [stem(t) for t in _WORD_RE.findall(text.lower().replace("_", " ")) if t not in _SCHEMA_STOPWORDS]
+
+
+def table_document(table: str, details: dict, description: str = "") -> list:
+    """Bag of tokens describing one table: its name, columns, workspace description, rules and sample query."""
+    fields = {
+        "table": table,
+        "columns": " ".join(f"{c['name']} {c.get('description', '')}" for c in details["columns"]),
+        "description": description,
+        "rules": details.get("rules", ""),
+        "sample_query": details.get("sample_query", ""),
+    }
+    tokens = []
+    for field, text in fields.items():
+        tokens.extend(schema_tokens(text) * FIELD_WEIGHTS[field])
+    return tokens
+
+
+def _load_embedder(model_name):
+    """Returns a texts -> unit-vector matrix function, or None when embeddings are unavailable."""
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("[Schema Retriever] sentence-transformers is not installed, using BM25 only.")
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda texts: np.asarray(model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+class SchemaRetriever:
+    """BM25 (plus optional embedding) index over the tables of the knowledge base.
+
+    Each term maps to a NumPy array of table ids and precomputed BM25 weights, so a
+    query is a handful of scatter-adds followed by an argpartition top-k - no network call.
+    """
+
+    def __init__(self, tables, workspaces, postings, embeddings=None, version="", embedding_model=""):
+        self.tables = tables
+        self.workspaces = workspaces
+        self._workspace_array = np.asarray(workspaces, dtype=object)
+        self.postings = postings
+        self.embeddings = embeddings
+        self.version = version
+        self.embedding_model = embedding_model
+        self._embedder = None
+
+    @classmethod
+    def build(cls, kb, embedding_model=SCHEMA_EMBEDDING_MODEL):
+        """Builds the index for a KnowledgeBase (normally done offline, then loaded from disk)."""
+        tables = kb.table_names()
+        workspaces = [kb.table(t)["workspace"] for t in tables]
+        docs = []
+        for table, workspace in zip(tables, workspaces):
+            docs.append(table_document(table, kb.table(table), kb.workspaces[workspace]["description"]))
+
+        n_docs = len(docs)
+        avg_len = (sum(len(d) for d in docs) / n_docs) if n_docs else 1.0
+        term_docs = {}
+        for doc_id, doc in enumerate(docs):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+            for term, tf in Counter(doc).items():
+                term_docs.setdefault(term, []).append((doc_id, tf * (BM25_K1 + 1) / (tf + norm)))
+
+        postings = {}
+        for term, entries in term_docs.items():
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            ids = np.fromiter((e[0] for e in entries), dtype=np.int32, count=len(entries))
+            weights = np.fromiter((e[1] * idf for e in entries), dtype=np.float32, count=len(entries))
+            postings[term] = (ids, weights)
+
+        embeddings = None
+        embedder = _load_embedder(embedding_model)
+        if embedder is not None:
+            embeddings = embedder([" ".join(doc) for doc in docs])
+
+        retriever = cls(tables, workspaces, postings, embeddings, kb.version, embedding_model if embedder else "")
+        retriever._embedder = embedder
+        return retriever
+
+    def save(self, path=SCHEMA_INDEX_FILE):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "version": self.version,
+                "tables": self.tables,
+                "workspaces": self.workspaces,
+                "postings": self.postings,
+                "embeddings": self.embeddings,
+                "embedding_model": self.embedding_model,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=SCHEMA_INDEX_FILE):
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["tables"], data["workspaces"], data["postings"], data["embeddings"],
+                   data["version"], data["embedding_model"])
+
+    def scores(self, question: str, workspace: str = None, workspace_boost: float = 1.2) -> np.ndarray:
+        """Relevance score of every table for the question."""
+        scores = np.zeros(len(self.tables), dtype=np.float32)
+        for term in set(schema_tokens(question)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                # Table ids are unique within a posting, so a fancy-indexed add is safe
+                scores[posting[0]] += posting[1]
+
+        if self.embeddings is not None:
+            if self._embedder is None:
+                self._embedder = _load_embedder(self.embedding_model)
+            if self._embedder is not None:
+                top = scores.max()
+                lexical = scores / top if top > 0 else scores
+                dense = self.embeddings @ self._embedder([question])[0]
+                scores = (1 - SCHEMA_EMBEDDING_WEIGHT) * lexical + SCHEMA_EMBEDDING_WEIGHT * dense
+
+        if workspace:
+            scores = np.where(self._workspace_array == workspace, scores * workspace_boost, scores)
+        return scores
+
+    def search(self, question: str, k: int = 8, workspace: str = None) -> list:
+        """Top-k (table, score) pairs with a positive score, best first."""
+        scores = self.scores(question, workspace)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.tables[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_schema_retriever() -> SchemaRetriever:
+    """Returns the index for the current knowledge base version.
+
+    The index is loaded from SCHEMA_INDEX_FILE when it matches the knowledge base,
+    and otherwise rebuilt (and saved) on first use after the knowledge base changes.
+    """
+    global _retriever
+    kb = get_knowledge_base()
+    if _retriever is None or _retriever.version != kb.version:
+        with _retriever_lock:
+            if _retriever is None or _retriever.version != kb.version:
+                retriever = None
+                if os.path.exists(SCHEMA_INDEX_FILE):
+                    try:
+                        retriever = SchemaRetriever.load(SCHEMA_INDEX_FILE)
+                    except Exception as e:
+                        print(f"[Schema Retriever] Ignoring unreadable index {SCHEMA_INDEX_FILE}: {e}")
+                if retriever is None or retriever.version != kb.version:
+                    retriever = SchemaRetriever.build(kb)
+                    retriever.save(SCHEMA_INDEX_FILE)
+                    print(f"[Schema Retriever] Indexed {len(retriever.tables)} tables.")
+                _retriever = retriever
+    return _retriever
+
+
+if __name__ == "__main__":
+    # Offline build: python -m agents.retriever
+    retriever = SchemaRetriever.build(get_knowledge_base())
+    retriever.save(SCHEMA_INDEX_FILE)
+    print(f"Schema index written to {SCHEMA_INDEX_FILE} ({len(retriever.tables)} tables, {len(retriever.postings)} terms).")
@@ -0,0 +1,449 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import duckdb
+
+from agents.db import DATABASE_FILE, connect_for_writing, get_connection_manager
+from agents.knowledge_base import KNOWLEDGE_BASE_FILE
+
+# Route eligible aggregate queries on trips to a fresh rollup (query_rewrite node)
+ROLLUP_REWRITE_ENABLED = os.getenv("ROLLUP_REWRITE_ENABLED", "1") != "0"
+ROLLUP_STATE_TABLE = "rollup_state"
+
+# Pre-aggregated tables: one row per combination of dimensions, maintained incrementally through the
+# source's increasing key. Each stores trip_count = count(*), <col>_count for every measure/count
+# column and <col>_sum/_min/_max for every measure.
+ROLLUP_DEFINITIONS = {
+    "trips_daily_city_status": {
+        "source": "trips",
+        "key": "trip_id",
+        "dimensions": ["trip_date", "city", "trip_status"],
+        "measures": ["fare_usd", "distance_miles"],
+        "counts": ["trip_id", "driver_id"],
+        "description": "Trips pre-aggregated per trip_date, city and trip_status.",
+    },
+    "trips_by_driver": {
+        "source": "trips",
+        "key": "trip_id",
+        "dimensions": ["driver_id", "trip_status"],
+        "measures": ["fare_usd", "distance_miles"],
+        "counts": ["trip_id"],
+        "description": "Per-driver trip stats, split by trip_status.",
+    },
+}
+
+_AGGREGATE_RE = re.compile(r"\b(count|sum|avg|min|max)\s*\(", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_QUOTED_IDENTIFIER_RE = re.compile(r"(\bas\s+)?\"(?:[^\"]|\"\")*\"", re.IGNORECASE)
+_CLAUSE_RE = re.compile(r"\b(select|from|where|group\s+by|having|order\s+by|limit|offset)\b", re.IGNORECASE)
+_UNSUPPORTED_RE = re.compile(
+    r"\b(join|union|intersect|except|over|qualify|window|pivot|unpivot|unnest|distinct\s+on|using\s+sample)\b",
+    re.IGNORECASE,
+)
+_ALIAS_RE = re.compile(r"\s+(as\s+)?(\"[^\"]+\"|[A-Za-z_][A-Za-z0-9_]*)\s*$", re.IGNORECASE)
+_IDENTIFIER_RE = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\b(\s*\()?")
+# Bare words that are not column references
+_SQL_WORDS = {
+    "and", "or", "not", "in", "is", "null", "between", "like", "ilike", "case", "when", "then", "else", "end",
+    "as", "true", "false", "date", "timestamp", "interval", "asc", "desc", "nulls", "first", "last", "distinct",
+    "all", "current_date", "current_timestamp", "year", "month", "day", "week", "quarter", "hour", "minute",
+    "second", "days", "months", "years", "weeks", "varchar", "integer", "int", "bigint", "double", "float",
+    "decimal", "numeric", "text", "boolean",
+}
+
+
+def measure_columns(definition: dict) -> list:
+    """Names of a rollup's stored aggregate columns, in table order."""
+    columns = ["trip_count"] + [f"{c}_count" for c in definition["measures"] + definition["counts"]]
+    for c in definition["measures"]:
+        columns += [f"{c}_sum", f"{c}_min", f"{c}_max"]
+    return columns
+
+
+def definition_hash(definition: dict) -> str:
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _aggregate_sql(definition: dict, where: str) -> str:
+    dims = ", ".join(definition["dimensions"])
+    measures = ["count(*) AS trip_count"]
+    measures += [f"count({c}) AS {c}_count" for c in definition["measures"] + definition["counts"]]
+    for c in definition["measures"]:
+        measures += [f"sum({c}) AS {c}_sum", f"min({c}) AS {c}_min", f"max({c}) AS {c}_max"]
+    return f"SELECT {dims}, {', '.join(measures)} FROM {definition['source']} WHERE {where} GROUP BY {dims}"
+
+
+def _merge_sql(name: str, definition: dict, delta_sql: str) -> str:
+    """Re-aggregates the existing rollup together with the aggregates of the new source rows."""
+    dims = ", ".join(definition["dimensions"])
+    merged = []
+    for column in measure_columns(definition):
+        function = "min" if column.endswith("_min") else "max" if column.endswith("_max") else "sum"
+        merged.append(f"{function}({column}){'::BIGINT' if column.endswith('_count') else ''} AS {column}")
+    return (f"SELECT {dims}, {', '.join(merged)} FROM "
+            f"(SELECT * FROM {name} UNION ALL BY NAME ({delta_sql})) GROUP BY {dims}")
+
+
+def source_summary(con, source: str, key: str, watermark: int = 0) -> tuple:
+    """(max key, rows, rows <= watermark, checksum of rows <= watermark, checksum of all rows) of a source.
+
+    The checksum XORs a hash of every whole row, so it changes when any row is updated,
+    deleted or replaced, not only when rows are added.
+    """
+    return con.execute(
+        f"SELECT coalesce(max({key}), 0), count(*), count(*) FILTER (WHERE {key} <= $1), "
+        f"coalesce(bit_xor(hash(src)) FILTER (WHERE {key} <= $1), 0), coalesce(bit_xor(hash(src)), 0) "
+        f"FROM {source} AS src", [watermark]).fetchone()
+
+
+def refresh_rollup(con, name: str, definition: dict, full: bool = False) -> dict:
+    """Brings one rollup up to date.
+
+    Only source rows above the stored watermark are aggregated and merged in; the rollup is
+    rebuilt when its definition changed or the rows below the watermark no longer match the
+    stored row count and checksum (e.g. create_db.py regenerated the table).
+    """
+    start = time.perf_counter()
+    source, key = definition["source"], definition["key"]
+    con.execute(f"CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (name VARCHAR PRIMARY KEY, definition VARCHAR, "
+                f"watermark BIGINT, source_rows BIGINT, rollup_rows BIGINT, refreshed_at TIMESTAMP)")
+    # Added after the first release; state rows without it fail the check and are rebuilt
+    con.execute(f"ALTER TABLE {ROLLUP_STATE_TABLE} ADD COLUMN IF NOT EXISTS checksum UBIGINT")
+    state = con.execute(f"SELECT definition, watermark, source_rows, checksum FROM {ROLLUP_STATE_TABLE} WHERE name = ?",
+                        [name]).fetchone()
+    high, total, covered, covered_checksum, checksum = source_summary(con, source, key, state[1] if state else 0)
+
+    mode = "full"
+    if not full and state is not None and state[0] == definition_hash(definition) and name in _tables(con):
+        if (covered, covered_checksum) == (state[2], state[3]):
+            mode = "incremental" if high > state[1] else "unchanged"
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if mode == "full":
+            con.execute(f"CREATE OR REPLACE TABLE {name} AS {_aggregate_sql(definition, f'{key} <= {high}')}")
+        elif mode == "incremental":
+            delta = _aggregate_sql(definition, f"{key} > {state[1]} AND {key} <= {high}")
+            con.execute(f"CREATE OR REPLACE TABLE {name} AS {_merge_sql(name, definition, delta)}")
+        rollup_rows = con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+        con.execute(f"INSERT OR REPLACE INTO {ROLLUP_STATE_TABLE} "
+                    f"(name, definition, watermark, source_rows, rollup_rows, refreshed_at, checksum) "
+                    f"VALUES (?, ?, ?, ?, ?, now(), ?)",
+                    [name, definition_hash(definition), high, total, rollup_rows, checksum])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    elapsed = time.perf_counter() - start
+    print(f"[Rollups] {name}: {mode} refresh in {elapsed:.2f}s ({total:,} source rows -> {rollup_rows:,} rows)")
+    return {"name": name, "mode": mode, "seconds": round(elapsed, 3), "source_rows": total, "rollup_rows": rollup_rows}
+
+
+def _tables(con) -> set:
+    return {row[0] for row in con.execute(
+        "SELECT table_name FROM duckdb_tables() UNION SELECT view_name FROM duckdb_views()").fetchall()}
+
+
+def refresh_rollups(database_file: str = DATABASE_FILE, full: bool = False) -> list:
+    """Refreshes every rollup whose source table exists (needs write access to the database)."""
+    con = connect_for_writing(database_file)
+    try:
+        existing = _tables(con)
+        return [refresh_rollup(con, name, definition, full)
+                for name, definition in ROLLUP_DEFINITIONS.items() if definition["source"] in existing]
+    finally:
+        con.close()
+
+
+def register_rollups(kb_file: str = KNOWLEDGE_BASE_FILE):
+    """Adds the rollups to knowledge_base.json next to their source table.
+
+    Entries carry a "rollup" key: the knowledge base keeps them out of the agents' prompts
+    and hands them to the query_rewrite node instead.
+    """
+    with open(kb_file) as f:
+        kb = json.load(f)
+    for name, definition in ROLLUP_DEFINITIONS.items():
+        workspace = next((ws for ws, details in kb.items() if definition["source"] in details.get("tables", {})), None)
+        if workspace is None:
+            continue
+        source_columns = {c["name"]: c for c in kb[workspace]["tables"][definition["source"]].get("columns", [])}
+        columns = [{k: v for k, v in source_columns.get(d, {"name": d}).items() if k in ("name", "type", "description")}
+                   for d in definition["dimensions"]]
+        columns += [{"name": c, "type": "BIGINT" if c.endswith("_count") else "DOUBLE",
+                     "description": f"Pre-aggregated {c.replace('_', ' ')}."} for c in measure_columns(definition)]
+        kb[workspace]["tables"][name] = {
+            "schema": ", ".join(f"{c['name']} ({c.get('type', '')})" for c in columns),
+            "rules": (f"{definition['description']} Count trips with sum(trip_count); average a measure "
+                      f"as sum(<col>_sum) / sum(<col>_count)."),
+            "sample_query": f"SELECT {definition['dimensions'][0]}, sum(trip_count) FROM {name} GROUP BY 1;",
+            "columns": columns,
+            "rollup": {k: definition[k] for k in ("source", "key", "dimensions", "measures", "counts")},
+        }
+    with open(kb_file, "w") as f:
+        json.dump(kb, f, indent=4)
+    print(f"[Rollups] Registered {len(ROLLUP_DEFINITIONS)} rollups in {kb_file}")
+
+
+def _mask(sql: str) -> str:
+    """Same-length copy of sql with string literals and quoted identifiers blanked out."""
+    blank = lambda m: " " * len(m.group(0))
+    return _QUOTED_IDENTIFIER_RE.sub(blank, _STRING_RE.sub(blank, sql))
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _output_alias(item: str):
+    """Match of a select item's alias ('expr AS name' or 'expr name'), or None."""
+    match = _ALIAS_RE.search(item)
+    if match is None or (not match.group(1) and match.group(2).lower() in _SQL_WORDS):
+        return None
+    return match
+
+
+def _split_top_level(text: str) -> list:
+    """Splits on commas outside parentheses and quotes."""
+    masked = _mask(text)
+    parts, depth, last = [], 0, 0
+    for i, ch in enumerate(masked):
+        depth += (ch == "(") - (ch == ")")
+        if ch == "," and depth == 0:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    return [p.strip() for p in parts]
+
+
+def parse_simple_select(sql: str):
+    """Clauses of a single-table SELECT ({'select': ..., 'where': ..., 'table', 'alias'}), or None
+    for anything more complex (joins, subqueries, set operations, windows, quoted column names)."""
+    sql = sql.strip().rstrip(";").strip()
+    # Quoted identifiers are only accepted as output aliases
+    if any(not m.group(1) for m in _QUOTED_IDENTIFIER_RE.finditer(_STRING_RE.sub("''", sql))):
+        return None
+    masked = _mask(sql)
+    if _UNSUPPORTED_RE.search(masked):
+        return None
+    depth_at, depth = [], 0
+    for ch in masked:
+        depth -= ch == ")"
+        depth_at.append(depth)
+        depth += ch == "("
+
+    found = []
+    for match in _CLAUSE_RE.finditer(masked):
+        keyword = re.sub(r"\s+", " ", match.group(1).lower())
+        if depth_at[match.start()] != 0:
+            if keyword == "select":
+                return None
+            continue
+        if keyword in (k for k, _ in found):
+            return None
+        found.append((keyword, match))
+    if not found or found[0][0] != "select" or "from" not in (k for k, _ in found):
+        return None
+
+    parts = {}
+    for i, (keyword, match) in enumerate(found):
+        end = found[i + 1][1].start() if i + 1 < len(found) else len(sql)
+        parts[keyword] = sql[match.end():end].strip()
+    source = re.fullmatch(r"([A-Za-z_][A-Za-z0-9_]*)(?:\s+(?:as\s+)?([A-Za-z_][A-Za-z0-9_]*))?", parts["from"],
+                          re.IGNORECASE)
+    if source is None:
+        return None
+    parts["table"] = source.group(1).lower()
+    parts["alias"] = (source.group(2) or "").lower()
+    return parts
+
+
+class RollupRewriter:
+    """Rewrites aggregate queries on a rollup's source table to read the smallest fresh rollup.
+
+    Eligible: a single-table SELECT whose filters, groupings and plain select items only use
+    the rollup's dimensions, and whose aggregates are count/sum/avg/min/max over its measures
+    (or count(DISTINCT)/min/max over dimensions). Everything else runs unchanged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fresh = {}  # generation token -> {rollup name: rollup rows}
+
+    def fresh_rollups(self, con, rollups: dict) -> dict:
+        """Rollups whose watermark, row count and checksum still match their source: {name: rollup_rows}.
+
+        Checked once per database generation; the db file changes whenever data or rollups are refreshed.
+        """
+        generation = get_connection_manager().generation_token()
+        with self._lock:
+            if generation in self._fresh:
+                return self._fresh[generation]
+        fresh = {}
+        try:
+            states = {row[0]: row[1:] for row in con.execute(
+                f"SELECT name, watermark, source_rows, checksum, rollup_rows FROM {ROLLUP_STATE_TABLE}").fetchall()}
+        except duckdb.Error:
+            states = {}
+        sources = {}
+        for name, meta in rollups.items():
+            if name not in states:
+                continue
+            if meta["source"] not in sources:
+                try:
+                    high, total, _, _, checksum = source_summary(con, meta["source"], meta["key"])
+                    sources[meta["source"]] = (high, total, checksum)
+                except duckdb.Error:
+                    sources[meta["source"]] = None
+            watermark, source_rows, checksum, rollup_rows = states[name]
+            if sources[meta["source"]] == (watermark, source_rows, checksum):
+                fresh[name] = rollup_rows
+        with self._lock:
+            self._fresh = {generation: fresh}
+        return fresh
+
+    def _aggregate(self, function: str, argument: str, meta: dict):
+        """Rollup expression equivalent to one aggregate call on the source, or None."""
+        arg = argument.strip().lower()
+        dims, measures, counts = meta["dimensions"], meta["measures"], meta["counts"]
+        if function == "count":
+            if arg in ("*", "1"):
+                return "coalesce(sum(trip_count), 0)::BIGINT"
+            if arg in measures or arg in counts:
+                return f"coalesce(sum({arg}_count), 0)::BIGINT"
+            if arg in dims:
+                return f"coalesce(sum(CASE WHEN {arg} IS NOT NULL THEN trip_count END), 0)::BIGINT"
+            distinct = re.fullmatch(r"distinct\s+([a-z_][a-z0-9_]*)", arg)
+            if distinct and distinct.group(1) in dims:
+                return f"count(DISTINCT {distinct.group(1)})"
+            return None
+        if arg in measures:
+            if function == "sum":
+                return f"sum({arg}_sum)"
+            if function == "avg":
+                return f"(sum({arg}_sum) / nullif(sum({arg}_count), 0))"
+            return f"{function}({arg}_{function})"
+        if function in ("min", "max") and arg in dims:
+            return f"{function}({arg})"
+        return None
+
+    def _expression(self, text: str, meta: dict, allowed: set):
+        """(rewritten expression, number of aggregates), or None if it references non-rollup columns."""
+        masked = _mask(text)
+        pieces, outside, last, aggregates = [], [], 0, 0
+        for match in _AGGREGATE_RE.finditer(masked):
+            if match.start() < last:
+                return None  # nested aggregate
+            depth, end = 1, match.end()
+            while end < len(masked) and depth:
+                depth += (masked[end] == "(") - (masked[end] == ")")
+                end += 1
+            replacement = self._aggregate(match.group(1).lower(), text[match.end():end - 1], meta)
+            if depth or replacement is None:
+                return None
+            pieces += [text[last:match.start()], replacement]
+            outside.append(masked[last:match.start()])
+            last = end
+            aggregates += 1
+        pieces.append(text[last:])
+        outside.append(masked[last:])
+        for word, call in _IDENTIFIER_RE.findall(" ".join(outside)):
+            if not call and word.lower() not in _SQL_WORDS and word.lower() not in allowed:
+                return None
+        return "".join(pieces), aggregates
+
+    def _rewrite_for(self, parts: dict, name: str, meta: dict, labels: list):
+        dims = set(meta["dimensions"])
+        items = _split_top_level(parts["select"])
+        if len(items) != len(labels):
+            return None
+        aliases = {m.group(2).strip('"').lower() for m in map(_output_alias, items) if m}
+
+        new_items, total = [], 0
+        for item, label in zip(items, labels):
+            alias = _output_alias(item)
+            expression = (item[:alias.start()] if alias else item).strip()
+            result = None if expression == "*" else self._expression(expression, meta, dims)
+            if result is None:
+                return None
+            rewritten, aggregates = result
+            total += aggregates
+            # Every column keeps the name DuckDB gives it in the original query
+            new_items.append(f"{rewritten.strip()} AS {_quote(label)}")
+        if not total:
+            return None
+
+        sql = f"SELECT {', '.join(new_items)} FROM {name}"
+        for clause, allowed in (("where", dims), ("group by", dims | aliases), ("having", dims | aliases),
+                                ("order by", dims | aliases)):
+            if clause not in parts:
+                continue
+            result = self._expression(parts[clause], meta, allowed)
+            if result is None or (clause in ("where", "group by") and result[1]):
+                return None
+            sql += f" {clause.upper()} {result[0]}"
+        for clause in ("limit", "offset"):
+            if clause in parts:
+                if not parts[clause].isdigit():
+                    return None
+                sql += f" {clause.upper()} {parts[clause]}"
+        return sql + ";"
+
+    def rewrite(self, con, sql: str, rollups: dict, fresh: dict):
+        """(rewritten_sql, rollup_name), or (sql, None) when no fresh rollup can answer the query."""
+        parts = parse_simple_select(sql)
+        if parts is None:
+            return sql, None
+        candidates = sorted((rows, name) for name, rows in fresh.items() if rollups[name]["source"] == parts["table"])
+        if not candidates:
+            return sql, None
+        try:
+            # Result column names of the original query (binding only, nothing runs)
+            labels = con.sql(sql.strip().rstrip(";")).columns
+        except duckdb.Error:
+            return sql, None
+        # Drop 'trips.' / alias qualifiers (outside string literals)
+        prefixes = "|".join(re.escape(p) for p in (parts["table"], parts["alias"]) if p)
+        qualifier = re.compile(rf"\b(?:{prefixes})\.", re.IGNORECASE)
+        for clause in ("select", "where", "group by", "having", "order by"):
+            if clause in parts:
+                text, pieces, last = parts[clause], [], 0
+                for literal in _STRING_RE.finditer(text):
+                    pieces += [qualifier.sub("", text[last:literal.start()]), literal.group(0)]
+                    last = literal.end()
+                parts[clause] = "".join(pieces) + qualifier.sub("", text[last:])
+
+        for _, name in candidates:
+            rewritten = self._rewrite_for(parts, name, rollups[name], labels)
+            if rewritten:
+                return rewritten, name
+        return sql, None
+
+
+_rewriter = None
+_rewriter_lock = threading.Lock()
+
+
+def get_rollup_rewriter() -> RollupRewriter:
+    """Returns the process-wide rollup rewriter."""
+    global _rewriter
+    if _rewriter is None:
+        with _rewriter_lock:
+            if _rewriter is None:
+                _rewriter = RollupRewriter()
+    return _rewriter
+
+
+if __name__ == "__main__":
+    # Offline maintenance: python -m agents.rollups [--full]
+    parser = argparse.ArgumentParser(description="Refreshes the trip rollups and registers them in the knowledge base.")
+    parser.add_argument("--full", action="store_true", help="Rebuild instead of merging only new rows.")
+    args = parser.parse_args()
+    refresh_rollups(full=args.full)
+    register_rollups()
@@ -0,0 +1,271 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+SEMANTIC_CACHE_FILE = os.getenv("SEMANTIC_CACHE_FILE", "semantic_cache.json")
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") != "0"
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Minimum TF-IDF cosine similarity for a near-duplicate question to reuse cached SQL
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "with", "is", "are",
+    "was", "were", "be", "me", "show", "give", "list", "find", "what", "which", "who", "how",
+    "please", "can", "you", "tell", "do", "does", "did", "that", "there",
+    "i", "we", "my", "our", "want", "need", "know", "see", "get", "return", "display",
+}
+
+# Comparison and direction words: 'over 10 miles' vs 'at 10 miles' or 'from Seattle to Boston'
+# vs 'to Seattle from Boston' ask different questions, so these are never stopwords
+OPERATOR_WORDS = {
+    "over", "under", "above", "below", "between", "from", "to", "by", "and", "or", "not",
+    "all", "during", "before", "after", "since", "until",
+}
+
+# Relative time words change the answer as much as a date literal does
+TIME_WORDS = {
+    "today", "yesterday", "tomorrow", "day", "week", "month", "quarter", "year",
+    "daily", "weekly", "monthly", "yearly", "last", "next", "previous", "current",
+}
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_.\-']+")
+
+
+def stem(token: str) -> str:
+    """Very small suffix stripper so 'trips'/'trip' and 'drivers'/'driver' collapse."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(question: str) -> list:
+    """Lowercased, stemmed content words of a question."""
+    tokens = [t.strip(".'-").lower() for t in _TOKEN_RE.findall(question)]
+    return [stem(t) for t in tokens if t and t not in STOPWORDS]
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form used for exact-match lookups: only case and whitespace are ignored."""
+    return " ".join(question.lower().split())
+
+
+def literal_tokens(question: str) -> frozenset:
+    """Tokens that change the meaning of a query when swapped: numbers, dates, time words, proper nouns
+    and operator words together with the word they apply to ('over 10', 'from seattle').
+
+    Two questions are only treated as near-duplicates when these match exactly, so
+    'trips in Seattle' never reuses the SQL of 'trips in Boston'.
+    """
+    literals = set()
+    raw_tokens = _TOKEN_RE.findall(question)
+    for i, raw in enumerate(raw_tokens):
+        token = raw.strip(".'-")
+        if not token:
+            continue
+        if (any(ch.isdigit() for ch in token) or (i > 0 and token[0].isupper()) or "'" in raw
+                or stem(token.lower()) in TIME_WORDS):
+            literals.add(token.lower())
+        if token.lower() in OPERATOR_WORDS:
+            following = raw_tokens[i + 1].strip(".'-").lower() if i + 1 < len(raw_tokens) else ""
+            literals.add(f"{token.lower()} {stem(following)}".strip())
+    return frozenset(literals)
+
+
+def _features(question: str) -> Counter:
+    """Unigram and bigram term counts for the TF-IDF index."""
+    tokens = tokenize(question)
+    return Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+
+class SemanticCache:
+    """Question -> SQL cache that lets repeated questions skip the LLM agent chain.
+
+    Entries are keyed on the normalized question plus the workspace scope and the
+    knowledge base version, evicted LRU-first or after a TTL, and persisted to disk.
+    Near-duplicates are found with a TF-IDF cosine similarity over cached questions.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_FILE, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS, threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        # Inverted index and document frequencies over cached question features
+        self._postings = {}
+        self._df = Counter()
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._load()
+
+    @staticmethod
+    def _key(normalized: str, scope: str, kb_version: str) -> str:
+        return f"{kb_version}|{scope}|{normalized}"
+
+    def _index(self, key, features):
+        for term in features:
+            self._postings.setdefault(term, set()).add(key)
+            self._df[term] += 1
+
+    def _unindex(self, key, features):
+        for term in features:
+            keys = self._postings.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[term]
+            self._df[term] -= 1
+            if self._df[term] <= 0:
+                del self._df[term]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unindex(key, entry["features"])
+
+    def _idf(self, term) -> float:
+        return math.log((1 + len(self._entries)) / (1 + self._df.get(term, 0))) + 1.0
+
+    def _vector(self, features) -> dict:
+        vec = {t: c * self._idf(t) for t, c in features.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
+
+    def _expired(self, entry, now) -> bool:
+        return self.ttl_seconds > 0 and now - entry["created_at"] > self.ttl_seconds
+
+    def lookup(self, question: str, scope: str, kb_version: str):
+        """Returns (entry, 'exact' | 'near') on a hit, or (None, 'miss')."""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            key = self._key(normalized, scope, kb_version)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry, "exact"
+
+            features = _features(question)
+            literals = literal_tokens(question)
+            candidates = set()
+            for term in features:
+                candidates |= self._postings.get(term, set())
+            prefix = self._key("", scope, kb_version)
+            query_vec = self._vector(features)
+            best_key, best_score = None, 0.0
+            for cand in candidates:
+                if not cand.startswith(prefix):
+                    continue
+                cand_entry = self._entries[cand]
+                if self._expired(cand_entry, now) or frozenset(cand_entry["literals"]) != literals:
+                    continue
+                cand_vec = self._vector(cand_entry["features"])
+                score = sum(w * cand_vec.get(t, 0.0) for t, w in query_vec.items())
+                if score > best_score:
+                    best_key, best_score = cand, score
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                self.stats["near_hits"] += 1
+                return self._entries[best_key], "near"
+
+            self.stats["misses"] += 1
+            return None, "miss"
+
+    def store(self, question: str, scope: str, kb_version: str, sql_query: str, workspace_name: str,
+              relevant_tables=None, pruned_schema: str = ""):
+        """Caches the SQL generated for a question and persists the cache."""
+        key = self._key(normalize_question(question), scope, kb_version)
+        features = _features(question)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "question": question,
+                "sql_query": sql_query,
+                "workspace_name": workspace_name,
+                "relevant_tables": list(relevant_tables or []),
+                "pruned_schema": pruned_schema,
+                "features": dict(features),
+                "literals": sorted(literal_tokens(question)),
+                "created_at": time.time(),
+            }
+            self._index(key, features)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+            self._save()
+
+    def invalidate(self, question: str, scope: str, kb_version: str, sql_query: str):
+        """Drops any cached entry that produced `sql_query` for this question (e.g. it failed)."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key.startswith(self._key("", scope, kb_version)) and entry["sql_query"] == sql_query:
+                    self._remove(key)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._df.clear()
+            self._save()
+
+    def summary(self) -> str:
+        """One-line hit/miss summary for the execution log."""
+        s = self.stats
+        lookups = s["exact_hits"] + s["near_hits"] + s["misses"]
+        hit_rate = (s["exact_hits"] + s["near_hits"]) / lookups if lookups else 0.0
+        return (f"{s['exact_hits']} exact / {s['near_hits']} near hits, {s['misses']} misses "
+                f"({hit_rate:.0%} hit rate, {len(self._entries)} entries)")
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Semantic Cache] Ignoring unreadable cache file {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in data.get("entries", []):
+            if self._expired(entry, now):
+                continue
+            self._entries[key] = entry
+            self._index(key, entry["features"])
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": list(self._entries.items())}, f)
+        os.replace(tmp_path, self.path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Returns the process-wide semantic cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
@@ -1,13 +1,21 @@
 from typing import TypedDict, List
-from langgraph.graph.message import AnyMessage, MessagesState
 from typing_extensions import Annotated
 import operator
+import uuid
+
+
+def merge_stats(left: dict, right: dict) -> dict:
+    """Reducer that lets every node add its own keys to the per-query stats."""
+    return {**(left or {}), **(right or {})}
+
 
 # Define the state that will be passed between nodes in the graph
 class AgentState(TypedDict):
     """Represents the state of the conversation and query generation."""
     
     user_question: str 
+    cache_status: str # 0. Semantic Cache Output ('exact', 'near' or 'miss')
+    cache_scope: str # Workspace the question was pinned to when looked up ('*' if none)
     workspace_name: str # 1. Intent Agent Output
     # 2. Table/RAG Agent Output
     relevant_tables: List[str]
@@ -18,7 +26,35 @@ class AgentState(TypedDict):
     
     # 4. Query Generation Agent Output
     sql_query: str 
+    validation_error: str # DuckDB's error binding sql_query against the KB schema ('' if valid)
+    repair_attempts: int # Repair prompts spent on this question
     
     # 5. Executor/Validator Output
-    db_result: str
-    final_answer: str
\ No newline at end of file
+    db_result: str # Preview (plus column summaries for large results) handed to final_synth
+    result_id: str # Key of the full result in agents.results.get_result_store()
+    final_answer: str
+
+    # Per-query prompt-size and latency stats, filled in by the nodes that produce them
+    query_stats: Annotated[dict, merge_stats]
+    trace_id: str # Ties the per-node spans of agents.tracing to this question
+
+
+def make_initial_state(question: str, workspace_name: str = "") -> AgentState:
+    """Empty state for a new question (a workspace_name known to the KB skips the router's LLM call)."""
+    return AgentState(
+        user_question=question,
+        cache_status="",
+        cache_scope="",
+        workspace_name=workspace_name,
+        relevant_tables=[],
+        context_schema="",
+        pruned_schema="",
+        sql_query="",
+        validation_error="",
+        repair_attempts=0,
+        db_result="",
+        result_id="",
+        final_answer="",
+        query_stats={},
+        trace_id=uuid.uuid4().hex
+    )
@@ -0,0 +1,110 @@
+import datetime
+import os
+import re
+import threading
+from collections import Counter
+
+# Answer small, obviously-shaped results locally instead of calling the LLM
+FAST_SYNTH_ENABLED = os.getenv("FAST_SYNTH_ENABLED", "1") != "0"
+FAST_SYNTH_MAX_ROWS = int(os.getenv("FAST_SYNTH_MAX_ROWS", "10"))
+FAST_SYNTH_MAX_COLUMNS = int(os.getenv("FAST_SYNTH_MAX_COLUMNS", "4"))
+
+_TOP_N_RE = re.compile(r"\b(top|best|worst|highest|lowest|most|least)\b", re.IGNORECASE)
+_ORDER_BY_RE = re.compile(r"\border\s+by\s+([A-Za-z_][A-Za-z0-9_.]*)(\s+desc)?", re.IGNORECASE)
+
+# How often each path fired: 'template:<shape>' or 'llm'
+synth_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def record_synth_path(path: str):
+    with _counts_lock:
+        synth_counts[path] += 1
+
+
+def fast_path_rate() -> float:
+    """Share of synthesized answers that skipped the LLM."""
+    total = sum(synth_counts.values())
+    fast = sum(c for path, c in synth_counts.items() if path.startswith("template"))
+    return fast / total if total else 0.0
+
+
+_AGGREGATE_LABELS = {"count": "count of", "sum": "total", "avg": "average", "mean": "average", "min": "minimum", "max": "maximum"}
+_AGGREGATE_COLUMN_RE = re.compile(r"^([a-z_]+)\(\s*(distinct\s+)?([A-Za-z_][A-Za-z0-9_.]*)\s*\)$", re.IGNORECASE)
+
+
+def column_label(name: str):
+    """'current_rating' -> 'current rating', 'count_star()' -> 'count', 'avg(fare_usd)' -> 'average fare usd'.
+
+    None for other unaliased expressions (e.g. 'round(avg(fare_usd), 2)'), which the LLM labels better.
+    """
+    if name.lower().startswith("count_star"):
+        return "count"
+    aggregate = _AGGREGATE_COLUMN_RE.match(name)
+    if aggregate:
+        function = _AGGREGATE_LABELS.get(aggregate.group(1).lower())
+        if function is None:
+            return None
+        argument = aggregate.group(3).split(".")[-1].replace("_", " ")
+        return f"{function} {'distinct ' if aggregate.group(2) else ''}{argument}"
+    if "(" in name:
+        return None
+    return name.replace("_", " ").strip() or "value"
+
+
+def format_value(value) -> str:
+    if value is None or value != value:
+        return "n/a"
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip("0").rstrip(".") if value != int(value) else f"{int(value):,}"
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time(0):
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def template_answer(question: str, sql_query: str, table):
+    """Builds the answer locally for common result shapes.
+
+    Returns (answer, shape) or (None, None) when the result needs the LLM. `table` is the
+    complete Arrow result (callers must not pass a truncated preview).
+    """
+    if table is None or table.num_rows > FAST_SYNTH_MAX_ROWS or table.num_columns > FAST_SYNTH_MAX_COLUMNS:
+        return None, None
+    columns = table.column_names
+    if any(column_label(c) is None for c in columns):
+        return None, None
+    rows = table.to_pylist()
+
+    if not rows:
+        return "No matching records were found for your question.", "empty"
+
+    if len(rows) == 1 and len(columns) == 1:
+        return f"The {column_label(columns[0])} is **{format_value(rows[0][columns[0]])}**.", "scalar"
+
+    if len(rows) == 1:
+        details = ", ".join(f"{column_label(c)} **{format_value(rows[0][c])}**" for c in columns)
+        return f"I found one matching record: {details}.", "single_row"
+
+    order_by = _ORDER_BY_RE.search(sql_query)
+    if order_by and _TOP_N_RE.search(question):
+        key = order_by.group(1).split(".")[-1]
+        direction = "highest" if order_by.group(2) else "lowest"
+        header = f"Here are the top {len(rows)} results ({direction} {column_label(key)} first):"
+        shape = "top_n"
+    elif len(columns) == 1:
+        values = ", ".join(format_value(r[columns[0]]) for r in rows)
+        return f"I found {len(rows)} {column_label(columns[0])} values: {values}.", "list"
+    else:
+        header = f"I found {len(rows)} matching records:"
+        shape = "small_table"
+
+    lines = [header]
+    for row in rows:
+        first, rest = columns[0], columns[1:]
+        extras = ", ".join(f"{column_label(c)} {format_value(row[c])}" for c in rest)
+        lines.append(f"- **{format_value(row[first])}**" + (f" ({extras})" if extras else ""))
+    return "\n".join(lines), shape
@@ -1,47 +1,95 @@
-import duckdb
-import json
 from agents.state import AgentState
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain_groq import ChatGroq
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-DATABASE_FILE = "uber_trips.db"
-KNOWLEDGE_BASE_FILE = "knowledge_base.json"
-
-# LLM Setup for Tools
-llm_tools = ChatGroq(model="llama-3.3-70b-versatile", temperature=0, api_key=os.getenv("GROQ_API_KEY"))
+from agents.db import DATABASE_FILE, get_connection_manager, fetch_record_batches, run_in_db_thread
+from agents.knowledge_base import KNOWLEDGE_BASE_FILE, get_knowledge_base
+from agents.column_pruner import get_column_usage
+from agents.result_cache import get_result_cache, is_cacheable, RESULT_CACHE_ENABLED
+from agents.results import fetch_bounded, get_result_store, RESULT_BATCH_SIZE
+from agents.tracing import record_db
+from agents.query_guard import QueryRejected, QueryWatchdog, get_query_guard, limit_note, REJECTED_PREFIX
+from contextlib import contextmanager
+import time
 
 # Database Tool
-def get_db_connector():
-    """Initializes the DuckDB connector."""
-    return duckdb.connect(database=DATABASE_FILE)
+@contextmanager
+def db_session():
+    """Yields this thread's cursor on the shared, long-lived DuckDB connection, kept open for the block."""
+    manager = get_connection_manager()
+    if manager.is_stale():
+        manager.health_check()
+    with manager.session() as cursor:
+        yield cursor
+
+def source_sql(state: AgentState) -> str:
+    """The SQL as query_gen (or the semantic cache) produced it, before any rollup rewrite or guard LIMIT."""
+    stats = state.get("query_stats", {})
+    return stats.get("sql_before_rollup") or stats.get("sql_before_guard") or state["sql_query"]
 
 def execute_sql_query(state: AgentState) -> dict:
-    """Executes the generated SQL query and updates the state."""
+    """Executes the generated SQL query and updates the state.
+
+    SELECT results are streamed as Arrow batches: only a bounded number of rows is kept
+    (available for download through the result store), and final_synth gets a preview
+    plus column summaries computed over the whole stream.
+    """
     query = state["sql_query"]
     print(f"\n--- Executing SQL: {query} ---")
+    result_id = ""
     
     try:
-        con = get_db_connector()
-        # Use fetchall for non-SELECT (like PRAGMA) and fetchdf for SELECT
-        if query.strip().upper().startswith("SELECT"):
-            result_df = con.execute(query).fetchdf()
-            db_result = result_df.to_markdown(index=False)
-        else:
-            con.execute(query)
-            db_result = "Query executed successfully (non-SELECT)."
-        con.close()
+        with db_session() as con:
+            use_cache = RESULT_CACHE_ENABLED and is_cacheable(query)
+            if use_cache:
+                generation = get_connection_manager().generation_token()
+                cached = get_result_cache().get(query, generation)
+                if cached is not None:
+                    print(f"--- Result Cache hit ({get_result_cache().summary()}) ---")
+                    record_db(0.0, 0.0, cached["table"].num_rows)
+                    db_result = "\n".join(filter(None, [cached["db_result"], limit_note(state.get("query_stats", {}))]))
+                    return {"db_result": db_result, "result_id": get_result_store().put(cached["table"])}
+
+            # Use fetchall for non-SELECT (like PRAGMA) and Arrow batches for SELECT
+            if query.strip().upper().startswith(("SELECT", "WITH")):
+                # Heavy queries wait for a slot; the watchdog interrupts anything that outlives the timeout
+                with get_query_guard().slot(state.get("query_stats", {}).get("guard_heavy", False)), QueryWatchdog(con):
+                    start = time.perf_counter()
+                    cursor = con.execute(query)
+                    executed = time.perf_counter()
+                    result = fetch_bounded(fetch_record_batches(cursor, RESULT_BATCH_SIZE))
+                record_db(executed - start, time.perf_counter() - executed, result.total_rows)
+                db_result = result.to_db_result()
+                result_id = get_result_store().put(result.table)
+                if use_cache and not result.scan_truncated:
+                    get_result_cache().put(query, generation, result.table, db_result)
+                # Mine column usage from SQL that ran successfully (feeds the column pruner)
+                get_column_usage().record(source_sql(state), get_knowledge_base())
+                # The guard's LIMIT cut the stream short: say so next to the row count and summaries
+                db_result = "\n".join(filter(None, [db_result, limit_note(state.get("query_stats", {}))]))
+            else:
+                start = time.perf_counter()
+                con.execute(query)
+                record_db(time.perf_counter() - start, 0.0, 0)
+                db_result = "Query executed successfully (non-SELECT)."
         
+    except QueryRejected as e:
+        db_result = f"{REJECTED_PREFIX}: {e}"
     except Exception as e:
         db_result = f"SQL ERROR: {str(e)}"
         
     print(f"--- DB Result: {db_result[:100]}... ---")
-    return {"db_result": db_result}
+    return {"db_result": db_result, "result_id": result_id}
+
+async def aexecute_sql_query(state: AgentState) -> dict:
+    """Async version of execute_sql_query; the DuckDB work runs on the DB thread pool."""
+    return await run_in_db_thread(execute_sql_query, state)
 
 # RAG/Knowledge Base Tool
+def get_kb_version() -> str:
+    """Version token of the loaded knowledge base (changes whenever the file is rewritten)."""
+    try:
+        return get_knowledge_base().version
+    except FileNotFoundError:
+        return "missing"
+
 def retrieve_knowledge_base(state: AgentState) -> dict:
     """Retrieves relevant schema and rules (RAG) based on the workspace."""
     
@@ -50,20 +98,15 @@ def retrieve_knowledge_base(state: AgentState) -> dict:
     if not workspace_name:
         return {"context_schema": "Error: No workspace identified."}
 
-    with open(KNOWLEDGE_BASE_FILE, 'r') as f:
-        kb = json.load(f)
+    kb = get_knowledge_base()
 
-    # Simple lookup based on workspace and all its tables/rules
-    if workspace_name in kb:
-        context = f"WORKSPACE: {workspace_name}\n"
-        
-        # Combine all table schemas and rules for the initial context
-        for table, details in kb[workspace_name]['tables'].items():
-            context += f"\nTABLE: {table}\n"
-            context += f"SCHEMA: {details['schema']}\n"
-            context += f"RULES: {details['rules']}\n"
-        
+    # Simple lookup based on workspace; the combined schema/rules block is precomputed
+    if kb.has_workspace(workspace_name):
         # This context is sent to the LLM for the Table/Column Prune steps
-        return {"context_schema": context}
+        return {"context_schema": kb.workspace_context(workspace_name)}
+
+    return {"context_schema": "Error: Workspace not found in knowledge base."}
 
-    return {"context_schema": "Error: Workspace not found in knowledge base."}
\ No newline at end of file
+async def aretrieve_knowledge_base(state: AgentState) -> dict:
+    """Async version of retrieve_knowledge_base (an in-memory lookup, so it runs inline)."""
+    return retrieve_knowledge_base(state)
@@ -0,0 +1,247 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-node spans: wall time, LLM time/tokens, prompt size and DuckDB time for every graph step
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+# JSONL sink, one span per line ("" disables it)
+TRACE_FILE = os.getenv("TRACE_FILE", "node_traces.jsonl")
+# Port for the Prometheus-text /metrics endpoint (0 = don't start it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Histogram buckets for node wall time, in seconds
+NODE_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Span of the node currently running in this context (LLM and DB helpers add to it)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """What one node did for one question."""
+
+    def __init__(self, trace_id: str, node: str):
+        self.trace_id = trace_id
+        self.node = node
+        self.start = time.time()
+        self.wall_ms = 0.0
+        self.llm_ms = 0.0
+        self.llm_calls = 0
+        self.prompt_chars = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.db_execute_ms = 0.0
+        self.db_fetch_ms = 0.0
+        self.rows = 0
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {key: round(value, 2) if isinstance(value, float) else value for key, value in vars(self).items()}
+
+
+def record_llm_call(elapsed_s: float, prompt, response):
+    """Adds one LLM call to the running span (prompt is a string or the chain's input dict)."""
+    span = current_span.get()
+    if span is None:
+        return
+    span.llm_ms += elapsed_s * 1000
+    span.llm_calls += 1
+    if isinstance(prompt, dict):
+        span.prompt_chars += sum(len(str(value)) for value in prompt.values())
+    else:
+        span.prompt_chars += len(str(prompt))
+    usage = getattr(response, "usage_metadata", None) or {}
+    span.prompt_tokens += usage.get("input_tokens", 0)
+    span.completion_tokens += usage.get("output_tokens", 0)
+
+
+def record_db(execute_s: float, fetch_s: float, rows: int):
+    """Adds DuckDB execute/fetch time and rows returned to the running span."""
+    span = current_span.get()
+    if span is None:
+        return
+    span.db_execute_ms += execute_s * 1000
+    span.db_fetch_ms += fetch_s * 1000
+    span.rows += rows
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Tracer:
+    """Collects finished spans: keeps the recent ones in memory, appends them to the JSONL
+    sink and aggregates them into Prometheus counters and histograms."""
+
+    def __init__(self, trace_file: str = TRACE_FILE, max_recent: int = 5000):
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=max_recent)
+        self._calls = defaultdict(int)  # (node, status) -> count
+        self._totals = defaultdict(lambda: defaultdict(float))  # node -> metric -> total
+        self._buckets = defaultdict(lambda: [0] * len(NODE_DURATION_BUCKETS))  # node -> cumulative bucket counts
+
+    def emit(self, span: Span):
+        record = span.to_dict()
+        with self._lock:
+            self._recent.append(record)
+            self._calls[(span.node, "error" if span.error else "ok")] += 1
+            totals = self._totals[span.node]
+            totals["wall_seconds"] += span.wall_ms / 1000
+            totals["llm_seconds"] += span.llm_ms / 1000
+            totals["llm_calls"] += span.llm_calls
+            totals["prompt_chars"] += span.prompt_chars
+            totals["prompt_tokens"] += span.prompt_tokens
+            totals["completion_tokens"] += span.completion_tokens
+            totals["db_execute_seconds"] += span.db_execute_ms / 1000
+            totals["db_fetch_seconds"] += span.db_fetch_ms / 1000
+            totals["db_rows"] += span.rows
+            buckets = self._buckets[span.node]
+            for i, bound in enumerate(NODE_DURATION_BUCKETS):
+                if span.wall_ms / 1000 <= bound:
+                    buckets[i] += 1
+            if self.trace_file:
+                try:
+                    with open(self.trace_file, "a") as f:
+                        f.write(json.dumps(record) + "\n")
+                except OSError as e:
+                    print(f"[Tracing] Could not write {self.trace_file}: {e}")
+
+    def spans_for(self, trace_id: str) -> list:
+        """Recent spans of one question, in the order the nodes finished."""
+        with self._lock:
+            return [record for record in self._recent if record["trace_id"] == trace_id]
+
+    def recent(self) -> list:
+        with self._lock:
+            return list(self._recent)
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP querygpt_node_calls_total Graph node executions.",
+                "# TYPE querygpt_node_calls_total counter",
+            ]
+            for (node, status), count in sorted(self._calls.items()):
+                lines.append(f"querygpt_node_calls_total{_labels(node=node, status=status)} {count}")
+
+            lines += [
+                "# HELP querygpt_node_duration_seconds Wall time of graph nodes.",
+                "# TYPE querygpt_node_duration_seconds histogram",
+            ]
+            for node, buckets in sorted(self._buckets.items()):
+                count = self._calls[(node, "ok")] + self._calls[(node, "error")]
+                for bound, bucket_count in zip(NODE_DURATION_BUCKETS, buckets):
+                    lines.append(f"querygpt_node_duration_seconds_bucket{_labels(node=node, le=bound)} {bucket_count}")
+                lines.append(f"querygpt_node_duration_seconds_bucket{_labels(node=node, le='+Inf')} {count}")
+                lines.append(f"querygpt_node_duration_seconds_sum{_labels(node=node)} {self._totals[node]['wall_seconds']:.6f}")
+                lines.append(f"querygpt_node_duration_seconds_count{_labels(node=node)} {count}")
+
+            counters = [
+                ("querygpt_llm_seconds_total", "Time spent waiting on the LLM.", "llm_seconds", {}),
+                ("querygpt_llm_calls_total", "LLM calls.", "llm_calls", {}),
+                ("querygpt_prompt_chars_total", "Characters sent to the LLM.", "prompt_chars", {}),
+                ("querygpt_llm_tokens_total", "LLM tokens reported by the provider.", "prompt_tokens", {"kind": "prompt"}),
+                ("querygpt_llm_tokens_total", None, "completion_tokens", {"kind": "completion"}),
+                ("querygpt_db_seconds_total", "Time spent in DuckDB.", "db_execute_seconds", {"phase": "execute"}),
+                ("querygpt_db_seconds_total", None, "db_fetch_seconds", {"phase": "fetch"}),
+                ("querygpt_db_rows_total", "Rows returned by DuckDB.", "db_rows", {}),
+            ]
+            for metric, help_text, key, extra in counters:
+                if help_text:
+                    lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for node, totals in sorted(self._totals.items()):
+                    if totals[key]:
+                        lines.append(f"{metric}{_labels(node=node, **extra)} {totals[key]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def traced(name: str, fn):
+    """Wraps a graph node (sync or async) so every call is recorded as a span."""
+    if not TRACING_ENABLED:
+        return fn
+
+    def start(state):
+        span = Span(state.get("trace_id", ""), name)
+        return span, current_span.set(span), time.perf_counter()
+
+    def finish(span, token, started):
+        span.wall_ms = (time.perf_counter() - started) * 1000
+        current_span.reset(token)
+        get_tracer().emit(span)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            span, token, started = start(state)
+            try:
+                return await fn(state)
+            except Exception as e:
+                span.error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                finish(span, token, started)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        span, token, started = start(state)
+        try:
+            return fn(state)
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            finish(span, token, started)
+    return wrapper
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+    return _tracer
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_tracer().prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serves /metrics on a background thread (once per process); no-op when port is 0."""
+    global _metrics_server
+    if not port:
+        return None
+    with _tracer_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+            print(f"[Tracing] Prometheus metrics on http://0.0.0.0:{port}/metrics")
+    return _metrics_server
@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import Counter
+
+import duckdb
+
+SQL_VALIDATION_ENABLED = os.getenv("SQL_VALIDATION_ENABLED", "1") != "0"
+# Repair prompts allowed per question before the SQL is handed to query_exec as it is
+SQL_REPAIR_MAX_ATTEMPTS = int(os.getenv("SQL_REPAIR_MAX_ATTEMPTS", "2"))
+
+# query_exec streams results only for statements starting with these; anything else runs as a command
+_QUERY_KEYWORDS = ("SELECT", "WITH")
+
+# Validation outcomes since startup: 'valid' (first try), 'repaired' or 'unrepaired'
+validation_counts = Counter()
+# Repair attempt number -> [attempts, total ms]
+_repair_attempt_ms = {}
+_stats_lock = threading.Lock()
+
+
+def record_validation(outcome: str):
+    with _stats_lock:
+        validation_counts[outcome] += 1
+
+
+def record_repair_attempt(attempt: int, elapsed_ms: float):
+    with _stats_lock:
+        totals = _repair_attempt_ms.setdefault(attempt, [0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed_ms
+
+
+def repair_success_rate() -> float:
+    """Share of questions with invalid SQL that a repair fixed."""
+    with _stats_lock:
+        failed = validation_counts["repaired"] + validation_counts["unrepaired"]
+        return validation_counts["repaired"] / failed if failed else 0.0
+
+
+def repair_attempt_ms() -> dict:
+    """Mean latency added by each repair attempt: {attempt number: ms}."""
+    with _stats_lock:
+        return {attempt: round(total / count, 1) for attempt, (count, total) in sorted(_repair_attempt_ms.items())}
+
+
+class SchemaValidator:
+    """Parses and binds SQL against the knowledge base schema, without touching the database.
+
+    Every KB table is created empty in an in-memory DuckDB catalog (rebuilt when the KB
+    changes). Building a relation from the SQL parses and binds it without planning or
+    running it, so syntax errors and unknown tables/columns/functions come back in well
+    under a millisecond, with DuckDB's own message and candidate bindings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._con = None
+        self._version = None
+
+    def _build(self, kb) -> duckdb.DuckDBPyConnection:
+        con = duckdb.connect(":memory:")
+        for table, details in kb.tables.items():
+            columns = [(c["name"], c.get("type") or "VARCHAR") for c in details["columns"]]
+            if not columns:
+                continue
+            try:
+                con.execute(f'CREATE TABLE {_quote(table)} ({", ".join(f"{_quote(n)} {t}" for n, t in columns)})')
+            except duckdb.Error:
+                # Types DuckDB does not know still bind as VARCHAR
+                con.execute(f'CREATE TABLE {_quote(table)} ({", ".join(f"{_quote(n)} VARCHAR" for n, _ in columns)})')
+        print(f"[Validation] Built schema catalog for {len(kb.tables)} tables")
+        return con
+
+    def _cursor(self, kb) -> duckdb.DuckDBPyConnection:
+        """This thread's cursor on the catalog of the current KB version."""
+        if self._version != kb.version:
+            with self._lock:
+                if self._version != kb.version:
+                    self._con = self._build(kb)
+                    self._version = kb.version
+        cur = getattr(self._local, "cursor", None)
+        if cur is None or self._local.version != self._version:
+            cur = self._con.cursor()
+            self._local.cursor = cur
+            self._local.version = self._version
+        return cur
+
+    def validate(self, sql: str, kb) -> str:
+        """DuckDB's error for sql against the KB schema, or '' when sql is a single SELECT that parses and binds."""
+        cursor = self._cursor(kb)
+        try:
+            statements = cursor.extract_statements(sql)
+            if not statements:
+                return "Parser Error: no SQL statement found"
+            if len(statements) > 1:
+                kinds = ", ".join(statement.type.name for statement in statements)
+                return f"Parser Error: expected a single SELECT query, found {len(statements)} statements ({kinds})"
+            # PRAGMA, SHOW, DESCRIBE or FROM-first queries parse as SELECT too (PRAGMA even expands
+            # into one), but query_exec would run them as commands: check the text as written
+            text = sql.strip()
+            if statements[0].type != duckdb.StatementType.SELECT or not text.upper().startswith(_QUERY_KEYWORDS):
+                return f"Parser Error: expected a query starting with SELECT or WITH, found: {text.splitlines()[0][:60]}"
+            # Lazy relation: bound here, never executed
+            cursor.sql(statements[0].query)
+        except duckdb.Error as e:
+            return str(e)
+        return ""
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+_validator = None
+_validator_lock = threading.Lock()
+
+
+def get_schema_validator() -> SchemaValidator:
+    """Returns the process-wide schema validator."""
+    global _validator
+    if _validator is None:
+        with _validator_lock:
+            if _validator is None:
+                _validator = SchemaValidator()
+    return _validator
@@ -1,26 +1,120 @@
-from langgraph.graph import StateGraph, START, END
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
 from agents.state import AgentState
-from agents.tools import execute_sql_query, retrieve_knowledge_base
-from dotenv import load_dotenv
+from agents.tools import execute_sql_query, aexecute_sql_query, retrieve_knowledge_base, aretrieve_knowledge_base, get_kb_version, db_session, source_sql
+from agents.db import run_in_db_thread, fetch_record_batches
+from agents.knowledge_base import get_knowledge_base
+from agents.column_pruner import get_column_pruner
+from agents.retriever import get_schema_retriever
+from agents.rate_limit import current_llm_limiter
+from agents.llm import get_llm, warm_up_llm
+from agents.rollups import get_rollup_rewriter, ROLLUP_REWRITE_ENABLED
+from agents.validation import get_schema_validator, record_validation, record_repair_attempt, repair_success_rate, SQL_VALIDATION_ENABLED, SQL_REPAIR_MAX_ATTEMPTS
+from agents.query_guard import get_query_guard, is_failed_result, limit_note, QUERY_GUARD_ENABLED, REJECTED_PREFIX
+from agents.semantic_cache import get_semantic_cache, SEMANTIC_CACHE_ENABLED
+from agents.results import get_result_store, fetch_bounded, RESULT_BATCH_SIZE
+from agents.tracing import traced, record_llm_call
+from agents.synthesis import template_answer, record_synth_path, fast_path_rate, FAST_SYNTH_ENABLED
+import asyncio
 import os
+import threading
+import time
 
-load_dotenv()
-# Use Groq model for the complex reasoning (Query Generation)
-llm_main = ChatGroq(model="llama-3.3-70b-versatile", temperature=0.1, api_key=os.getenv("GROQ_API_KEY"))
-# Use a faster/smaller simple routing/pruning
-llm_pruner = ChatGroq(model="llama-3.3-70b-versatile", temperature=0, api_key=os.getenv("GROQ_API_KEY"))
+# LLM clients are created on first use (agents.llm): 'main' for the complex reasoning
+# (query generation and repair), 'pruner' for routing, pruning and synthesis
 
 
-# Intent Agent (Router)
-def route_to_workspace(state: AgentState) -> dict:
-    """Classifies the user question to a 'Workspace' (Domain Routing)."""
+def _invoke(runnable, prompt):
+    """LLM call, timed into the current node's span."""
+    start = time.perf_counter()
+    response = runnable.invoke(prompt)
+    record_llm_call(time.perf_counter() - start, prompt, response)
+    return response
+
+
+async def _ainvoke(runnable, prompt):
+    """Async LLM call, throttled and retried by the batch's rate limiter when one is active."""
+    limiter = current_llm_limiter.get()
+    start = time.perf_counter()
+    if limiter is None:
+        response = await runnable.ainvoke(prompt)
+    else:
+        response = await limiter.run(lambda: runnable.ainvoke(prompt))
+    record_llm_call(time.perf_counter() - start, prompt, response)
+    return response
+
+
+# Semantic Cache (skips the LLM chain for repeated questions)
+def cache_lookup_agent(state: AgentState) -> dict:
+    """Looks the question up in the semantic cache and restores the cached SQL on a hit."""
     question = state["user_question"]
-    print(f"\n[Agent: Router] Routing question: {question}")
-    
+    scope = state.get("workspace_name") or "*"
+    if not SEMANTIC_CACHE_ENABLED:
+        return {"cache_status": "disabled", "cache_scope": scope}
+
+    cache = get_semantic_cache()
+    entry, status = cache.lookup(question, scope, get_kb_version())
+    print(f"\n[Semantic Cache] {status} ({cache.summary()})")
+    if entry is None:
+        return {"cache_status": status, "cache_scope": scope}
+
+    return {
+        "cache_status": status,
+        "cache_scope": scope,
+        "workspace_name": entry["workspace_name"],
+        "relevant_tables": entry["relevant_tables"],
+        "pruned_schema": entry["pruned_schema"],
+        "sql_query": entry["sql_query"],
+    }
+
+
+def cache_update_agent(state: AgentState) -> dict:
+    """Stores freshly generated SQL that ran successfully; drops cached SQL that failed."""
+    cache_status = state.get("cache_status", "miss")
+    if not SEMANTIC_CACHE_ENABLED:
+        return {"cache_status": cache_status}
+
+    cache = get_semantic_cache()
+    scope = state.get("cache_scope") or "*"
+    failed = is_failed_result(state["db_result"])
+    # Cache the SQL as generated, not its rollup rewrite (rollups may go stale)
+    sql_query = source_sql(state)
+    if cache_status in ("exact", "near") and failed:
+        cache.invalidate(state["user_question"], scope, get_kb_version(), sql_query)
+    elif cache_status == "miss" and not failed:
+        cache.store(
+            state["user_question"], scope, get_kb_version(), sql_query, state["workspace_name"],
+            relevant_tables=state.get("relevant_tables"), pruned_schema=state.get("pruned_schema", ""),
+        )
+    return {"cache_status": cache_status}
+
+
+async def acache_lookup_agent(state: AgentState) -> dict:
+    """Async version of cache_lookup_agent."""
+    return cache_lookup_agent(state)
+
+
+async def acache_update_agent(state: AgentState) -> dict:
+    """Async version of cache_update_agent (the cache file write runs in a worker thread)."""
+    return await asyncio.to_thread(cache_update_agent, state)
+
+
+def check_cache(state: AgentState) -> str:
+    """Routes cache hits straight to execution."""
+    if state.get("cache_status") in ("exact", "near"):
+        return "hit"
+    return "miss"
+
+
+def fan_out_after_cache(state: AgentState) -> list:
+    """Parallel mode: on a miss, route the question and select tables at the same time."""
+    if check_cache(state) == "hit":
+        return ["query_rewrite"]
+    return ["router", "table_retrieval"]
+
+
+# Intent Agent (Router)
+def _router_prompt(question: str) -> str:
     # Prompt to force structured output for routing
-    prompt_str = f"""You are an Intent Agent. Classify the user question into one of the following workspaces:
+    return f"""You are an Intent Agent. Classify the user question into one of the following workspaces:
     - 'Mobility': Questions about trips, drivers, fares, and cities.
     - 'Core Services': Questions about driver licensing, HR, and long-term retention.
     
@@ -28,8 +122,9 @@ def route_to_workspace(state: AgentState) -> dict:
     Question: {question}
     Workspace:"""
 
-    response = llm_pruner.invoke(prompt_str).content.strip()
-    workspace = response.replace("'", "").replace('"', '').strip()
+
+def _parse_workspace(response: str) -> dict:
+    workspace = response.strip().replace("'", "").replace('"', '').strip()
     
     # Fallback to the default/most common workspace if routing fails
     if workspace not in ["Mobility", "Core Services"]:
@@ -39,12 +134,65 @@ def route_to_workspace(state: AgentState) -> dict:
     return {"workspace_name": workspace}
 
 
-# Table/RAG Agent (Pruning Step 1)
-def table_prune_agent(state: AgentState) -> dict:
-    """Uses LLM to select only the relevant tables from the full schema/context."""
-    context_schema = state["context_schema"]
+def _pinned_workspace(state: AgentState):
+    """The caller's workspace (make_initial_state(workspace_name=...)) when it exists in the KB, else None."""
+    workspace = state.get("workspace_name")
+    if workspace and get_knowledge_base().has_workspace(workspace):
+        print(f"[Agent: Router] Workspace pinned to: {workspace}")
+        return {"workspace_name": workspace}
+    return None
+
+
+def route_to_workspace(state: AgentState) -> dict:
+    """Classifies the user question to a 'Workspace' (Domain Routing)."""
+    question = state["user_question"]
+    print(f"\n[Agent: Router] Routing question: {question}")
+    pinned = _pinned_workspace(state)
+    if pinned:
+        return pinned
+    response = _invoke(get_llm("pruner"), _router_prompt(question)).content
+    return _parse_workspace(response)
+
+
+async def aroute_to_workspace(state: AgentState) -> dict:
+    """Async version of route_to_workspace."""
     question = state["user_question"]
-    print(f"\n[Agent: Table Pruner] Context Size: {len(context_schema)} chars.")
+    print(f"\n[Agent: Router] Routing question: {question}")
+    pinned = _pinned_workspace(state)
+    if pinned:
+        return pinned
+    response = (await _ainvoke(get_llm("pruner"), _router_prompt(question))).content
+    return _parse_workspace(response)
+
+
+# Table/RAG Agent (Pruning Step 1)
+# 'retriever': local BM25 index only, 'hybrid': index top-k confirmed by the LLM,
+# 'llm': the LLM reads the full workspace context
+TABLE_PRUNER_MODE = os.getenv("TABLE_PRUNER_MODE", "hybrid")
+TABLE_RETRIEVER_TOP_K = int(os.getenv("TABLE_RETRIEVER_TOP_K", "8"))
+# In 'retriever' mode, keep tables scoring at least this fraction of the best table
+TABLE_RETRIEVER_MIN_RELATIVE_SCORE = float(os.getenv("TABLE_RETRIEVER_MIN_RELATIVE_SCORE", "0.3"))
+
+def _table_selection(question: str, workspace_name: str, context_schema: str) -> tuple:
+    """Returns (tables, None) when the local index decides alone, else (None, prompt for the LLM).
+
+    With no workspace_name the index is searched across every workspace.
+    """
+    kb = get_knowledge_base()
+
+    candidates = []
+    if TABLE_PRUNER_MODE in ("retriever", "hybrid") or not workspace_name:
+        candidates = get_schema_retriever().search(question, k=TABLE_RETRIEVER_TOP_K, workspace=workspace_name or None)
+        print(f"\n[Agent: Table Pruner] Retriever candidates: {candidates}")
+
+    if TABLE_PRUNER_MODE == "retriever" and candidates:
+        best_score = candidates[0][1]
+        return [t for t, score in candidates if score >= best_score * TABLE_RETRIEVER_MIN_RELATIVE_SCORE], None
+
+    if candidates:
+        # Only the top-k candidate tables go to the LLM for final confirmation
+        context_schema = f"WORKSPACE: {workspace_name or 'ALL'}\n" + "".join(kb.table(t)["block"] for t, _ in candidates)
+    print(f"[Agent: Table Pruner] Context Size: {len(context_schema)} chars.")
     
     # Prompt to select tables based on question
     prompt_str = f"""
@@ -58,42 +206,84 @@ def table_prune_agent(state: AgentState) -> dict:
     Your output MUST be a comma-separated list of table names, and nothing else. Example: 'trips,drivers'.
     Relevant Tables:
     """
-    
-    response = llm_pruner.invoke(prompt_str).content.strip().lower()
+    return None, prompt_str
+
+
+def _parse_tables(response: str) -> list:
+    response = response.strip().lower()
     relevant_tables = [t.strip() for t in response.split(',') if t.strip()]
     
     # This is critical for the next step to work correctly
-    # we can manually ensure the tables are valid
-    valid_tables = [t for t in relevant_tables if t in ['trips', 'drivers']]
-    
+    # we can manually ensure the tables exist in the knowledge base
+    return [t for t in relevant_tables if t in get_knowledge_base().tables]
+
+
+def select_tables(question: str, workspace_name: str, context_schema: str) -> list:
+    """Selects the relevant tables, using the local schema index and/or the LLM."""
+    tables, prompt_str = _table_selection(question, workspace_name, context_schema)
+    if tables is not None:
+        return tables
+    return _parse_tables(_invoke(get_llm("pruner"), prompt_str).content)
+
+
+async def aselect_tables(question: str, workspace_name: str, context_schema: str) -> list:
+    """Async version of select_tables."""
+    tables, prompt_str = _table_selection(question, workspace_name, context_schema)
+    if tables is not None:
+        return tables
+    return _parse_tables((await _ainvoke(get_llm("pruner"), prompt_str)).content)
+
+
+def table_prune_agent(state: AgentState) -> dict:
+    """Selects only the relevant tables for the routed workspace."""
+    valid_tables = select_tables(state["user_question"], state["workspace_name"], state["context_schema"])
     print(f"[Agent: Table Pruner] Selected Tables: {valid_tables}")
     return {"relevant_tables": valid_tables}
 
 
+async def atable_prune_agent(state: AgentState) -> dict:
+    """Async version of table_prune_agent."""
+    valid_tables = await aselect_tables(state["user_question"], state["workspace_name"], state["context_schema"])
+    print(f"[Agent: Table Pruner] Selected Tables: {valid_tables}")
+    return {"relevant_tables": valid_tables}
+
+
+def table_retrieval_agent(state: AgentState) -> dict:
+    """Parallel-mode table selection: searches every workspace, so it does not wait for the router."""
+    valid_tables = select_tables(state["user_question"], "", "")
+    print(f"[Agent: Table Retrieval] Selected Tables: {valid_tables}")
+    return {"relevant_tables": valid_tables}
+
+
+async def atable_retrieval_agent(state: AgentState) -> dict:
+    """Async version of table_retrieval_agent."""
+    valid_tables = await aselect_tables(state["user_question"], "", "")
+    print(f"[Agent: Table Retrieval] Selected Tables: {valid_tables}")
+    return {"relevant_tables": valid_tables}
+
+
 # Column Prune Agent (Pruning Step 2: Creates the Final, Minimized Schema)
 def column_prune_agent(state: AgentState) -> dict:
-    """Filters the schema to only include necessary columns."""
-    context_schema = state["context_schema"] # Full knowledge base
+    """Filters the schema to only include necessary columns, within a token budget."""
     question = state["user_question"]
     relevant_tables = state["relevant_tables"]
-    
-    # Filter context_schema down to only the relevant tables
-    pruned_schema = f"WORKSPACE: {state['workspace_name']}\n"
-    for table in relevant_tables:
-        if table == 'trips':
-            pruned_schema += "\nTABLE: trips\nSCHEMA: trip_id (INT), driver_id (INT), city (VARCHAR), distance_miles (FLOAT), fare_usd (FLOAT), trip_status (VARCHAR), trip_date (DATE)\nRULES: The column `trip_status` must be 'completed' to count a successful trip. Always filter by `trip_date` when a time frame is provided."
-        elif table == 'drivers':
-            pruned_schema += "\nTABLE: drivers\nSCHEMA: driver_id (INT), name (VARCHAR), license_status (VARCHAR), vehicle_make (VARCHAR), hire_date (DATE), current_rating (FLOAT)\nRULES: To check for an active driver, filter on `license_status` = 'active'."
-            # NOTE: We deliberately left out 'annual_bonus_target' and 'long_term_retention_score' 
-            # to demonstrate *pruning* of irrelevant or low-value columns!
-            
-    print(f"[Agent: Column Pruner] Pruned Schema Size: {len(pruned_schema)} chars.")
-    return {"pruned_schema": pruned_schema}
+
+    pruner = get_column_pruner(get_knowledge_base())
+    pruned_schema, stats = pruner.prune(question, relevant_tables, state["workspace_name"])
+
+    print(f"[Agent: Column Pruner] Pruned Schema Size: {len(pruned_schema)} chars "
+          f"({stats['columns_kept']}/{stats['columns_total']} columns, {stats['prune_ms']} ms).")
+    return {"pruned_schema": pruned_schema, "query_stats": stats}
+
+
+async def acolumn_prune_agent(state: AgentState) -> dict:
+    """Async version of column_prune_agent."""
+    return column_prune_agent(state)
 
 
 # Query Generation Agent
-def query_generation_agent(state: AgentState) -> dict:
-    """Generates the final SQL query using the minimized context (Groq llama3-70b)."""
+def _query_gen_chain(state: AgentState) -> tuple:
+    """Returns (chain, chain input, prompt size in chars) for the SQL generation call."""
     pruned_schema = state["pruned_schema"]
     question = state["user_question"]
     
@@ -113,97 +303,429 @@ def query_generation_agent(state: AgentState) -> dict:
     5. Return ONLY the raw SQL query, no explanations, no markdown block (```sql).
     """
     
+    from langchain_core.prompts import ChatPromptTemplate
     prompt = ChatPromptTemplate.from_messages([
         ("system", SYSTEM_PROMPT),
         ("human", f"User Question: {question}\nSQL Query:"),
     ])
     
-    chain = prompt | llm_main
-    
-    # Generate the query using the powerful LLM
-    sql_query = chain.invoke({"pruned_schema": pruned_schema, "question": question}).content.strip()
-    
+    chain = prompt | get_llm("main")
+    return chain, {"pruned_schema": pruned_schema, "question": question}, len(SYSTEM_PROMPT) + len(question)
+
+
+def _clean_sql(response: str) -> str:
     # Simple post-processing to ensure clean output
-    sql_query = sql_query.split(';')[0].strip() + ';'
+    return response.strip().split(';')[0].strip() + ';'
+
+
+def _parse_sql(response: str, prompt_chars: int, start: float) -> dict:
+    stats = {
+        "query_gen_prompt_chars": prompt_chars,
+        "query_gen_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    
+    sql_query = _clean_sql(response)
     print(f"[Agent: Query Generator] Generated SQL: {sql_query}")
-    return {"sql_query": sql_query}
+    return {"sql_query": sql_query, "query_stats": stats}
+
+
+def query_generation_agent(state: AgentState) -> dict:
+    """Generates the final SQL query using the minimized context (Groq llama3-70b)."""
+    chain, chain_input, prompt_chars = _query_gen_chain(state)
+    # Generate the query using the powerful LLM
+    start = time.perf_counter()
+    return _parse_sql(_invoke(chain, chain_input).content, prompt_chars, start)
+
+
+async def aquery_generation_agent(state: AgentState) -> dict:
+    """Async version of query_generation_agent."""
+    chain, chain_input, prompt_chars = _query_gen_chain(state)
+    start = time.perf_counter()
+    return _parse_sql((await _ainvoke(chain, chain_input)).content, prompt_chars, start)
+
+
+# SQL Validation (binds the SQL against the KB schema before anything runs)
+def query_validate_agent(state: AgentState) -> dict:
+    """Checks the generated SQL against the KB schema; invalid SQL goes to query_repair while attempts remain."""
+    if not SQL_VALIDATION_ENABLED:
+        return {"validation_error": "", "query_stats": {"validation": "off"}}
+    start = time.perf_counter()
+    try:
+        error = get_schema_validator().validate(state["sql_query"], get_knowledge_base())
+    except Exception as e:
+        # Execution is still the final judge of the SQL
+        print(f"[Agent: Query Validator] Skipped: {e}")
+        error = ""
+    attempts = state.get("repair_attempts", 0)
+    if not error:
+        outcome = "repaired" if attempts else "valid"
+    elif attempts >= SQL_REPAIR_MAX_ATTEMPTS:
+        outcome = "unrepaired"
+    else:
+        outcome = "invalid"
+    if outcome != "invalid":
+        record_validation(outcome)
+    print(f"[Agent: Query Validator] {outcome}{': ' + error.splitlines()[0] if error else ''}")
+    stats = {"validation": outcome, "validation_ms": round((time.perf_counter() - start) * 1000, 2)}
+    if outcome in ("repaired", "unrepaired"):
+        stats["repair_success_rate"] = round(repair_success_rate(), 3)
+    return {"validation_error": error, "query_stats": stats}
+
+
+async def aquery_validate_agent(state: AgentState) -> dict:
+    """Async version of query_validate_agent."""
+    return await run_in_db_thread(query_validate_agent, state)
+
+
+# SQL Repair (re-prompts the main LLM with the validation error)
+def _repair_prompt(state: AgentState) -> str:
+    return f"""
+    You are an expert SQL engineer doing SQL repair. The DuckDB query below fails against the database schema.
+    Fix it so it answers the user's question, using only the tables and columns in the context.
+
+    DATABASE CONTEXT:
+    {state["pruned_schema"]}
+
+    User Question: {state["user_question"]}
+    Failing SQL: {state["sql_query"]}
+    DuckDB Error: {state["validation_error"]}
+
+    Return ONLY the corrected raw SQL query, no explanations, no markdown block (```sql).
+    """
+
+
+def _repaired(state: AgentState, response: str, start: float) -> dict:
+    attempt = state.get("repair_attempts", 0) + 1
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    record_repair_attempt(attempt, elapsed_ms)
+    sql_query = _clean_sql(response)
+    print(f"[Agent: Query Repair] Attempt {attempt}/{SQL_REPAIR_MAX_ATTEMPTS} ({elapsed_ms} ms): {sql_query}")
+    repair_ms = state.get("query_stats", {}).get("repair_ms", []) + [elapsed_ms]
+    return {"sql_query": sql_query, "repair_attempts": attempt, "query_stats": {"repair_ms": repair_ms}}
+
+
+def query_repair_agent(state: AgentState) -> dict:
+    """Asks the main LLM to fix SQL that failed validation, given only the error and the pruned schema."""
+    start = time.perf_counter()
+    return _repaired(state, _invoke(get_llm("main"), _repair_prompt(state)).content, start)
+
+
+async def aquery_repair_agent(state: AgentState) -> dict:
+    """Async version of query_repair_agent."""
+    start = time.perf_counter()
+    return _repaired(state, (await _ainvoke(get_llm("main"), _repair_prompt(state))).content, start)
+
+
+# Rollup Rewrite (routes eligible aggregates to a pre-aggregated table)
+def query_rewrite_agent(state: AgentState) -> dict:
+    """Rewrites aggregate queries on trips to read a fresh materialized rollup when one can answer them."""
+    sql_query = state["sql_query"]
+    if not ROLLUP_REWRITE_ENABLED:
+        return {"query_stats": {"rollup": ""}}
+    start = time.perf_counter()
+    rollup = None
+    try:
+        rollups = get_knowledge_base().rollups
+        if rollups:
+            rewriter = get_rollup_rewriter()
+            with db_session() as con:
+                fresh = rewriter.fresh_rollups(con, rollups)
+                sql_query, rollup = rewriter.rewrite(con, sql_query, rollups, fresh)
+    except Exception as e:
+        # The original query is always a valid fallback
+        print(f"[Agent: Query Rewrite] Skipped: {e}")
+        sql_query, rollup = state["sql_query"], None
+    stats = {"rollup": rollup or "", "rewrite_ms": round((time.perf_counter() - start) * 1000, 2)}
+    if rollup is None:
+        return {"query_stats": stats}
+    print(f"[Agent: Query Rewrite] Using rollup {rollup}: {sql_query}")
+    stats["sql_before_rollup"] = state["sql_query"]
+    return {"sql_query": sql_query, "query_stats": stats}
+
+
+async def aquery_rewrite_agent(state: AgentState) -> dict:
+    """Async version of query_rewrite_agent; the freshness check runs on the DB thread pool."""
+    return await run_in_db_thread(query_rewrite_agent, state)
+
+
+# Query Guard (EXPLAIN-based admission control before execution)
+def query_guard_agent(state: AgentState) -> dict:
+    """Checks the plan of the SQL about to run: rejects expensive plans and limits oversized results."""
+    if not QUERY_GUARD_ENABLED:
+        return {"query_stats": {"guard": "off"}}
+    start = time.perf_counter()
+    sql_query = state["sql_query"]
+    try:
+        with db_session() as con:
+            decision = get_query_guard().check(con, sql_query, state["user_question"], get_knowledge_base())
+    except Exception as e:
+        # A guard failure must not block the question; the watchdog still bounds execution
+        print(f"[Agent: Query Guard] Skipped: {e}")
+        decision = {"action": "allow", "sql": sql_query, "reason": "", "estimated_rows": None, "heavy": False}
+    stats = {
+        "guard": decision["action"],
+        "guard_reason": decision["reason"],
+        "estimated_rows": decision["estimated_rows"],
+        "guard_heavy": decision["heavy"],
+        "guard_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    if decision["action"] == "reject":
+        print(f"[Agent: Query Guard] Rejected: {decision['reason']}")
+        return {"db_result": f"{REJECTED_PREFIX}: {decision['reason']}", "result_id": "", "query_stats": stats}
+    if decision["action"] == "limit":
+        print(f"[Agent: Query Guard] {decision['reason']}: {decision['sql']}")
+        stats["sql_before_guard"] = sql_query
+        return {"sql_query": decision["sql"], "query_stats": stats}
+    return {"query_stats": stats}
+
+
+async def aquery_guard_agent(state: AgentState) -> dict:
+    """Async version of query_guard_agent; EXPLAIN runs on the DB thread pool."""
+    return await run_in_db_thread(query_guard_agent, state)
 
 
 # Final Answer Agent (Synthesis)
-def final_answer_agent(state: AgentState) -> dict:
-    """Analyzes the DB result and synthesizes the final answer for the user."""
-    # Retrieve all necessary keys from the current state
+def _final_answer_prompt(state: AgentState) -> str:
+    """Prompt for the synthesis LLM call, or None when the answer is the execution error."""
     question = state["user_question"]
     sql_query = state["sql_query"]
     db_result = state["db_result"]
+    if is_failed_result(db_result):
+        return None
+    # Prompt to turn the data into a natural language response
+    return f"""
+    You are a friendly data analyst. Convert the SQL query result into a concise, natural language answer for the user.
     
-    print(f"\n[Agent: Final Answer] Synthesizing final response...")
+    User Question: {question}
+    Generated SQL: {sql_query}
+    SQL Result (Markdown Table):
+    {db_result}
+    
+    Final Answer (Summary of the data):
+    """
+
+
+def _template_answer(state: AgentState):
+    """Deterministic answer for small, obviously-shaped results: (answer, synth path) or (None, None)."""
+    if not FAST_SYNTH_ENABLED or is_failed_result(state["db_result"]) or not state.get("result_id"):
+        return None, None
+    answer, shape = template_answer(state["user_question"], state["sql_query"], get_result_store().get(state["result_id"]))
+    if answer is None:
+        return None, None
+    return answer, f"template:{shape}"
+
+
+def _final_answer(state: AgentState, response: str, synth_path: str) -> dict:
+    # Retrieve all necessary keys from the current state
+    sql_query = state["sql_query"]
+    db_result = state["db_result"]
     
-    if db_result.startswith("SQL ERROR"):
+    if response is None and db_result.startswith(REJECTED_PREFIX):
+        reason = db_result[len(REJECTED_PREFIX):].lstrip(": ")
+        final_answer = f"I did not run the query because {reason}. The generated query was:\n\n`{sql_query}`"
+        synth_path = "rejected"
+    elif response is None:
         final_answer = f"I encountered an error executing the query. The generated query was:\n\n`{sql_query}`\n\n**Error:** {db_result}"
     else:
-        # Prompt to turn the data into a natural language response
-        prompt_str = f"""
-        You are a friendly data analyst. Convert the SQL query result into a concise, natural language answer for the user.
-        
-        User Question: {question}
-        Generated SQL: {sql_query}
-        SQL Result (Markdown Table):
-        {db_result}
-        
-        Final Answer (Summary of the data):
-        """
-        # Using llm_pruner for faster synthesis
-        response = llm_pruner.invoke(prompt_str).content
         final_answer = response.strip()
+        # The user must know the result was cut off, whichever path wrote the answer
+        note = limit_note(state.get("query_stats", {}))
+        if note and note not in final_answer:
+            final_answer += f"\n\n_{note}_"
+    record_synth_path(synth_path)
+    print(f"[Agent: Final Answer] Synthesis path: {synth_path} (fast path rate {fast_path_rate():.0%})")
     
     # This ensures 'sql_query' remains in the state for the final log step.
     return {
         "final_answer": final_answer,
         "sql_query": sql_query, # Pass through the SQL query
-        "db_result": db_result  # Pass through the DB result
+        "db_result": db_result, # Pass through the DB result
+        "query_stats": {"synth_path": synth_path}
         # Note: LangGraph automatically merges this output with the existing state based on the TypedDict structure
     }
 
 
+def final_answer_agent(state: AgentState) -> dict:
+    """Analyzes the DB result and synthesizes the final answer for the user."""
+    print(f"\n[Agent: Final Answer] Synthesizing final response...")
+    answer, synth_path = _template_answer(state)
+    if answer is not None:
+        return _final_answer(state, answer, synth_path)
+    prompt_str = _final_answer_prompt(state)
+    if prompt_str is None:
+        return _final_answer(state, None, "error")
+    # Using the pruner model for faster synthesis
+    return _final_answer(state, _invoke(get_llm("pruner"), prompt_str).content, "llm")
+
+
+async def afinal_answer_agent(state: AgentState) -> dict:
+    """Async version of final_answer_agent."""
+    print(f"\n[Agent: Final Answer] Synthesizing final response...")
+    answer, synth_path = _template_answer(state)
+    if answer is not None:
+        return _final_answer(state, answer, synth_path)
+    prompt_str = _final_answer_prompt(state)
+    if prompt_str is None:
+        return _final_answer(state, None, "error")
+    return _final_answer(state, (await _ainvoke(get_llm("pruner"), prompt_str)).content, "llm")
+
+
 # Conditional Edges
 def check_for_error(state: AgentState) -> str:
     """Checks if the query execution resulted in an error."""
-    if state["db_result"].startswith("SQL ERROR"):
+    if is_failed_result(state["db_result"]):
         # For a more advanced system, you could route to a "Query Rewriter" agent here
         return "error"
     return "success"
 
 
+def check_validation(state: AgentState) -> str:
+    """Sends invalid SQL to query_repair while attempts remain; otherwise on to execution."""
+    if state.get("validation_error") and state.get("repair_attempts", 0) < SQL_REPAIR_MAX_ATTEMPTS:
+        return "repair"
+    return "valid"
+
+
+def check_guard(state: AgentState) -> str:
+    """Checks if the query guard rejected the query."""
+    return "rejected" if state.get("query_stats", {}).get("guard") == "reject" else "allowed"
+
+
 # Build the Graph
-def build_query_graph():
-    """Defines and compiles the LangGraph workflow."""
+# 'sequential': router -> rag_retrieval -> table_pruner -> column_pruner
+# 'parallel': router || table_retrieval (cross-workspace), joined at rag_retrieval
+GRAPH_MODE = os.getenv("GRAPH_MODE", "sequential")
+# Warm up connections, indexes and LLM clients in the background when the app starts
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "0") != "0"
+
+# Node name -> (sync implementation, async implementation)
+NODES = {
+    "cache_lookup": (cache_lookup_agent, acache_lookup_agent),
+    "router": (route_to_workspace, aroute_to_workspace),
+    "rag_retrieval": (retrieve_knowledge_base, aretrieve_knowledge_base),
+    "table_pruner": (table_prune_agent, atable_prune_agent),
+    "table_retrieval": (table_retrieval_agent, atable_retrieval_agent),
+    "column_pruner": (column_prune_agent, acolumn_prune_agent),
+    "query_gen": (query_generation_agent, aquery_generation_agent),
+    "query_validate": (query_validate_agent, aquery_validate_agent),
+    "query_repair": (query_repair_agent, aquery_repair_agent),
+    "query_rewrite": (query_rewrite_agent, aquery_rewrite_agent),
+    "query_guard": (query_guard_agent, aquery_guard_agent),
+    "query_exec": (execute_sql_query, aexecute_sql_query),
+    "cache_update": (cache_update_agent, acache_update_agent),
+    "final_synth": (final_answer_agent, afinal_answer_agent),
+}
+
+def build_query_graph(mode: str = None, use_async: bool = False):
+    """Defines and compiles the LangGraph workflow.
+
+    With use_async=True the nodes are the async agents, and the graph must be driven
+    with ainvoke/astream (see agents.batch.answer_many).
+    """
+    mode = mode or GRAPH_MODE
+    if mode not in ("sequential", "parallel"):
+        raise ValueError(f"Unknown graph mode: {mode}")
+    # Imported here: langgraph is the slowest import of the app and only needed to build the graph
+    from langgraph.graph import StateGraph, START, END
     workflow = StateGraph(AgentState)
     
     # Define Nodes (Agents/Tools)
-    workflow.add_node("router", route_to_workspace)
-    workflow.add_node("rag_retrieval", retrieve_knowledge_base)
-    workflow.add_node("table_pruner", table_prune_agent)
-    workflow.add_node("column_pruner", column_prune_agent)
-    workflow.add_node("query_gen", query_generation_agent)
-    workflow.add_node("query_exec", execute_sql_query)
-    workflow.add_node("final_synth", final_answer_agent)
+    table_node = "table_retrieval" if mode == "parallel" else "table_pruner"
+    for name in ("cache_lookup", "router", "rag_retrieval", table_node, "column_pruner",
+                 "query_gen", "query_validate", "query_repair", "query_rewrite", "query_guard", "query_exec", "cache_update", "final_synth"):
+        workflow.add_node(name, traced(name, NODES[name][1 if use_async else 0]))
 
     # Define the Workflow Edges
-    workflow.add_edge(START, "router")
-    workflow.add_edge("router", "rag_retrieval")
-    workflow.add_edge("rag_retrieval", "table_pruner")
-    workflow.add_edge("table_pruner", "column_pruner")
+    workflow.add_edge(START, "cache_lookup")
+    if mode == "parallel":
+        # Both LLM calls run in the same step; rag_retrieval waits for both branches
+        workflow.add_conditional_edges(
+            "cache_lookup",
+            fan_out_after_cache,
+            ["query_rewrite", "router", "table_retrieval"]
+        )
+        workflow.add_edge(["router", "table_retrieval"], "rag_retrieval")
+        workflow.add_edge("rag_retrieval", "column_pruner")
+    else:
+        # Conditional Edge: a cached question skips the whole LLM chain and executes the stored SQL
+        # (through query_rewrite, so it still uses whichever rollups are fresh now)
+        workflow.add_conditional_edges(
+            "cache_lookup",
+            check_cache,
+            {"hit": "query_rewrite", "miss": "router"}
+        )
+        workflow.add_edge("router", "rag_retrieval")
+        workflow.add_edge("rag_retrieval", "table_pruner")
+        workflow.add_edge("table_pruner", "column_pruner")
     workflow.add_edge("column_pruner", "query_gen")
-    workflow.add_edge("query_gen", "query_exec")
+    workflow.add_edge("query_gen", "query_validate")
+    # Conditional Edge: SQL that does not bind against the KB schema is repaired (at most
+    # SQL_REPAIR_MAX_ATTEMPTS times) before anything runs; SQL still invalid after that runs as is
+    workflow.add_conditional_edges(
+        "query_validate",
+        check_validation,
+        {"valid": "query_rewrite", "repair": "query_repair"}
+    )
+    workflow.add_edge("query_repair", "query_validate")
+    workflow.add_edge("query_rewrite", "query_guard")
+    # Conditional Edge: a rejected query is never executed; its reason goes straight to synthesis
+    workflow.add_conditional_edges(
+        "query_guard",
+        check_guard,
+        {"allowed": "query_exec", "rejected": "cache_update"}
+    )
     
     # Conditional Edge: If successful, go to synthesis. If error, go straight to synthesis with error.
     workflow.add_conditional_edges(
         "query_exec",
         check_for_error,
-        {"success": "final_synth", "error": "final_synth"}
+        {"success": "cache_update", "error": "cache_update"}
     )
 
+    workflow.add_edge("cache_update", "final_synth")
+
     workflow.add_edge("final_synth", END)
 
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile()
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def get_query_graph(mode: str = None, use_async: bool = False):
+    """Returns the process-wide compiled graph for (mode, use_async), building it on first use."""
+    key = (mode or GRAPH_MODE, use_async)
+    graph = _graphs.get(key)
+    if graph is None:
+        with _graphs_lock:
+            graph = _graphs.get(key)
+            if graph is None:
+                graph = _graphs[key] = build_query_graph(*key)
+    return graph
+
+
+def warm_up(mode: str = None) -> dict:
+    """Builds the graph and opens everything the first question would otherwise wait for:
+    the DuckDB connection, the knowledge base and its indexes, the SQL validation catalog
+    and the LLM clients with their HTTPS keep-alive. Returns seconds per step."""
+    # query_gen's prompt template is the other slow first-time import
+    import langchain_core.prompts
+    timings = {}
+    start = time.perf_counter()
+    get_query_graph(mode)
+    timings["graph"] = time.perf_counter() - start
+    start = time.perf_counter()
+    # Runs a query through the result path too (Arrow batches, then pandas/tabulate for the preview)
+    with db_session() as con:
+        fetch_bounded(fetch_record_batches(con.execute("SELECT 1 AS warm_up"), RESULT_BATCH_SIZE)).to_db_result()
+    timings["duckdb"] = time.perf_counter() - start
+    start = time.perf_counter()
+    kb = get_knowledge_base()
+    get_schema_retriever()
+    get_column_pruner(kb)
+    get_schema_validator().validate("SELECT 1", kb)
+    timings["knowledge_base"] = time.perf_counter() - start
+    timings["llm"] = warm_up_llm()
+    print("[Warm-up] " + ", ".join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in timings.items()))
+    return timings
@@ -1,13 +1,126 @@
 import streamlit as st
 import pandas as pd
-from agents.workflow import build_query_graph
-from agents.state import AgentState
+from agents.workflow import get_query_graph, warm_up, WARM_UP_ON_START
+from agents.state import make_initial_state
+from agents.semantic_cache import get_semantic_cache
+from agents.results import get_result_store
+from agents.synthesis import fast_path_rate
+from agents.query_guard import is_failed_result
+from agents.tracing import get_tracer, start_metrics_server
 from dotenv import load_dotenv
+import threading
 import time
 import os
 
 load_dotenv()
-graph = build_query_graph()
+
+
+@st.cache_resource
+def load_graph():
+    """The compiled graph, built once per process and shared by every session and rerun."""
+    return get_query_graph()
+
+
+@st.cache_resource
+def start_background_services():
+    """Metrics endpoint and (optionally) warm-up, started once per process."""
+    start_metrics_server()
+    if WARM_UP_ON_START:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    return True
+
+
+def workflow_log_rows(execution_log, trace_id):
+    """One row per executed node: timings from its trace span plus node-specific details."""
+    log_data = []
+    spans = {}
+    for span in get_tracer().spans_for(trace_id):
+        # Nodes can run more than once (validate/repair), so spans are matched in order
+        spans.setdefault(span['node'], []).append(span)
+
+    for i, (node_name, state) in enumerate(execution_log):
+
+        step_data = {
+            "Step": i + 1,
+            "Agent/Tool": node_name,
+            "Time (ms)": None,
+            "LLM (ms)": None,
+            "Tokens (in/out)": "",
+            "Details": ""
+        }
+        span = spans[node_name].pop(0) if spans.get(node_name) else None
+        if span:
+            step_data["Time (ms)"] = round(span['wall_ms'])
+            if span['llm_calls']:
+                step_data["LLM (ms)"] = round(span['llm_ms'])
+                step_data["Tokens (in/out)"] = f"{span['prompt_tokens']}/{span['completion_tokens']}"
+
+        if node_name == "cache_lookup":
+            status = state.get('cache_status', 'N/A')
+            step_data["Details"] = f"**Semantic Cache:** {status} ({get_semantic_cache().summary()})"
+        elif node_name == "cache_update":
+            stored = state.get('cache_status') == 'miss'
+            step_data["Details"] = f"**Semantic Cache:** {'SQL stored' if stored else 'unchanged'}"
+        elif node_name == "router":
+            step_data["Details"] = f"**Intent Classified:** {state.get('workspace_name', 'N/A')}"
+        elif node_name == "rag_retrieval":
+            schema_len = len(state.get('context_schema', ''))
+            step_data["Details"] = f"**RAG Retrieval (Full Context):** {schema_len} characters of schema/rules."
+        elif node_name in ("table_pruner", "table_retrieval"):
+            tables = state.get('relevant_tables', [])
+            step_data["Details"] = f"**Tables Selected:** {', '.join(tables)}"
+        elif node_name == "column_pruner":
+            pruned_len = len(state.get('pruned_schema', ''))
+            stats = state.get('query_stats', {})
+            step_data["Details"] = (
+                f"**Schema Pruned:** Final prompt context is {pruned_len} characters "
+                f"(~{stats.get('schema_tokens_pruned', 'N/A')} tokens, {stats.get('columns_kept', 'N/A')}/{stats.get('columns_total', 'N/A')} columns, "
+                f"{stats.get('schema_chars_full', 'N/A')} chars before pruning)."
+            )
+        elif node_name == "query_gen":
+            stats = state.get('query_stats', {})
+            step_data["Details"] = (
+                f"**Query Generated (Groq 70b):** {state.get('sql_query', 'N/A')[:50]}... "
+                f"(prompt {stats.get('query_gen_prompt_chars', 'N/A')} chars, {stats.get('query_gen_ms', 'N/A')} ms)"
+            )
+        elif node_name == "query_validate":
+            stats = state.get('query_stats', {})
+            error = state.get('validation_error', '')
+            step_data["Details"] = (
+                f"**SQL Validated:** {stats.get('validation', 'N/A')} ({stats.get('validation_ms', 'N/A')} ms)"
+                f"{': ' + error.splitlines()[0] if error else ''}"
+            )
+        elif node_name == "query_repair":
+            stats = state.get('query_stats', {})
+            step_data["Details"] = (
+                f"**Query Repaired (attempt {state.get('repair_attempts', 'N/A')}):** {state.get('sql_query', 'N/A')[:50]}... "
+                f"({stats.get('repair_ms', ['N/A'])[-1]} ms)"
+            )
+        elif node_name == "query_rewrite":
+            rollup = state.get('query_stats', {}).get('rollup')
+            step_data["Details"] = f"**Rollup Rewrite:** {'reads ' + rollup if rollup else 'not applicable'}"
+        elif node_name == "query_guard":
+            stats = state.get('query_stats', {})
+            estimate = stats.get('estimated_rows')
+            step_data["Details"] = (
+                f"**Cost Guard:** {stats.get('guard', 'N/A')}"
+                f"{f' (~{estimate:,} rows estimated)' if estimate is not None else ''}"
+                f"{': ' + stats['guard_reason'] if stats.get('guard_reason') else ''}"
+            )
+        elif node_name == "query_exec":
+            result = state.get('db_result', 'N/A')
+            step_data["Details"] = f"**SQL Executed:** {'Success' if not is_failed_result(result) else 'Error'}"
+            if span:
+                step_data["Details"] += (
+                    f" ({span['rows']:,} rows, execute {span['db_execute_ms']:.1f} ms, fetch {span['db_fetch_ms']:.1f} ms)"
+                )
+        elif node_name == "final_synth":
+            synth_path = state.get('query_stats', {}).get('synth_path', 'N/A')
+            step_data["Details"] = f"**Answer Synthesized:** {synth_path} (fast path rate {fast_path_rate():.0%})"
+
+        log_data.append(step_data)
+    return log_data
+
 
 st.set_page_config(layout="wide", page_title="QueryGPT: Multi-Agent Text-to-SQL")
 st.title("🤖 QueryGPT: Multi-Agent Text-to-SQL")
@@ -16,8 +129,14 @@ st.markdown("A Contextual query generation using **LangGraph** (Orchestration) a
 if not os.getenv("GROQ_API_KEY"):
     st.error("Please set the `GROQ_API_KEY` in your `.env` file.")
 else:
+    start_background_services()
     col1, col2 = st.columns([1, 1])
 
+    with col2:
+        st.header("2. Multi-Agent Workflow Execution (LangGraph)")
+        # Filled in node by node while the graph runs
+        workflow_table = st.empty()
+
     with col1:
         st.header("1. User Input")
         initial_question = st.text_area(
@@ -29,76 +148,80 @@ else:
         if st.button("Generate Query and Run", type="primary"):
             
             # Initialize State
-            initial_state = AgentState(
-                user_question=initial_question,
-                workspace_name="",
-                relevant_tables=[],
-                context_schema="",
-                pruned_schema="",
-                sql_query="",
-                db_result="",
-                final_answer=""
-            )
+            initial_state = make_initial_state(initial_question)
             
             # EXECUTION
             start_time = time.time()
             st.session_state['execution_log'] = []
+            st.session_state['trace_id'] = initial_state['trace_id']
             
-            # Stream/Iterate through the LangGraph steps
-            for step in graph.stream(initial_state):
-                node_name, new_state = next(iter(step.items()))
-                
-                # Capture the state change for visualization
-                st.session_state['execution_log'].append((node_name, new_state))
+            st.subheader("Final Result")
+            sql_slot = st.empty()
+            answer_slot = st.empty()
+            first_output_time = None
+            first_token_time = None
+            answer_tokens = []
+
+            # Stream the LangGraph steps ('updates') and the LLM tokens ('messages') as they happen
+            for mode, chunk in load_graph().stream(initial_state, stream_mode=["updates", "messages"]):
+                if mode == "messages":
+                    message, metadata = chunk
+                    # Only the synthesized answer is streamed to the user; other LLM calls are internal
+                    if metadata.get("langgraph_node") != "final_synth" or not message.content:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        first_output_time = first_output_time or first_token_time
+                    answer_tokens.append(message.content)
+                    answer_slot.success(f"**Final Answer:** {''.join(answer_tokens)}▌")
+                    continue
+
+                for node_name, new_state in chunk.items():
+                    # Capture the state change for visualization
+                    st.session_state['execution_log'].append((node_name, new_state))
+                    # Show the SQL as soon as it exists (generated, repaired, cached or rewritten)
+                    if new_state and new_state.get('sql_query'):
+                        sql_slot.markdown(f"**Generated SQL:**\n```sql\n{new_state['sql_query']}\n```")
+                        first_output_time = first_output_time or time.time() - start_time
+                workflow_table.dataframe(
+                    pd.DataFrame(workflow_log_rows(st.session_state['execution_log'], initial_state['trace_id'])),
+                    use_container_width=True, hide_index=True,
+                )
 
             total_time = time.time() - start_time
             # END EXECUTION
-            
-            st.subheader("Final Result")
-            st.success(f"**Final Answer:** {st.session_state['execution_log'][-1][1]['final_answer']}")
-            st.metric("Total Execution Time (with Groq)", f"{total_time:.2f} seconds")
-            st.markdown(f"**Generated SQL:**\n```sql\n{st.session_state['execution_log'][-1][1]['sql_query']}\n```")
+
+            final_state = st.session_state['execution_log'][-1][1]
+            answer_slot.success(f"**Final Answer:** {final_state['final_answer']}")
+            # Time to first visible output (SQL or answer token) is what the user waits for before seeing progress
+            time_cols = st.columns(3)
+            time_cols[0].metric("Time to First Output", f"{first_output_time or total_time:.2f} seconds")
+            time_cols[1].metric("Time to First Answer Token", f"{first_token_time:.2f} seconds" if first_token_time else "n/a (no LLM)")
+            time_cols[2].metric("Total Execution Time (with Groq)", f"{total_time:.2f} seconds")
+            print(f"[App] First output {first_output_time or total_time:.2f}s, first answer token "
+                  f"{f'{first_token_time:.2f}s' if first_token_time else 'n/a'}, total {total_time:.2f}s")
 
     with col2:
-        st.header("2. Multi-Agent Workflow Execution (LangGraph)")
-        
         if 'execution_log' in st.session_state:
-            log_data = []
-            
-            for i, (node_name, state) in enumerate(st.session_state['execution_log']):
-                
-                step_data = {
-                    "Step": i + 1,
-                    "Agent/Tool": node_name,
-                    "Details": ""
-                }
-
-                if node_name == "router":
-                    step_data["Details"] = f"**Intent Classified:** {state.get('workspace_name', 'N/A')}"
-                elif node_name == "rag_retrieval":
-                    schema_len = len(state.get('context_schema', ''))
-                    step_data["Details"] = f"**RAG Retrieval (Full Context):** {schema_len} characters of schema/rules."
-                elif node_name == "table_pruner":
-                    tables = state.get('relevant_tables', [])
-                    step_data["Details"] = f"**Tables Selected:** {', '.join(tables)}"
-                elif node_name == "column_pruner":
-                    pruned_len = len(state.get('pruned_schema', ''))
-                    step_data["Details"] = f"**Schema Pruned:** Final prompt context is {pruned_len} characters."
-                elif node_name == "query_gen":
-                    step_data["Details"] = f"**Query Generated (Groq 70b):** {state.get('sql_query', 'N/A')[:50]}..."
-                elif node_name == "query_exec":
-                    result = state.get('db_result', 'N/A')
-                    step_data["Details"] = f"**SQL Executed:** {'Success' if not result.startswith('SQL ERROR') else 'Error'}"
-                elif node_name == "final_synth":
-                    step_data["Details"] = "**Answer Synthesized**"
-                    
-                log_data.append(step_data)
+            log_data = workflow_log_rows(st.session_state['execution_log'], st.session_state.get('trace_id', ''))
 
             # Display the log in a clear table
             df_log = pd.DataFrame(log_data)
-            st.dataframe(df_log, use_container_width=True, hide_index=True)
+            workflow_table.dataframe(df_log, use_container_width=True, hide_index=True)
             
             # Show the final DB result for full transparency
             final_db_result = st.session_state['execution_log'][-1][1]['db_result']
             st.subheader("Raw Database Result")
             st.text(final_db_result)
+
+            # The full (bounded) result stays out of the LLM prompt; offer it as a download instead
+            result_id = next((state.get('result_id') for node_name, state in st.session_state['execution_log']
+                              if node_name == "query_exec" and state), "")
+            full_result = get_result_store().get(result_id) if result_id else None
+            if full_result is not None:
+                st.download_button(
+                    f"Download full result ({full_result.num_rows:,} rows, CSV)",
+                    data=full_result.to_pandas().to_csv(index=False),
+                    file_name="query_result.csv",
+                    mime="text/csv",
+                )
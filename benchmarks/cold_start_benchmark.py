@@ -0,0 +1,88 @@
+"""Cold start: import time of the agents and latency of the first question in a fresh process.
+
+Every run starts a new Python process (so nothing is imported or connected yet), imports
+what app.py imports, then answers two questions with the fake LLM; with --warm-up the
+process calls agents.workflow.warm_up() first, as WARM_UP_ON_START does in the app.
+The LLM's HTTPS keep-alive is not exercised offline.
+
+Usage: python -m benchmarks.cold_start_benchmark [--runs 5] [--latency 0.05]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.pipeline_benchmark import REPO_ROOT, load_questions, prepare_data
+
+
+def run_worker(args):
+    """One cold start in this process (cwd is the data directory)."""
+    start = time.perf_counter()
+    import agents.workflow as workflow
+    # The rest of what app.py imports
+    import agents.query_guard
+    import agents.results
+    import agents.semantic_cache
+    import agents.state
+    import agents.synthesis
+    import agents.tracing
+    report = {"import_ms": (time.perf_counter() - start) * 1000}
+
+    from agents.llm import set_llm
+    from benchmarks.fake_llm import FakeChatModel
+    fake = FakeChatModel(latency_s=args.latency)
+    set_llm("main", fake)
+    set_llm("pruner", fake)
+    if args.warm_up:
+        start = time.perf_counter()
+        workflow.warm_up()
+        report["warm_up_ms"] = (time.perf_counter() - start) * 1000
+
+    from agents.state import make_initial_state
+    for key, question in zip(("first_question_ms", "second_question_ms"), load_questions(2)):
+        start = time.perf_counter()
+        workflow.get_query_graph().invoke(make_initial_state(question))
+        report[key] = (time.perf_counter() - start) * 1000
+    with open(args.worker_output, "w") as f:
+        json.dump(report, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected seconds per LLM call.")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "querygpt-bench"))
+    # Internal: run a single cold start in this process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warm-up", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    data_dir = prepare_data(args.workdir, 0, 0)
+    output = os.path.join(data_dir, "report-cold-start.json")
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT, "SEMANTIC_CACHE_ENABLED": "0", "RESULT_CACHE_ENABLED": "0", "TRACE_FILE": ""}
+    for warm in (False, True):
+        reports = []
+        for _ in range(args.runs):
+            command = [sys.executable, "-m", "benchmarks.cold_start_benchmark", "--worker",
+                       "--worker-output", output, "--latency", str(args.latency)] + (["--warm-up"] if warm else [])
+            subprocess.run(command, cwd=data_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+            with open(output) as f:
+                reports.append(json.load(f))
+        medians = {key: float(np.median([r[key] for r in reports])) for key in reports[0]}
+        print(f"\n{'with' if warm else 'without'} warm-up (median of {args.runs} processes):")
+        for key, value in medians.items():
+            print(f"  {key:>20}: {value:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TABLE_RE = re.compile(r"^\s*TABLE: (\S+)", re.MULTILINE)
+_STREAM_TOKEN_RE = re.compile(r"\s*\S+")
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic local stand-in for ChatGroq.
+
+    Recognizes each agent's prompt and returns a canned route, table list, SQL query or
+    answer after `latency_s` seconds, so the graph can be driven without a Groq key.
+    """
+
+    latency_s: float = 0.0
+    # Delay between streamed tokens (after latency_s, which stands in for time to first token)
+    token_latency_s: float = 0.0
+    default_workspace: str = "Mobility"
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def respond(self, prompt: str) -> str:
+        """Canned reply for one of the agent prompts."""
+        question = re.search(r"(?:User )?Question: (.*)", prompt)
+        question = question.group(1).strip() if question else ""
+        q = question.lower()
+        if "Intent Agent" in prompt:
+            if any(w in q for w in ("license", "hire", "bonus", "retention", "hr ")):
+                return "Core Services"
+            return self.default_workspace
+        tables = _TABLE_RE.findall(prompt)
+        if "Table Selection Agent" in prompt:
+            mentioned = [t for t in tables if t.rstrip("s") in q]
+            return ",".join(mentioned or tables[:1])
+        if "expert SQL engineer" in prompt:
+            return self.sql_for(q, tables)
+        return f"Here is the answer to: {question}"
+
+    def sql_for(self, q: str, tables: list) -> str:
+        """Plausible SQL for the sample trips/drivers schema."""
+        if "drivers" in tables and "trips" in tables and "driver" in q:
+            return ("SELECT d.name, d.current_rating FROM drivers d JOIN trips t ON d.driver_id = t.driver_id "
+                    "WHERE d.license_status = 'active' AND t.city = 'Seattle' GROUP BY d.name, d.current_rating;")
+        if "trips" in tables:
+            if "average fare" in q or "avg fare" in q:
+                return "SELECT city, avg(fare_usd) AS avg_fare FROM trips WHERE trip_status = 'completed' GROUP BY city;"
+            if "how many" in q or "count" in q or "number" in q:
+                return "SELECT count(trip_id) AS completed_trips FROM trips WHERE trip_status = 'completed';"
+            return "SELECT * FROM trips LIMIT 5;"
+        if tables:
+            return f"SELECT * FROM {tables[0]} LIMIT 5;"
+        return "SELECT 1;"
+
+    def _content(self, messages: List[BaseMessage]) -> tuple:
+        """(reply, usage metadata) for a call."""
+        self.calls += 1
+        prompt = "\n".join(str(m.content) for m in messages)
+        content = self.respond(prompt)
+        # Rough token counts (~4 characters per token) so tracing has something to report
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return content, usage
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        content, usage = self._content(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _chunks(self, messages: List[BaseMessage]) -> list:
+        """The reply split into word chunks; the last one carries the usage metadata."""
+        content, usage = self._content(messages)
+        tokens = _STREAM_TOKEN_RE.findall(content) or [content]
+        return [ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage if i == len(tokens) - 1 else None))
+                for i, token in enumerate(tokens)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._reply(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i and self.token_latency_s:
+                time.sleep(self.token_latency_s)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i and self.token_latency_s:
+                await asyncio.sleep(self.token_latency_s)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
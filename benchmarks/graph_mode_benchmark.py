@@ -0,0 +1,58 @@
+"""Latency of the sequential vs. parallel build_query_graph modes with a fake LLM.
+
+Usage: python -m benchmarks.graph_mode_benchmark [--runs 20] [--latency 0.2]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import agents.workflow as workflow
+from agents.llm import set_llm
+from agents.state import make_initial_state
+from benchmarks.fake_llm import FakeChatModel
+
+QUESTIONS = [
+    "Find the name and current rating of active drivers who drove a trip in Seattle.",
+    "How many completed trips were there?",
+    "What is the average fare per city for completed trips?",
+    "Show some recent trips.",
+]
+
+
+def run(mode: str, runs: int) -> list:
+    graph = workflow.build_query_graph(mode)
+    # Warm-up: loads the knowledge base, schema index and DuckDB connection
+    for _ in graph.stream(make_initial_state(QUESTIONS[0])):
+        pass
+    latencies_ms = []
+    for i in range(runs):
+        start = time.perf_counter()
+        for _ in graph.stream(make_initial_state(QUESTIONS[i % len(QUESTIONS)])):
+            pass
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+    return latencies_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Injected seconds per LLM call.")
+    args = parser.parse_args()
+
+    fake = FakeChatModel(latency_s=args.latency)
+    set_llm("main", fake)
+    set_llm("pruner", fake)
+    # Every run must go through the agent chain
+    workflow.SEMANTIC_CACHE_ENABLED = False
+
+    results = {mode: run(mode, args.runs) for mode in ("sequential", "parallel")}
+    for mode, samples in results.items():
+        print(f"{mode:>10}: p50 {np.percentile(samples, 50):8.1f} ms  p95 {np.percentile(samples, 95):8.1f} ms")
+    for p in (50, 95):
+        seq, par = np.percentile(results["sequential"], p), np.percentile(results["parallel"], p)
+        print(f"p{p} reduction: {(1 - par / seq):.1%}")
+
+
+if __name__ == "__main__":
+    main()
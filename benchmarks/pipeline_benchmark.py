@@ -0,0 +1,218 @@
+"""End-to-end pipeline benchmark with a fake LLM over scaled synthetic data.
+
+Every scenario (DB size x KB size x concurrency x graph mode) runs in its own process
+and working directory, so the DuckDB connection, knowledge base and indexes are built
+fresh from that scenario's files. Reports per-node and end-to-end p50/p95/p99 and
+throughput, and can fail on regressions against a stored baseline. Latencies depend on
+the machine: re-save the baseline when moving to different hardware.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark [--db-rows 0,200000] [--kb-tables 0,1000]
+        [--concurrency 1,8] [--modes sequential] [--questions 24] [--latency 0.05]
+        [--save-baseline benchmarks/baseline.json | --check-baseline benchmarks/baseline.json]
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+PERCENTILES = (50, 95, 99)
+
+
+def load_questions(n: int) -> list:
+    """The first `n` corpus questions, cycling through the corpus if it is shorter."""
+    with open(QUESTIONS_FILE) as f:
+        corpus = [item["question"] for item in json.load(f)]
+    return [corpus[i % len(corpus)] for i in range(n)]
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(np.percentile(samples, p)), 2) for p in PERCENTILES}
+
+
+def scenario_name(db_rows: int, kb_tables: int, concurrency: int, mode: str) -> str:
+    return f"db{db_rows}-kb{kb_tables}-c{concurrency}-{mode}"
+
+
+def prepare_data(workdir: str, db_rows: int, kb_tables: int) -> str:
+    """Builds (once) a directory with `db_rows` generated trips (0 = sample data) and the KB grown by `kb_tables` tables."""
+    path = os.path.join(workdir, f"db{db_rows}-kb{kb_tables}")
+    if os.path.exists(os.path.join(path, "ready")):
+        return path
+    os.makedirs(path, exist_ok=True)
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    create_db = os.path.join(REPO_ROOT, "create_db.py")
+    # db_rows = 0 keeps the 10-row sample; otherwise create_db.py's chunked generator builds the trips
+    generator_args = ["--trips", str(db_rows), "--drivers", "1000", "--cities", "20"] if db_rows else []
+    subprocess.run([sys.executable, create_db] + generator_args, cwd=path, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    if kb_tables:
+        from benchmarks.synthetic import synthetic_knowledge_base
+        kb_file = os.path.join(path, "knowledge_base.json")
+        with open(kb_file) as f:
+            kb = json.load(f)
+        for workspace, details in synthetic_knowledge_base(kb_tables).items():
+            target = kb.setdefault(workspace, {"description": details["description"], "tables": {}})
+            target["tables"].update(details["tables"])
+        with open(kb_file, "w") as f:
+            json.dump(kb, f, indent=4)
+
+    open(os.path.join(path, "ready"), "w").close()
+    return path
+
+
+def run_worker(args):
+    """Runs one scenario in this process (cwd is the scenario's data directory)."""
+    import agents.workflow as workflow
+    from agents.batch import answer_many
+    from agents.llm import set_llm
+    from agents.tracing import get_tracer
+    from benchmarks.fake_llm import FakeChatModel
+
+    fake = FakeChatModel(latency_s=args.latency)
+    set_llm("main", fake)
+    set_llm("pruner", fake)
+    questions = load_questions(args.questions)
+    graph = workflow.build_query_graph(args.mode, use_async=True)
+
+    # Warm-up: loads the knowledge base, schema index and DuckDB connection
+    answer_many(questions[:1], concurrency=1, graph=graph)
+    start = time.perf_counter()
+    results = answer_many(questions, concurrency=args.worker_concurrency, graph=graph)
+    elapsed = time.perf_counter() - start
+
+    node_ms = {}
+    for result in results:
+        for span in get_tracer().spans_for(result["trace_id"]):
+            node_ms.setdefault(span["node"], []).append(span["wall_ms"])
+    report = {
+        "questions": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+        "throughput_qps": round(len(results) / elapsed, 2),
+        "e2e_ms": percentiles([r["elapsed_s"] * 1000 for r in results]),
+        "nodes": {node: percentiles(samples) for node, samples in sorted(node_ms.items())},
+        "llm_calls": fake.calls,
+    }
+    with open(args.worker_output, "w") as f:
+        json.dump(report, f)
+
+
+def run_scenario(data_dir: str, concurrency: int, mode: str, args) -> dict:
+    """Runs one scenario in a fresh process and returns its report."""
+    output = os.path.join(data_dir, f"report-c{concurrency}-{mode}.json")
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        # Every question must go through the agents and hit DuckDB
+        "SEMANTIC_CACHE_ENABLED": "0",
+        "RESULT_CACHE_ENABLED": "0",
+        "TRACE_FILE": "",
+    }
+    command = [
+        sys.executable, "-m", "benchmarks.pipeline_benchmark", "--worker",
+        "--worker-output", output, "--worker-concurrency", str(concurrency), "--mode", mode,
+        "--questions", str(args.questions), "--latency", str(args.latency),
+    ]
+    subprocess.run(command, cwd=data_dir, env=env, check=True,
+                   stdout=None if args.verbose else subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+def check_regressions(reports: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """Metrics that got worse than the baseline by more than `tolerance` (plus `slack_ms` for latencies)."""
+    regressions = []
+    for name, base in baseline.items():
+        current = reports.get(name)
+        if current is None:
+            continue
+        if current["throughput_qps"] < base["throughput_qps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_qps']} q/s < baseline {base['throughput_qps']} q/s")
+        latencies = [("e2e", base["e2e_ms"], current["e2e_ms"])]
+        latencies += [(node, stats, current["nodes"].get(node, {})) for node, stats in base["nodes"].items()]
+        for label, base_stats, current_stats in latencies:
+            for key in ("p50", "p95"):
+                before, after = base_stats.get(key), current_stats.get(key)
+                if before is not None and after is not None and after > before * (1 + tolerance) + slack_ms:
+                    regressions.append(f"{name}: {label} {key} {after:.1f} ms > baseline {before:.1f} ms")
+    return regressions
+
+
+def print_report(name: str, report: dict):
+    e2e = report["e2e_ms"]
+    print(f"\n{name}: {report['questions']} questions, {report['errors']} errors, "
+          f"{report['throughput_qps']} q/s, e2e p50/p95/p99 {e2e['p50']}/{e2e['p95']}/{e2e['p99']} ms")
+    for node, stats in report["nodes"].items():
+        print(f"  {node:>16}: p50 {stats['p50']:9.2f}  p95 {stats['p95']:9.2f}  p99 {stats['p99']:9.2f} ms")
+
+
+def int_list(value: str) -> list:
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-rows", type=int_list, default=[0, 200000], help="Generated trips per scenario (0 = the sample data).")
+    parser.add_argument("--kb-tables", type=int_list, default=[0, 1000], help="Extra synthetic KB tables per scenario.")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8])
+    parser.add_argument("--modes", default="sequential", help="Comma-separated graph modes.")
+    parser.add_argument("--questions", type=int, default=24, help="Questions per scenario (cycles the corpus).")
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected seconds per LLM call.")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "querygpt-bench"),
+                        help="Where scenario data is built and reused.")
+    parser.add_argument("--json", help="Write all scenario reports to this file.")
+    parser.add_argument("--save-baseline", help="Store the reports as the regression baseline.")
+    parser.add_argument("--check-baseline", help="Exit 1 if any scenario regressed against this baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown.")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Allowed absolute slowdown (noise floor).")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' output.")
+    # Internal: run a single scenario in this process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="sequential", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    reports = {}
+    for db_rows, kb_tables in itertools.product(args.db_rows, args.kb_tables):
+        data_dir = prepare_data(args.workdir, db_rows, kb_tables)
+        for concurrency, mode in itertools.product(args.concurrency, args.modes.split(",")):
+            name = scenario_name(db_rows, kb_tables, concurrency, mode)
+            reports[name] = run_scenario(data_dir, concurrency, mode, args)
+            print_report(name, reports[name])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if args.check_baseline:
+        with open(args.check_baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(reports, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.check_baseline} (tolerance {args.tolerance:.0%}, slack {args.slack_ms} ms)")
+
+
+if __name__ == "__main__":
+    main()
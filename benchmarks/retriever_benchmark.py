@@ -0,0 +1,71 @@
+"""Recall/latency benchmark of the local schema retriever on a synthetic knowledge base.
+
+Usage: python -m benchmarks.retriever_benchmark [--tables 5000] [--questions 500]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from agents.knowledge_base import KnowledgeBase
+from agents.retriever import SchemaRetriever
+from benchmarks.synthetic import synthetic_knowledge_base, synthetic_questions
+
+
+def percentiles(samples_ms):
+    return {p: float(np.percentile(samples_ms, p)) for p in (50, 95, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5, 10])
+    args = parser.parse_args()
+
+    raw = synthetic_knowledge_base(args.tables)
+    kb = KnowledgeBase(raw, version="synthetic")
+    questions = synthetic_questions(raw, args.questions)
+
+    start = time.perf_counter()
+    retriever = SchemaRetriever.build(kb, embedding_model="")
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "schema_index.pkl")
+        retriever.save(path)
+        start = time.perf_counter()
+        retriever = SchemaRetriever.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        index_mb = os.path.getsize(path) / (1024 * 1024)
+
+    max_k = max(args.top_k)
+    hits = {k: 0 for k in args.top_k}
+    latencies_ms = []
+    for question, target in questions:
+        start = time.perf_counter()
+        results = retriever.search(question, k=max_k)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        ranked = [t for t, _ in results]
+        for k in args.top_k:
+            hits[k] += target in ranked[:k]
+
+    # Prompt the LLM pruner would otherwise receive (whole workspace) vs. the top-k blocks
+    workspace_chars = np.mean([len(kb.workspace_context(ws)) for ws in kb.workspaces])
+    topk_chars = np.mean([
+        sum(len(kb.table(t)["block"]) for t, _ in retriever.search(q, k=max_k)) for q, _ in questions[:50]
+    ])
+
+    print(f"Tables: {len(kb.tables)}  Workspaces: {len(kb.workspaces)}  Questions: {len(questions)}")
+    print(f"Index build: {build_s:.2f} s  Load: {load_ms:.1f} ms  Size: {index_mb:.1f} MB  Terms: {len(retriever.postings)}")
+    for k in args.top_k:
+        print(f"Recall@{k}: {hits[k] / len(questions):.3f}")
+    lat = percentiles(latencies_ms)
+    print(f"Query latency ms: p50 {lat[50]:.3f}  p95 {lat[95]:.3f}  p99 {lat[99]:.3f}")
+    print(f"LLM pruner context: full workspace {workspace_chars:,.0f} chars vs top-{max_k} {topk_chars:,.0f} chars")
+
+
+if __name__ == "__main__":
+    main()
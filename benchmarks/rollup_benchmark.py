@@ -0,0 +1,104 @@
+"""Execution time of common aggregate trip queries on trips vs. their rollup rewrite.
+
+Generates a trips table with create_db.py's generator, refreshes the rollups (full, then
+incrementally after appending 1% more trips), then times every query as generated and
+as rewritten by the query_rewrite step, checking that both return the same rows.
+
+Usage: python -m benchmarks.rollup_benchmark [--trips 20000000] [--runs 5]
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+QUERIES = [
+    "SELECT count(trip_id) AS completed_trips FROM trips WHERE trip_status = 'completed';",
+    "SELECT count(*) FROM trips WHERE trip_status = 'completed' AND trip_date BETWEEN '2024-03-01' AND '2024-03-31';",
+    "SELECT city, avg(fare_usd) AS avg_fare FROM trips WHERE trip_status = 'completed' GROUP BY city ORDER BY avg_fare DESC;",
+    "SELECT city, trip_date, count(*) AS completed_trips FROM trips WHERE trip_status = 'completed' GROUP BY city, trip_date ORDER BY trip_date DESC, city LIMIT 20;",
+    "SELECT t.city, COUNT(*) AS trips, SUM(t.fare_usd) total FROM trips t WHERE t.trip_date >= DATE '2024-06-01' GROUP BY t.city ORDER BY trips DESC LIMIT 5;",
+    "SELECT date_trunc('month', trip_date) AS month, round(avg(fare_usd), 2) AS avg_fare FROM trips GROUP BY 1 ORDER BY 1;",
+    "SELECT driver_id, avg(fare_usd) AS avg_fare, count(*) AS trips FROM trips WHERE trip_status = 'completed' GROUP BY driver_id ORDER BY trips DESC LIMIT 10;",
+    "SELECT count(DISTINCT driver_id) AS active_drivers FROM trips WHERE trip_status = 'completed';",
+    "SELECT trip_status, sum(distance_miles) AS miles, max(fare_usd) AS max_fare FROM trips GROUP BY trip_status;",
+]
+
+
+def same_rows(a: list, b: list) -> bool:
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, float) and isinstance(y, float):
+                if not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9):
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+def time_query(con, sql: str, runs: int):
+    samples, rows = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = con.execute(sql).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples)), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trips", type=int, default=20_000_000)
+    parser.add_argument("--drivers", type=int, default=20_000)
+    parser.add_argument("--cities", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "querygpt-rollup-bench"))
+    args = parser.parse_args()
+
+    # create_db and the agents use paths relative to the working directory
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    import create_db
+    from agents.db import get_connection_manager
+    from agents.knowledge_base import get_knowledge_base
+    from agents.rollups import get_rollup_rewriter, refresh_rollups, register_rollups
+
+    cities, date_range = create_db.generate_large_db(args.trips, args.drivers, args.cities)
+    create_db.create_knowledge_base(cities=cities, date_range=date_range)
+    full = refresh_rollups(full=True)
+    create_db.generate_large_db(max(1, args.trips // 100), args.drivers, args.cities, append=True, seed=1)
+    incremental = refresh_rollups()
+    register_rollups()
+
+    con = get_connection_manager().cursor()
+    rollups = get_knowledge_base().rollups
+    rewriter = get_rollup_rewriter()
+    fresh = rewriter.fresh_rollups(con, rollups)
+
+    print(f"\nRollup refresh ({args.trips:,} trips; incremental after appending 1%):")
+    for f, i in zip(full, incremental):
+        print(f"  {f['name']:>24}: full {f['seconds'] * 1000:8.1f} ms, incremental {i['seconds'] * 1000:8.1f} ms, "
+              f"{i['rollup_rows']:,} rows")
+
+    print(f"\n{'trips (ms)':>11} {'rollup (ms)':>12} {'speedup':>8}  rollup / query")
+    speedups = []
+    for sql in QUERIES:
+        rewritten, rollup = rewriter.rewrite(con, sql, rollups, fresh)
+        before, rows_before = time_query(con, sql, args.runs)
+        if rollup is None:
+            print(f"{before:11.1f} {'-':>12} {'-':>8}  (not rewritten) {sql}")
+            continue
+        after, rows_after = time_query(con, rewritten, args.runs)
+        if not same_rows(rows_before, rows_after):
+            raise SystemExit(f"Result mismatch for rewritten query:\n  {sql}\n  {rewritten}")
+        speedups.append(before / after)
+        print(f"{before:11.1f} {after:12.1f} {before / after:7.1f}x  {rollup} / {sql}")
+    if speedups:
+        print(f"\nGeometric mean speedup: {math.exp(np.mean(np.log(speedups))):.1f}x over {len(speedups)} queries")
+
+
+if __name__ == "__main__":
+    main()
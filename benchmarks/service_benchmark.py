@@ -0,0 +1,156 @@
+"""Load test of the HTTP service (service.py) with the fake LLM and the sample DuckDB data.
+
+Starts `uvicorn service:app` in a separate process (fake LLM installed, caches off), then
+sends --requests questions from --clients concurrent clients to /query. Questions cycle
+through the corpus, so identical questions are in flight together and get deduplicated.
+With --stream, each request reads the SSE stream and time to first event is reported too.
+Reports throughput, latency percentiles, 429s and the service's own counters.
+
+Usage: python -m benchmarks.service_benchmark [--requests 400] [--clients 32] [--latency 0.05]
+    [--workers 8] [--queue-size 64] [--stream]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.pipeline_benchmark import REPO_ROOT, load_questions, percentiles, prepare_data
+
+
+def serve(args):
+    """Runs the service with the fake LLM in this process (cwd is the data directory)."""
+    import uvicorn
+    from agents.llm import set_llm
+    from benchmarks.fake_llm import FakeChatModel
+    fake = FakeChatModel(latency_s=args.latency)
+    set_llm("main", fake)
+    set_llm("pruner", fake)
+    from service import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout_s: float = 60.0):
+    deadline = time.perf_counter() + timeout_s
+    while True:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.perf_counter() > deadline:
+            raise RuntimeError("Service did not start")
+        await asyncio.sleep(0.2)
+
+
+async def one_request(client: httpx.AsyncClient, question: str, stream: bool) -> dict:
+    start = time.perf_counter()
+    first_event_s = None
+    if stream:
+        async with client.stream("POST", "/query", json={"question": question, "stream": True}) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if first_event_s is None and line.startswith("event:"):
+                    first_event_s = time.perf_counter() - start
+    else:
+        response = await client.post("/query", json={"question": question})
+        status = response.status_code
+    return {"status": status, "elapsed_s": time.perf_counter() - start, "first_event_s": first_event_s}
+
+
+async def load(args) -> dict:
+    questions = load_questions(args.requests)
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=300, limits=limits) as client:
+        await wait_until_up(client)
+        # Warm-up: builds the graph, loads the knowledge base and opens DuckDB
+        await client.post("/query", json={"question": questions[0]})
+        queue = asyncio.Queue()
+        for question in questions:
+            queue.put_nowait(question)
+        results = []
+
+        async def client_loop():
+            while not queue.empty():
+                results.append(await one_request(client, queue.get_nowait(), args.stream))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - start
+        service_stats = (await client.get("/health")).json()
+
+    answered = [r for r in results if r["status"] == 200]
+    report = {
+        "requests": len(results),
+        "answered": len(answered),
+        "rejected_429": sum(1 for r in results if r["status"] == 429),
+        "other_errors": sum(1 for r in results if r["status"] not in (200, 429)),
+        "throughput_rps": round(len(answered) / elapsed, 2),
+        "latency_ms": percentiles([r["elapsed_s"] * 1000 for r in answered]),
+        "service": {key: service_stats.get(key, 0) for key in ("submitted", "deduplicated", "rejected", "completed", "failed")},
+    }
+    if args.stream:
+        report["first_event_ms"] = percentiles([r["first_event_s"] * 1000 for r in answered if r["first_event_s"] is not None])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent HTTP clients.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected seconds per LLM call.")
+    parser.add_argument("--workers", type=int, default=8, help="SERVICE_WORKERS of the service.")
+    parser.add_argument("--queue-size", type=int, default=64, help="SERVICE_QUEUE_SIZE of the service.")
+    parser.add_argument("--stream", action="store_true", help="Read answers as server-sent events.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "querygpt-bench"))
+    parser.add_argument("--json", help="Write the report to this file.")
+    # Internal: run the service in this process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    data_dir = prepare_data(args.workdir, 0, 0)
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        # Every question must go through the agents and hit DuckDB
+        "SEMANTIC_CACHE_ENABLED": "0",
+        "RESULT_CACHE_ENABLED": "0",
+        "TRACE_FILE": "",
+        "SERVICE_WORKERS": str(args.workers),
+        "SERVICE_QUEUE_SIZE": str(args.queue_size),
+    }
+    command = [sys.executable, "-m", "benchmarks.service_benchmark", "--serve",
+               "--port", str(args.port), "--latency", str(args.latency)]
+    server = subprocess.Popen(command, cwd=data_dir, env=env, stdout=subprocess.DEVNULL)
+    try:
+        report = asyncio.run(load(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latency = report["latency_ms"]
+    print(f"\n{report['requests']} requests from {args.clients} clients: {report['answered']} answered, "
+          f"{report['rejected_429']} rejected (429), {report['other_errors']} errors")
+    print(f"  throughput {report['throughput_rps']} req/s, latency p50/p95/p99 "
+          f"{latency['p50']}/{latency['p95']}/{latency['p99']} ms")
+    if args.stream:
+        first = report["first_event_ms"]
+        print(f"  first SSE event p50/p95/p99 {first['p50']}/{first['p95']}/{first['p99']} ms")
+    print(f"  service: {report['service']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import random
+
+DOMAINS = [
+    "mobility", "delivery", "freight", "payments", "marketing", "support", "safety", "pricing", "maps", "fleet",
+    "identity", "loyalty", "finance", "hr", "legal", "growth", "risk", "catalog", "partners", "compliance",
+]
+ENTITIES = [
+    "trip", "driver", "rider", "order", "courier", "restaurant", "shipment", "carrier", "invoice", "payout",
+    "campaign", "coupon", "ticket", "agent", "incident", "claim", "quote", "surge", "route", "segment",
+    "vehicle", "inspection", "account", "device", "reward", "tier", "ledger", "budget", "employee", "contract",
+    "merchant", "experiment", "cohort", "alert", "score", "menu", "item", "store", "warehouse", "pallet",
+    "station", "battery", "scooter", "city", "zone", "airport", "event", "review", "refund", "dispute",
+]
+VARIANTS = ["daily", "events", "snapshot", "history", "summary"]
+ATTRIBUTES = [
+    ("amount_usd", "FLOAT"), ("distance_miles", "FLOAT"), ("duration_minutes", "FLOAT"), ("status", "VARCHAR"),
+    ("created_date", "DATE"), ("updated_date", "DATE"), ("city", "VARCHAR"), ("country", "VARCHAR"),
+    ("rating", "FLOAT"), ("fee_usd", "FLOAT"), ("tax_usd", "FLOAT"), ("tip_usd", "FLOAT"), ("currency", "VARCHAR"),
+    ("channel", "VARCHAR"), ("platform", "VARCHAR"), ("language", "VARCHAR"), ("priority", "INT"),
+    ("severity", "INT"), ("weight_kg", "FLOAT"), ("volume_m3", "FLOAT"), ("latitude", "FLOAT"),
+    ("longitude", "FLOAT"), ("zip_code", "VARCHAR"), ("region", "VARCHAR"), ("category", "VARCHAR"),
+    ("subcategory", "VARCHAR"), ("brand", "VARCHAR"), ("model", "VARCHAR"), ("quantity", "INT"),
+    ("discount_usd", "FLOAT"), ("cost_usd", "FLOAT"), ("margin_pct", "FLOAT"), ("conversion_rate", "FLOAT"),
+    ("click_count", "INT"), ("impression_count", "INT"), ("session_count", "INT"), ("error_count", "INT"),
+    ("retry_count", "INT"), ("is_active", "BOOLEAN"), ("is_fraud", "BOOLEAN"), ("segment_name", "VARCHAR"),
+    ("tier_name", "VARCHAR"), ("team_name", "VARCHAR"), ("manager_id", "INT"), ("vendor_id", "INT"),
+    ("license_status", "VARCHAR"), ("vehicle_make", "VARCHAR"), ("hire_date", "DATE"), ("eta_minutes", "FLOAT"),
+    ("pickup_zone", "VARCHAR"), ("dropoff_zone", "VARCHAR"), ("battery_pct", "FLOAT"), ("temperature_c", "FLOAT"),
+]
+
+
+def synthetic_knowledge_base(n_tables: int = 5000, seed: int = 0) -> dict:
+    """Builds a knowledge_base.json-shaped dict with `n_tables` plausible tables spread over workspaces."""
+    rng = random.Random(seed)
+    combos = [(d, e, v) for d in DOMAINS for e in ENTITIES for v in VARIANTS]
+    rng.shuffle(combos)
+    kb = {}
+    for i in range(n_tables):
+        domain, entity, variant = combos[i % len(combos)]
+        table = f"{domain}_{entity}_{variant}" + (f"_{i // len(combos)}" if i >= len(combos) else "")
+        attributes = rng.sample(ATTRIBUTES, rng.randint(6, 14))
+        columns = [(f"{entity}_id", "INT")] + attributes
+        workspace = kb.setdefault(domain.title(), {
+            "description": f"Contains {domain} data and related entities.",
+            "tables": {},
+        })
+        filter_col = attributes[0][0]
+        workspace["tables"][table] = {
+            "schema": ", ".join(f"{name} ({ctype})" for name, ctype in columns),
+            "rules": f"Join on `{entity}_id`. Filter on `{filter_col}` when a time frame or segment is given.",
+            "sample_query": f"SELECT count({entity}_id) FROM {table};",
+        }
+    return kb
+
+
+def synthetic_questions(kb: dict, n_questions: int = 500, seed: int = 1) -> list:
+    """(question, target_table) pairs whose wording is derived from the target table's name and columns."""
+    rng = random.Random(seed)
+    tables = [(t, d) for ws in kb.values() for t, d in ws["tables"].items()]
+    templates = [
+        "What is the total {a} and average {b} of {entity} {variant} in {domain}?",
+        "Show {a} by {b} for the {domain} {entity} {variant} table",
+        "How many {entity} records in {domain} {variant} have {a} above average?",
+        "List the top 10 {entity} by {a} from {domain} {variant}",
+    ]
+    questions = []
+    for _ in range(n_questions):
+        table, details = rng.choice(tables)
+        parts = table.split("_")
+        domain, entity, variant = parts[0], parts[1], parts[2]
+        columns = [c.split(" (")[0] for c in details["schema"].split(", ")[1:]]
+        a, b = rng.sample(columns, 2)
+        question = rng.choice(templates).format(
+            a=a.replace("_", " "), b=b.replace("_", " "), entity=entity, variant=variant, domain=domain,
+        )
+        questions.append((question, table))
+    return questions
@@ -1,10 +1,32 @@
+import argparse
+import datetime
 import duckdb
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import json
 import os
+import shutil
+import time
+import uuid
+from agents.db import DATABASE_FILE, connect_for_writing
+from agents.knowledge_base import KNOWLEDGE_BASE_FILE
+from agents.rollups import refresh_rollups, register_rollups
 
-DATABASE_FILE = "uber_trips.db"
-KNOWLEDGE_BASE_FILE = "knowledge_base.json"
+# Generator mode (python create_db.py --trips N): rows generated and written per chunk
+GENERATOR_CHUNK_SIZE = int(os.getenv("GENERATOR_CHUNK_SIZE", "1000000"))
+CITY_NAMES = [
+    "Seattle", "SF", "NY", "LA", "Chicago", "Austin", "Boston", "Denver", "Miami", "Atlanta",
+    "Phoenix", "Dallas", "Houston", "Portland", "San Diego", "Philadelphia", "Detroit", "Nashville",
+    "Las Vegas", "Minneapolis",
+]
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "Dana", "Eve", "Frank", "Grace", "Hector", "Ivy", "Jamal",
+               "Kira", "Luis", "Mina", "Noah", "Olga", "Priya", "Quinn", "Rosa", "Sam", "Tariq"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Patel", "Kim", "Nguyen", "Johnson", "Lopez", "Brown", "Singh",
+              "Martin", "Davis", "Rossi", "Silva", "Khan", "Wilson", "Moore", "Ali", "Clark", "Young"]
+VEHICLE_MAKES = ["Toyota", "Honda", "Ford", "Tesla", "Nissan", "Hyundai", "Kia", "Chevrolet"]
 
 def create_and_populate_db():
     """Creates a sample DuckDB database mirroring Uber's domain."""
@@ -54,16 +76,30 @@ def create_and_populate_db():
     con.close()
     print("Database created successfully.")
 
-def create_knowledge_base():
-    """Creates a simplified RAG knowledge base (JSON for demo) for the agents."""
+def create_knowledge_base(cities: list = None, date_range: tuple = None):
+    """Creates a simplified RAG knowledge base (JSON for demo) for the agents.
+
+    `cities` (most frequent first) and `date_range` describe generated data; the defaults match the sample data.
+    """
+    city_examples = ", ".join((cities or ["Seattle", "SF", "NY"])[:3])
+    first_date, last_date = date_range or ("2025-10-23", "2025-10-24")
     kb = {
         "Mobility": {
             "description": "Contains data related to rides, vehicles, and real-time trip details.",
             "tables": {
                 "trips": {
                     "schema": "trip_id (INT), driver_id (INT), city (VARCHAR), distance_miles (FLOAT), fare_usd (FLOAT), trip_status (VARCHAR), trip_date (DATE)",
-                    "rules": "The column `trip_status` must be 'completed' to count a successful trip. Always filter by `trip_date` when a time frame is provided.",
-                    "sample_query": "SELECT count(trip_id) FROM trips WHERE trip_date = '2025-10-24' AND trip_status = 'completed';"
+                    "rules": f"The column `trip_status` must be 'completed' to count a successful trip. Always filter by `trip_date` when a time frame is provided. Trips cover {first_date} to {last_date}.",
+                    "sample_query": f"SELECT count(trip_id) FROM trips WHERE trip_date = '{last_date}' AND trip_status = 'completed';",
+                    "columns": [
+                        {"name": "trip_id", "type": "INT", "description": "Unique trip identifier.", "key": "primary"},
+                        {"name": "driver_id", "type": "INT", "description": "Driver who completed the trip.", "key": "join"},
+                        {"name": "city", "type": "VARCHAR", "description": f"City where the trip took place (e.g. {city_examples})."},
+                        {"name": "distance_miles", "type": "FLOAT", "description": "Trip distance in miles."},
+                        {"name": "fare_usd", "type": "FLOAT", "description": "Fare paid by the rider in US dollars."},
+                        {"name": "trip_status", "type": "VARCHAR", "description": "Trip outcome: completed or cancelled."},
+                        {"name": "trip_date", "type": "DATE", "description": "Date of the trip."}
+                    ]
                 }
             }
         },
@@ -73,7 +109,17 @@ def create_knowledge_base():
                 "drivers": {
                     "schema": "driver_id (INT), name (VARCHAR), license_status (VARCHAR), vehicle_make (VARCHAR), hire_date (DATE), annual_bonus_target (INT), current_rating (FLOAT), long_term_retention_score (FLOAT)",
                     "rules": "To check for an active driver, filter on `license_status` = 'active'. The `long_term_retention_score` column is rarely needed.",
-                    "sample_query": "SELECT name, current_rating FROM drivers WHERE license_status = 'active';"
+                    "sample_query": "SELECT name, current_rating FROM drivers WHERE license_status = 'active';",
+                    "columns": [
+                        {"name": "driver_id", "type": "INT", "description": "Unique driver identifier.", "key": "primary"},
+                        {"name": "name", "type": "VARCHAR", "description": "Driver full name."},
+                        {"name": "license_status", "type": "VARCHAR", "description": "Driver license status: active or suspended."},
+                        {"name": "vehicle_make", "type": "VARCHAR", "description": "Make of the driver's vehicle."},
+                        {"name": "hire_date", "type": "DATE", "description": "Date the driver was hired."},
+                        {"name": "annual_bonus_target", "type": "INT", "description": "Yearly bonus target in US dollars (payroll).", "low_value": True},
+                        {"name": "current_rating", "type": "FLOAT", "description": "Current average rider rating of the driver."},
+                        {"name": "long_term_retention_score", "type": "FLOAT", "description": "Model score of long-term driver retention.", "low_value": True}
+                    ]
                 }
             }
         }
@@ -83,6 +129,192 @@ def create_knowledge_base():
         json.dump(kb, f, indent=4)
     print(f"Knowledge Base created: {KNOWLEDGE_BASE_FILE}")
 
+def city_names(n_cities: int) -> list:
+    return CITY_NAMES[:n_cities] + [f"City {i}" for i in range(len(CITY_NAMES) + 1, n_cities + 1)]
+
+
+def zipf_cdf(n: int, exponent: float) -> np.ndarray:
+    """Cumulative Zipf weights: item 0 is the most frequent."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return np.cumsum(weights) / weights.sum()
+
+
+def sample_from_cdf(rng, cdf: np.ndarray, size: int) -> np.ndarray:
+    return np.minimum(np.searchsorted(cdf, rng.random(size)), len(cdf) - 1)
+
+
+def date_cdf(start: datetime.date, days: int) -> np.ndarray:
+    """Per-day trip volume: grows over the range, with busier Fridays and Saturdays."""
+    offsets = np.arange(days)
+    weekday = (np.datetime64(start) + offsets).astype("datetime64[D]").view("int64") % 7  # 0 = Thursday
+    weights = (1.0 + offsets / max(days, 1)) * np.where(np.isin(weekday, (1, 2)), 1.4, 1.0)
+    return np.cumsum(weights) / weights.sum()
+
+
+def generate_drivers_chunk(rng, first_id: int, n: int, hire_start: np.datetime64) -> pa.Table:
+    names = pc.binary_join_element_wise(
+        pc.take(pa.array(FIRST_NAMES), pa.array(rng.integers(0, len(FIRST_NAMES), n))),
+        pc.take(pa.array(LAST_NAMES), pa.array(rng.integers(0, len(LAST_NAMES), n))),
+        " ",
+    )
+    return pa.table({
+        "driver_id": pa.array(np.arange(first_id, first_id + n, dtype=np.int64)),
+        "name": names,
+        "license_status": pc.take(pa.array(["active", "suspended"]), pa.array((rng.random(n) < 0.08).astype(np.int8))),
+        "vehicle_make": pc.take(pa.array(VEHICLE_MAKES), pa.array(rng.integers(0, len(VEHICLE_MAKES), n))),
+        "hire_date": pa.array(hire_start + rng.integers(0, 5 * 365, n).astype("timedelta64[D]")),
+        "annual_bonus_target": pa.array(rng.integers(3, 9, n).astype(np.int64) * 100),
+        "current_rating": pa.array(np.round(np.clip(rng.normal(4.6, 0.25, n), 1.0, 5.0), 2)),
+        "long_term_retention_score": pa.array(np.round(rng.beta(5, 2, n), 2)),
+    })
+
+
+def generate_trips_chunk(rng, first_id: int, n: int, cities: pa.Array, city_cdf, driver_ids, driver_cdf,
+                         start: np.datetime64, day_cdf) -> pa.Table:
+    """One chunk of trips with Zipf-skewed cities and drivers and a trending, weekly-seasonal date mix."""
+    distance = np.round(np.clip(rng.lognormal(1.2, 0.6, n), 0.3, 60.0), 1)
+    surge = 1.0 + rng.exponential(0.15, n)
+    return pa.table({
+        "trip_id": pa.array(np.arange(first_id, first_id + n, dtype=np.int64)),
+        "driver_id": pa.array(driver_ids[sample_from_cdf(rng, driver_cdf, n)]),
+        "city": pc.take(cities, pa.array(sample_from_cdf(rng, city_cdf, n))),
+        "distance_miles": pa.array(distance),
+        "fare_usd": pa.array(np.round((2.5 + 1.75 * distance) * surge, 2)),
+        "trip_status": pc.take(pa.array(["completed", "cancelled"]), pa.array((rng.random(n) < 0.06).astype(np.int8))),
+        "trip_date": pa.array(start + sample_from_cdf(rng, day_cdf, n).astype("timedelta64[D]")),
+    })
+
+
+def trips_kind(con):
+    """'TABLE' or 'VIEW' (Parquet-backed) for the existing trips relation, None when there is none."""
+    row = con.execute(
+        "SELECT 'TABLE' FROM duckdb_tables() WHERE table_name = 'trips' "
+        "UNION ALL SELECT 'VIEW' FROM duckdb_views() WHERE view_name = 'trips'"
+    ).fetchone()
+    return row[0] if row else None
+
+
+def generate_large_db(n_trips: int, n_drivers: int, n_cities: int, start_date: str = "2024-01-01", days: int = 365,
+                      chunk_size: int = GENERATOR_CHUNK_SIZE, parquet_dir: str = None, append: bool = False,
+                      seed: int = 0):
+    """Generates trips/drivers at scale, chunk by chunk, so memory stays bounded for any n_trips.
+
+    Drivers always go into DuckDB. Trips are appended to a DuckDB table through Arrow, or written as
+    Parquet partitioned by trip_month under `parquet_dir` with a `trips` view on top. With `append`
+    the existing drivers are kept and new trips continue the existing trip_id sequence; trips must
+    then be stored the same way as before (Parquet only with `parquet_dir`). Returns the most
+    frequent cities and the trip_date range of the resulting data.
+    """
+    rng = np.random.default_rng(seed)
+    cities = city_names(n_cities)
+    start = np.datetime64(start_date, "D")
+    con = connect_for_writing(DATABASE_FILE)
+    began = time.time()
+
+    if append:
+        kind = trips_kind(con)
+        if kind is None:
+            con.close()
+            raise ValueError(f"--append: {DATABASE_FILE} has no trips to append to; generate it without --append first.")
+        if kind == "VIEW" and not parquet_dir:
+            con.close()
+            raise ValueError("--append: trips is a Parquet view; pass the --parquet-dir it was generated with.")
+        if kind == "TABLE" and parquet_dir:
+            con.close()
+            raise ValueError("--append: trips is a DuckDB table; drop --parquet-dir to append to it.")
+        n_drivers = con.execute("SELECT count(*) FROM drivers").fetchone()[0]
+        first_trip_id = con.execute("SELECT coalesce(max(trip_id), 0) + 1 FROM trips").fetchone()[0]
+        print(f"Appending {n_trips:,} trips to {DATABASE_FILE} (from trip_id {first_trip_id:,}, {n_drivers:,} drivers)...")
+    else:
+        print(f"Generating {n_drivers:,} drivers and {n_trips:,} trips over {n_cities} cities into {DATABASE_FILE}...")
+        existing = trips_kind(con)
+        if existing:
+            con.execute(f"DROP {existing} trips")
+        if parquet_dir and os.path.exists(parquet_dir):
+            print(f"Replacing existing Parquet files in {parquet_dir}...")
+            shutil.rmtree(parquet_dir)
+        con.execute("""
+            CREATE OR REPLACE TABLE drivers (
+                driver_id BIGINT, name VARCHAR, license_status VARCHAR, vehicle_make VARCHAR, hire_date DATE,
+                annual_bonus_target BIGINT, current_rating DOUBLE, long_term_retention_score DOUBLE)
+        """)
+        for first in range(0, n_drivers, chunk_size):
+            chunk = generate_drivers_chunk(rng, 101 + first, min(chunk_size, n_drivers - first), start - 5 * 365)
+            con.execute("INSERT INTO drivers SELECT * FROM chunk")
+        if not parquet_dir:
+            con.execute("""
+                CREATE TABLE trips (
+                    trip_id BIGINT, driver_id BIGINT, city VARCHAR, distance_miles DOUBLE, fare_usd DOUBLE,
+                    trip_status VARCHAR, trip_date DATE)
+            """)
+        first_trip_id = 1
+
+    # A few drivers and cities take most of the trips; the driver order is shuffled so skew is not tied to id
+    driver_ids = 101 + rng.permutation(n_drivers).astype(np.int64)
+    driver_cdf = zipf_cdf(n_drivers, 0.8)
+    city_array, city_cdf = pa.array(cities), zipf_cdf(n_cities, 1.1)
+    day_cdf = date_cdf(start.astype(datetime.date), days)
+    run_token = uuid.uuid4().hex[:8]
+
+    written = 0
+    for first in range(0, n_trips, chunk_size):
+        n = min(chunk_size, n_trips - first)
+        chunk = generate_trips_chunk(rng, first_trip_id + first, n, city_array, city_cdf, driver_ids, driver_cdf, start, day_cdf)
+        if parquet_dir:
+            month = pc.strftime(chunk["trip_date"], format="%Y-%m")
+            pq.write_to_dataset(chunk.append_column("trip_month", month), parquet_dir, partition_cols=["trip_month"],
+                                basename_template=f"part-{run_token}-{first // chunk_size}-{{i}}.parquet")
+        else:
+            con.execute("INSERT INTO trips SELECT * FROM chunk")
+        written += n
+        elapsed = time.time() - began
+        print(f"  {written:,}/{n_trips:,} trips ({written / elapsed:,.0f} rows/s)")
+
+    if parquet_dir:
+        files = os.path.join(os.path.abspath(parquet_dir), "**", "*.parquet")
+        con.execute(f"CREATE OR REPLACE VIEW trips AS SELECT * EXCLUDE (trip_month) "
+                    f"FROM read_parquet('{files}', hive_partitioning = true)")
+    # Described from the data, so after an append the KB covers the trips already there too
+    first_date, last_date = con.execute("SELECT min(trip_date), max(trip_date) FROM trips").fetchone()
+    top_cities = [row[0] for row in con.execute(
+        "SELECT city FROM trips GROUP BY city ORDER BY count(*) DESC, city LIMIT 3").fetchall()]
+    con.close()
+
+    print(f"Database generated in {time.time() - began:.1f}s.")
+    return top_cities, (str(first_date), str(last_date))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Creates the DuckDB database and knowledge base (sample data by default).")
+    parser.add_argument("--trips", type=int, help="Generate this many trips instead of the 10-row sample.")
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--start-date", default="2024-01-01")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--chunk-size", type=int, default=GENERATOR_CHUNK_SIZE)
+    parser.add_argument("--parquet-dir", help="Write trips as Parquet partitioned by month (queried through a view).")
+    parser.add_argument("--append", action="store_true", help="Add trips to the existing database.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.trips is None and (args.append or args.parquet_dir):
+        parser.error("--append and --parquet-dir only apply to generated data; pass --trips as well.")
+
+    if args.trips is None:
+        create_and_populate_db()
+        create_knowledge_base()
+    else:
+        try:
+            cities, date_range = generate_large_db(
+                args.trips, args.drivers, args.cities, start_date=args.start_date, days=args.days,
+                chunk_size=args.chunk_size, parquet_dir=args.parquet_dir, append=args.append, seed=args.seed,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        create_knowledge_base(cities=cities, date_range=date_range)
+    # Pre-aggregated trips tables: rebuilt with the data, only new rows merged in after --append
+    refresh_rollups(full=not args.append)
+    register_rollups()
+
+
 if __name__ == "__main__":
-    create_and_populate_db()
-    create_knowledge_base()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from agents.batch import answer_record, summarize
+from agents.rate_limit import AdaptiveLimiter, current_llm_limiter
+from agents.state import make_initial_state
+from agents.tracing import get_tracer
+from agents.workflow import get_query_graph, warm_up, GRAPH_MODE, WARM_UP_ON_START
+
+# Headless HTTP API: uvicorn service:app --port 8000 (one process; the queue and
+# in-flight deduplication are per process)
+# Graphs running concurrently; LLM calls across them share one AdaptiveLimiter
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))
+SERVICE_LLM_CONCURRENCY = int(os.getenv("SERVICE_LLM_CONCURRENCY", str(SERVICE_WORKERS)))
+# Questions waiting for a worker; beyond this new questions get 429
+SERVICE_QUEUE_SIZE = int(os.getenv("SERVICE_QUEUE_SIZE", "64"))
+# Wall-clock budget of one question once a worker picks it up (0 = none)
+SERVICE_TIMEOUT_SECONDS = float(os.getenv("SERVICE_TIMEOUT_SECONDS", "120"))
+SERVICE_BATCH_MAX_QUESTIONS = int(os.getenv("SERVICE_BATCH_MAX_QUESTIONS", "100"))
+
+SHUTDOWN_ERROR = "Cancelled: the service stopped before answering"
+
+
+class Overloaded(Exception):
+    """The work queue is full; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Work queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def dedup_key(question: str, workspace_name: str = "") -> tuple:
+    """Questions that only differ in whitespace are answered once when they are in flight together."""
+    return " ".join(question.split()), workspace_name
+
+
+class Job:
+    """One question in the queue or being answered, shared by every request that asked it."""
+
+    def __init__(self, question: str, workspace_name: str = ""):
+        self.initial_state = make_initial_state(question, workspace_name)
+        self.key = dedup_key(question, workspace_name)
+        self.result = asyncio.get_running_loop().create_future()
+        # (event, data) pairs for SSE subscribers; late subscribers replay them from the start
+        self.events = []
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: str, data: dict):
+        async with self._changed:
+            self.events.append((event, data))
+            self._changed.notify_all()
+
+    async def finish(self, record: dict):
+        self.result.set_result(record)
+        await self.publish("result", record)
+
+    async def subscribe(self):
+        """Yields every event of the job, ending with 'result'."""
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.events) > seen)
+                new_events = self.events[seen:]
+            seen += len(new_events)
+            for event, data in new_events:
+                yield event, data
+                if event == "result":
+                    return
+
+
+class QueryService:
+    """Bounded work queue and worker pool in front of the async graph.
+
+    A full queue raises Overloaded (429) instead of growing latency without bound, and a
+    question already queued or running is joined instead of answered twice.
+    """
+
+    def __init__(self, workers: int = SERVICE_WORKERS, queue_size: int = SERVICE_QUEUE_SIZE,
+                 llm_concurrency: int = SERVICE_LLM_CONCURRENCY, timeout_s: float = SERVICE_TIMEOUT_SECONDS,
+                 mode: str = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout_s = timeout_s
+        self.mode = mode or GRAPH_MODE
+        self.limiter = AdaptiveLimiter(llm_concurrency)
+        self.stats = Counter()
+        self.graph = None
+        self._queue = None
+        self._tasks = []
+        self._in_flight = {}
+        self._busy = 0
+        # Moving average of answer time, for Retry-After
+        self._avg_s = 1.0
+
+    async def start(self):
+        self.graph = get_query_graph(self.mode, use_async=True)
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"query-worker-{i}") for i in range(self.workers)]
+        print(f"[Service] {self.workers} workers, queue of {self.queue_size}, graph mode {self.mode}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Questions nobody picked up: end them so their waiters do not hang
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._in_flight.pop(job.key, None)
+            await self._abandon(job, SHUTDOWN_ERROR)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_s * (self._queue.qsize() + 1) / self.workers))
+
+    def free_slots(self) -> int:
+        return self.queue_size - self._queue.qsize()
+
+    def submit(self, question: str, workspace_name: str = "") -> Job:
+        """Queues a question, or returns the job already answering it; raises Overloaded when full."""
+        key = dedup_key(question, workspace_name)
+        job = self._in_flight.get(key)
+        if job is not None:
+            self.stats["deduplicated"] += 1
+            return job
+        job = Job(question, workspace_name)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise Overloaded(self.retry_after())
+        self._in_flight[key] = job
+        self.stats["submitted"] += 1
+        return job
+
+    def submit_many(self, questions: list, workspace_name: str = "") -> list:
+        """Queues all questions or none of them (so a batch is never half answered)."""
+        new_keys = {dedup_key(q, workspace_name) for q in questions} - set(self._in_flight)
+        if len(new_keys) > self.free_slots():
+            self.stats["rejected"] += len(questions)
+            raise Overloaded(self.retry_after())
+        return [self.submit(q, workspace_name) for q in questions]
+
+    async def _worker(self):
+        current_llm_limiter.set(self.limiter)
+        while True:
+            job = await self._queue.get()
+            self._busy += 1
+            try:
+                await self._answer(job)
+            except asyncio.CancelledError:
+                # stop() cancelled the worker mid-answer: shielded waiters would otherwise hang forever
+                await self._abandon(job, SHUTDOWN_ERROR)
+                raise
+            except Exception as e:
+                await self._abandon(job, f"{type(e).__name__}: {e}")
+            finally:
+                self._busy -= 1
+                self._in_flight.pop(job.key, None)
+                self._queue.task_done()
+
+    async def _answer(self, job: Job):
+        start = time.perf_counter()
+        last = start
+        node_ms = {}
+        final_state = {}
+
+        async def drive():
+            nonlocal last
+            async for mode, chunk in self.graph.astream(job.initial_state, stream_mode=["updates", "messages"]):
+                if mode == "messages":
+                    message, metadata = chunk
+                    # Only the synthesized answer is streamed; other LLM calls are internal
+                    if metadata.get("langgraph_node") == "final_synth" and message.content:
+                        await job.publish("token", {"text": message.content})
+                    continue
+                for node_name, update in chunk.items():
+                    now = time.perf_counter()
+                    node_ms[node_name] = round((now - last) * 1000, 1)
+                    last = now
+                    update = update or {}
+                    final_state.update(update)
+                    event = {"node": node_name, "ms": node_ms[node_name]}
+                    if update.get("sql_query"):
+                        event["sql_query"] = update["sql_query"]
+                    await job.publish("node", event)
+
+        error = None
+        try:
+            if self.timeout_s:
+                await asyncio.wait_for(drive(), self.timeout_s)
+            else:
+                await drive()
+        except asyncio.TimeoutError:
+            error = f"Timeout: no answer after {self.timeout_s:g}s"
+            self.stats["timed_out"] += 1
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error:
+            self.stats["failed"] += 1
+            print(f"[Service] Question failed: {error}")
+        else:
+            self.stats["completed"] += 1
+        record = answer_record(job.initial_state, final_state, error, start, node_ms)
+        self._avg_s = 0.9 * self._avg_s + 0.1 * record["elapsed_s"]
+        await job.finish(record)
+
+    async def _abandon(self, job: Job, error: str):
+        """Ends a job that was not answered with an error record."""
+        if job.result.done():
+            return
+        self.stats["failed"] += 1
+        print(f"[Service] Question not answered: {error}")
+        await job.finish(answer_record(job.initial_state, {}, error, time.perf_counter(), {}))
+
+    def health(self) -> dict:
+        return {
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "in_flight": len(self._in_flight),
+            "avg_answer_s": round(self._avg_s, 3),
+            "llm_limit": self.limiter.limit,
+            **self.stats,
+        }
+
+    def prometheus_text(self) -> str:
+        """Queue and request metrics in the Prometheus text exposition format."""
+        health = self.health()
+        lines = [
+            "# HELP querygpt_service_requests_total Questions by outcome.",
+            "# TYPE querygpt_service_requests_total counter",
+        ]
+        for outcome in ("submitted", "deduplicated", "rejected", "completed", "failed", "timed_out"):
+            lines.append(f'querygpt_service_requests_total{{outcome="{outcome}"}} {self.stats[outcome]}')
+        for name, key, help_text in (
+            ("querygpt_service_queue_depth", "queue_depth", "Questions waiting for a worker."),
+            ("querygpt_service_busy_workers", "busy_workers", "Workers answering a question."),
+            ("querygpt_service_llm_limit", "llm_limit", "LLM calls currently allowed in flight."),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {health[key]}"]
+        return "\n".join(lines) + "\n"
+
+
+service = QueryService()
+
+
+def _error(message: str, status: int, headers: dict = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+def _overloaded(e: Overloaded) -> JSONResponse:
+    return _error(str(e), 429, {"Retry-After": str(e.retry_after)})
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def _status(record: dict) -> int:
+    error = record["error"] or ""
+    return 504 if error.startswith("Timeout") else 503 if error == SHUTDOWN_ERROR else 200
+
+
+def _sse(job: Job) -> StreamingResponse:
+    async def events():
+        async for event, data in job.subscribe():
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def query(request):
+    """POST {"question": ..., "workspace_name": optional, "stream": optional}.
+
+    A workspace_name known to the knowledge base skips the router's LLM call.
+    Returns the answer as JSON, or with "stream": true (or Accept: text/event-stream) as
+    server-sent events: 'node' per finished step, 'token' per answer token and 'result'.
+    """
+    body = await _json_body(request)
+    question = (body or {}).get("question")
+    if not isinstance(question, str) or not question.strip():
+        return _error('Expected a JSON body with a non-empty "question".', 400)
+    workspace_name = body.get("workspace_name") or ""
+    if not isinstance(workspace_name, str):
+        return _error('"workspace_name" must be a string.', 400)
+    try:
+        job = service.submit(question, workspace_name)
+    except Overloaded as e:
+        return _overloaded(e)
+    if body.get("stream") or "text/event-stream" in request.headers.get("accept", ""):
+        return _sse(job)
+    # Shielded: a client hanging up must not cancel the answer other requests share
+    record = await asyncio.shield(job.result)
+    return JSONResponse(record, status_code=_status(record))
+
+
+async def batch(request):
+    """POST {"questions": [...], "workspace_name": optional}; answers come back in input order with a latency summary."""
+    body = await _json_body(request)
+    questions = (body or {}).get("questions")
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return _error('Expected a JSON body with a non-empty list of "questions".', 400)
+    if len(questions) > SERVICE_BATCH_MAX_QUESTIONS:
+        return _error(f"At most {SERVICE_BATCH_MAX_QUESTIONS} questions per batch.", 413)
+    workspace_name = body.get("workspace_name") or ""
+    if not isinstance(workspace_name, str):
+        return _error('"workspace_name" must be a string.', 400)
+    try:
+        jobs = service.submit_many(questions, workspace_name)
+    except Overloaded as e:
+        return _overloaded(e)
+    results = await asyncio.shield(asyncio.gather(*(job.result for job in jobs)))
+    results = [{"index": i, **record} for i, record in enumerate(results)]
+    return JSONResponse({"results": results, "summary": summarize(results)})
+
+
+async def health(request):
+    return JSONResponse(service.health())
+
+
+async def metrics(request):
+    return PlainTextResponse(get_tracer().prometheus_text() + service.prometheus_text(),
+                             media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if WARM_UP_ON_START:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    await service.start()
+    yield
+    await service.stop()
+
+
+app = Starlette(
+    routes=[
+        Route("/query", query, methods=["POST"]),
+        Route("/batch", batch, methods=["POST"]),
+        Route("/health", health),
+        Route("/metrics", metrics),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import duckdb
+import pytest
+
+from agents.db import ConnectionManager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_writer(database, wait_s):
+    """Appends a row from another process, the way create_db.py --append and python -m agents.rollups do."""
+    code = ("import sys; from agents.db import connect_for_writing; "
+            "con = connect_for_writing(sys.argv[1], wait_s=float(sys.argv[2])); "
+            "con.execute('INSERT INTO trips VALUES (2)'); con.close()")
+    return subprocess.run([sys.executable, "-c", code, database, str(wait_s)], cwd=REPO_ROOT,
+                          capture_output=True, text=True, timeout=60)
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "trips.db")
+    con = duckdb.connect(path)
+    con.execute("CREATE TABLE trips AS SELECT 1 AS trip_id")
+    con.close()
+    return path
+
+
+def test_writer_is_locked_out_while_a_session_is_open(database):
+    manager = ConnectionManager(database, idle_release=0.2)
+    with manager.session() as cur:
+        cur.execute("SELECT count(*) FROM trips").fetchone()
+        writer = run_writer(database, wait_s=0)
+    assert writer.returncode != 0
+    assert "lock" in writer.stderr.lower()
+    manager.reset()
+
+
+def test_idle_connection_is_released_for_writers(database):
+    manager = ConnectionManager(database, idle_release=0.2)
+    with manager.session() as cur:
+        assert cur.execute("SELECT count(*) FROM trips").fetchone() == (1,)
+    # The writer waits until the idle connection lets go of the file lock
+    writer = run_writer(database, wait_s=30)
+    assert writer.returncode == 0, writer.stderr
+    with manager.session() as cur:
+        assert cur.execute("SELECT count(*) FROM trips").fetchone() == (2,)
+    manager.reset()
+
+
+def test_connection_stays_open_without_idle_release(database):
+    manager = ConnectionManager(database, idle_release=0)
+    with manager.session() as cur:
+        cur.execute("SELECT 1").fetchone()
+    assert run_writer(database, wait_s=1).returncode != 0
+    manager.reset()
@@ -0,0 +1,69 @@
+import duckdb
+import pytest
+
+from agents.query_guard import QueryGuard, QueryRejected, QueryWatchdog, QUERY_AUTO_LIMIT, explain_plan, _operators
+from agents.results import RESULT_MAX_ROWS
+
+
+@pytest.fixture(scope="module")
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE trips AS SELECT range AS trip_id, range % 1000 AS driver_id FROM range(2000000)")
+    con.execute("CREATE TABLE drivers AS SELECT range AS driver_id, 'driver ' || range AS name FROM range(1000)")
+    yield con
+    con.close()
+
+
+def operator_names(con, sql):
+    return {op["name"] for root in explain_plan(con, sql) for op in _operators(root)}
+
+
+@pytest.mark.parametrize("condition, operator", [
+    ("t.driver_id < d.driver_id", "PIECEWISE_MERGE_JOIN"),
+    ("t.driver_id <> d.driver_id", "NESTED_LOOP_JOIN"),
+    ("t.driver_id < d.driver_id AND t.trip_id > d.driver_id", "IE_JOIN"),
+])
+def test_inequality_joins_are_rejected(con, condition, operator):
+    sql = f"SELECT t.trip_id, d.name FROM trips t JOIN drivers d ON {condition}"
+    assert operator in operator_names(con, sql)
+    decision = QueryGuard().check(con, sql, "List trips and drivers", None)
+    assert decision["action"] == "reject"
+    assert "inequality join" in decision["reason"]
+    assert f"~{2000000 * 1000:,} rows" in decision["reason"]
+
+
+def test_equi_join_is_allowed(con):
+    sql = "SELECT d.name, count(*) FROM trips t JOIN drivers d ON t.driver_id = d.driver_id GROUP BY d.name"
+    assert QueryGuard().check(con, sql, "Trips per driver", None)["action"] == "allow"
+
+
+def test_large_results_get_the_auto_limit(con):
+    assert QUERY_AUTO_LIMIT == RESULT_MAX_ROWS
+    decision = QueryGuard().check(con, "SELECT * FROM trips", "List all trips", None)
+    assert decision["action"] == "limit"
+    assert decision["sql"].endswith(f"LIMIT {QUERY_AUTO_LIMIT};")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.interrupted = False
+
+    def interrupt(self):
+        self.interrupted = True
+
+
+@pytest.mark.parametrize("error", [duckdb.InterruptException("INTERRUPT Error: Interrupted!"),
+                                   OSError("INTERRUPT Error: Interrupted!")])
+def test_watchdog_reports_a_timeout_whatever_the_interrupt_raises(error):
+    fake = FakeConnection()
+    with pytest.raises(QueryRejected):
+        with QueryWatchdog(fake, timeout=0.01) as watchdog:
+            watchdog._timer.join()
+            raise error
+    assert fake.interrupted
+
+
+def test_watchdog_leaves_other_errors_alone():
+    with pytest.raises(OSError):
+        with QueryWatchdog(FakeConnection(), timeout=30):
+            raise OSError("disk full")
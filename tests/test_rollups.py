@@ -0,0 +1,54 @@
+import duckdb
+import pytest
+
+from agents.rollups import ROLLUP_DEFINITIONS, RollupRewriter, refresh_rollups
+
+ROLLUPS = {name: {k: d[k] for k in ("source", "key", "dimensions", "measures", "counts")}
+           for name, d in ROLLUP_DEFINITIONS.items()}
+
+
+@pytest.fixture(scope="module")
+def con(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("rollups") / "trips.db")
+    writer = duckdb.connect(path)
+    writer.execute("""
+        CREATE TABLE trips AS SELECT
+            range + 1 AS trip_id,
+            range % 7 AS driver_id,
+            ['Seattle', 'SF', 'NY'][range % 3 + 1] AS city,
+            (range % 13) * 1.5 AS distance_miles,
+            (range % 11) * 2.25 AS fare_usd,
+            CASE WHEN range % 5 = 0 THEN 'cancelled' ELSE 'completed' END AS trip_status,
+            DATE '2025-01-01' + (range % 30)::INTEGER AS trip_date
+        FROM range(500)""")
+    writer.close()
+    refresh_rollups(path, full=True)
+    con = duckdb.connect(path, read_only=True)
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT count(*) FROM trips",
+    "SELECT city, sum(fare_usd) / count(*) FROM trips GROUP BY city",
+    "SELECT avg(fare_usd)::DECIMAL(10, 2), trip_status FROM trips GROUP BY trip_status",
+    "SELECT CAST(sum(distance_miles) AS INTEGER) FROM trips WHERE city = 'Seattle'",
+    "SELECT t.city, max(t.fare_usd) AS top_fare, min(t.trip_date) FROM trips t GROUP BY t.city",
+    "SELECT round(avg(fare_usd), 2), count(DISTINCT city) FROM trips WHERE trip_date >= DATE '2025-01-15'",
+    "SELECT driver_id, count(trip_id) FROM trips GROUP BY driver_id ORDER BY count(trip_id) DESC LIMIT 3",
+])
+def test_rollup_rewrite_keeps_result_columns(con, sql):
+    rewriter = RollupRewriter()
+    rewritten, rollup = rewriter.rewrite(con, sql, ROLLUPS, rewriter.fresh_rollups(con, ROLLUPS))
+    assert rollup is not None
+    original = con.execute(sql)
+    expected_description, expected_rows = original.description, original.fetchall()
+    result = con.execute(rewritten)
+    assert [d[:2] for d in result.description] == [d[:2] for d in expected_description]
+    assert sorted(map(str, result.fetchall())) == sorted(map(str, expected_rows))
+
+
+def test_rewrite_is_skipped_when_the_query_does_not_bind(con):
+    rewriter = RollupRewriter()
+    sql = "SELECT sum(fare_usd) FROM trips WHERE no_such_column = 1"
+    assert rewriter.rewrite(con, sql, ROLLUPS, rewriter.fresh_rollups(con, ROLLUPS)) == (sql, None)
@@ -0,0 +1,44 @@
+import pytest
+
+from agents.semantic_cache import SemanticCache, literal_tokens, normalize_question
+
+SCOPE = "*"
+KB_VERSION = "v1"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(path=str(tmp_path / "semantic_cache.json"))
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("How many trips at 10 miles?", "How many trips over 10 miles?"),
+    ("Count trips from Seattle to Boston", "Count trips to Seattle from Boston"),
+    ("Show trips by city", "Show trips in city"),
+])
+def test_operator_words_are_not_collapsed(cache, cached, asked):
+    cache.store(cached, SCOPE, KB_VERSION, "SELECT 1", "Trips")
+    entry, status = cache.lookup(asked, SCOPE, KB_VERSION)
+    assert (entry, status) == (None, "miss")
+
+
+def test_exact_hit_ignores_only_case_and_whitespace(cache):
+    cache.store("How many trips over 10 miles?", SCOPE, KB_VERSION, "SELECT 1", "Trips")
+    entry, status = cache.lookup("  how many TRIPS   over 10 miles?", SCOPE, KB_VERSION)
+    assert status == "exact"
+    assert entry["sql_query"] == "SELECT 1"
+
+
+def test_rephrasing_is_a_near_hit(cache):
+    cache.store("How many trips over 10 miles?", SCOPE, KB_VERSION, "SELECT 1", "Trips")
+    entry, status = cache.lookup("Show me how many trips over 10 miles", SCOPE, KB_VERSION)
+    assert status == "near"
+    assert entry["sql_query"] == "SELECT 1"
+
+
+def test_normalize_question_keeps_operator_words():
+    assert normalize_question("Trips  FROM Seattle to Boston") == "trips from seattle to boston"
+
+
+def test_literal_tokens_keep_direction():
+    assert literal_tokens("trips from Seattle to Boston") != literal_tokens("trips to Seattle from Boston")
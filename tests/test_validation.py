@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agents.validation import SchemaValidator
+
+KB = SimpleNamespace(version="v1", tables={
+    "trips": {"columns": [{"name": "trip_id", "type": "BIGINT"}, {"name": "city", "type": "VARCHAR"}]},
+    "drivers": {"columns": [{"name": "driver_id", "type": "BIGINT"}, {"name": "name", "type": "VARCHAR"}]},
+})
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return SchemaValidator()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT name FROM drivers",
+    "SELECT city, count(*) FROM trips GROUP BY city;",
+    "  WITH t AS (SELECT * FROM trips) SELECT count(*) FROM t  ",
+])
+def test_single_select_is_valid(validator, sql):
+    assert validator.validate(sql, KB) == ""
+
+
+@pytest.mark.parametrize("sql, message", [
+    ("SELECT name FROM drivers; DROP TABLE trips;", "expected a single SELECT query, found 2 statements"),
+    ("SELECT 1; SELECT 2", "expected a single SELECT query"),
+    ("PRAGMA show_tables", "expected a query starting with SELECT or WITH"),
+    ("DROP TABLE trips", "expected a query starting with SELECT or WITH"),
+    ("INSERT INTO drivers VALUES (1, 'a')", "expected a query starting with SELECT or WITH"),
+    ("", "no SQL statement found"),
+    ("SELEC 1", "Parser Error"),
+    ("SELECT fare FROM trips", "Binder Error"),
+])
+def test_invalid_sql_is_reported(validator, sql, message):
+    assert message in validator.validate(sql, KB)
+
+
+def test_nothing_is_executed(validator):
+    validator.validate("SELECT name FROM drivers; DROP TABLE trips;", KB)
+    assert validator.validate("SELECT count(*) FROM trips", KB) == ""